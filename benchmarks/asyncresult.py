@@ -0,0 +1,84 @@
+"""Benchmark waitForAsyncResult() and flatten() on large argument lists.
+
+Reports the number of tasks created and the time taken to wait on a
+large flat list of AsyncResults, as produced by calling
+compiler.objects() on thousands of sources.
+
+Usage: python benchmarks/asyncresult.py [count]
+"""
+
+import sys
+import os.path
+import time
+import threading
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+srcDir = os.path.join(os.path.dirname(rootDir), "src")
+sys.path = [srcDir] + sys.path
+
+import cake.async
+import cake.task
+
+from cake.async import DeferredResult, waitForAsyncResult, flatten
+
+class CountingTask(cake.task.Task):
+  created = 0
+
+  def __init__(self, func=None):
+    CountingTask.created += 1
+    cake.task.Task.__init__(self, func)
+
+def runBenchmark(name, count, makeArgs, func):
+  # Count the tasks created by cake.async itself.
+  cake.async.Task = CountingTask
+  try:
+    results = []
+    for i in xrange(count):
+      t = cake.task.Task(lambda i=i: i)
+      results.append(DeferredResult(t))
+    args = makeArgs(results)
+
+    finished = threading.Event()
+    CountingTask.created = 0
+    start = time.time()
+
+    def run():
+      finished.result = func(args)
+
+    task = CountingTask(run)
+    task.addCallback(finished.set)
+    task.start()
+    for r in results:
+      r.task.start()
+    finished.wait()
+    elapsed = time.time() - start
+  finally:
+    cake.async.Task = cake.task.Task
+
+  print "%-30s %8i tasks %8.3fs" % (name, CountingTask.created, elapsed)
+
+@waitForAsyncResult
+def _consume(sources):
+  return len(sources)
+
+def main():
+  if len(sys.argv) > 1:
+    count = int(sys.argv[1])
+  else:
+    count = 5000
+
+  print "%i AsyncResults" % count
+  runBenchmark("waitForAsyncResult(flat)", count, lambda r: r, _consume)
+  runBenchmark("waitForAsyncResult(nested)", count,
+               lambda r: [r[i:i+10] for i in xrange(0, len(r), 10)], _consume)
+  runBenchmark("flatten(nested)", count,
+               lambda r: [r[i:i+10] for i in xrange(0, len(r), 10)], flatten)
+
+  nested = [[["x"] * 10 for _ in xrange(10)] for _ in xrange(count // 100)]
+  start = time.time()
+  for _ in xrange(100):
+    flatten(nested)
+  print "%-30s %8s       %8.3fs" % ("flatten(100x plain nested)", "", time.time() - start)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+"""Benchmark storing and restoring objects with each object cache codec.
+
+Stores a number of generated object files in a temporary cache with each
+codec, then restores them all, as a build where every object is a cache
+hit would. Reports the time taken and the size of the cache. Codecs that
+can't be used here, eg. 'lzma' without an lzma module, are skipped.
+
+Usage: python benchmarks/cachecodecs.py [objectCount] [objectSizeKB]
+"""
+
+import sys
+import os.path
+import shutil
+import tempfile
+import time
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(rootDir), "src"))
+
+import cake.cachecodec
+import cake.filesys
+import cake.hash
+import cake.objectcache
+
+def createObject(path, index, size):
+  # Roughly as compressible as real object files.
+  blocks = []
+  total = 0
+  i = 0
+  while total < size:
+    block = cake.hash.sha1("%i.%i" % (index, i)).digest() * 2 + "\0" * 40
+    blocks.append(block)
+    total += len(block)
+    i += 1
+  cake.filesys.writeFile(path, "".join(blocks)[:size])
+
+def getTreeSize(path):
+  total = 0
+  for dirPath, _, fileNames in os.walk(path):
+    for name in fileNames:
+      total += os.path.getsize(os.path.join(dirPath, name))
+  return total
+
+def run(name, tmpDir, sources):
+  try:
+    codec = cake.cachecodec.getCodec(name)
+  except ValueError, e:
+    print "%-8s skipped: %s" % (name, e)
+    return
+
+  cachePath = os.path.join(tmpDir, "cache")
+  targetDir = os.path.join(tmpDir, "targets")
+  objectPaths = [
+    cake.objectcache.getCachePath(cachePath, cake.hash.sha1(s).digest()) + codec.suffix
+    for s in sources
+    ]
+
+  start = time.time()
+  for source, objectPath in zip(sources, objectPaths):
+    cake.objectcache.storeObject(source, objectPath, codec)
+  stored = time.time() - start
+
+  start = time.time()
+  for source, objectPath in zip(sources, objectPaths):
+    targetPath = os.path.join(targetDir, os.path.basename(source))
+    cake.objectcache.restoreObject(objectPath, targetPath, codec)
+  restored = time.time() - start
+
+  print "%-8s store %6.2fs  restore %6.2fs  cache %6iKB" % (
+    name, stored, restored, getTreeSize(cachePath) / 1024,
+    )
+
+  for path in (cachePath, targetDir):
+    for dirPath, _, fileNames in os.walk(path):
+      for fileName in fileNames:
+        os.chmod(os.path.join(dirPath, fileName), 0644)
+    shutil.rmtree(path)
+
+def main():
+  if len(sys.argv) > 1:
+    count = int(sys.argv[1])
+  else:
+    count = 2000
+  if len(sys.argv) > 2:
+    size = int(sys.argv[2]) * 1024
+  else:
+    size = 256 * 1024
+
+  print "%i objects of %iKB" % (count, size / 1024)
+
+  tmpDir = tempfile.mkdtemp()
+  try:
+    sources = []
+    for i in xrange(count):
+      source = os.path.join(tmpDir, "objects", "f%06i.o" % i)
+      createObject(source, i, size)
+      sources.append(source)
+
+    for name in ("zlib", "zlib-6", "lzma", "none", "link"):
+      run(name, tmpDir, sources)
+  finally:
+    shutil.rmtree(tmpDir)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,62 @@
+"""Benchmark creating the object targets for a large list of sources.
+
+Times how long Compiler.objects() takes to create the targets for a
+list of sources compared with calling Compiler.object() for each source,
+using the dummy compiler and a few shared prerequisites. Nothing is
+built.
+
+Usage: python benchmarks/objects.py [sourceCount] [prerequisiteCount]
+"""
+
+import sys
+import os.path
+import time
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(rootDir), "src"))
+
+import cake.engine
+import cake.logging
+import cake.task
+
+from cake.script import Script
+from cake.target import FileTarget
+from cake.library.compilers.dummy import DummyCompiler
+
+def createCompiler():
+  engine = cake.engine.Engine(cake.logging.Logger(), None, [])
+  configuration = cake.engine.Configuration("config.cake", engine)
+  script = Script("build.cake", configuration, None, engine, cake.task.Task())
+  Script._current.value = script
+  return DummyCompiler(configuration)
+
+def main():
+  if len(sys.argv) > 1:
+    count = int(sys.argv[1])
+  else:
+    count = 20000
+  if len(sys.argv) > 2:
+    prerequisiteCount = int(sys.argv[2])
+  else:
+    prerequisiteCount = 10
+
+  sources = ["src/f%06i.cpp" % i for i in xrange(count)]
+  prerequisites = [
+    FileTarget("gen/h%i.h" % i, cake.task.Task()) for i in xrange(prerequisiteCount)
+    ]
+
+  print "%i sources, %i prerequisites" % (count, prerequisiteCount)
+
+  compiler = createCompiler()
+  start = time.time()
+  for source in sources:
+    compiler.object("obj/" + source[4:-4], source, prerequisites=prerequisites)
+  print "object() per source  %.2fs" % (time.time() - start)
+
+  compiler = createCompiler()
+  start = time.time()
+  compiler.objects("obj", sources, prerequisites=prerequisites)
+  print "objects()            %.2fs" % (time.time() - start)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,106 @@
+"""Benchmark executing a large tree of build scripts.
+
+Generates a tree of build scripts that each list their directory, stat
+their files and copy a file, then times an incremental (no-op) build of
+the tree with different numbers of script threads.
+
+Usage: python benchmarks/scripts.py [scriptCount] [threadCounts]
+eg. python benchmarks/scripts.py 2000 1,2,4
+"""
+
+import sys
+import os
+import os.path
+import shutil
+import subprocess
+import tempfile
+import time
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+runPath = os.path.join(os.path.dirname(rootDir), "src", "run.py")
+
+_configScript = """\
+from cake.engine import Variant
+from cake.script import Script
+from cake.library.script import ScriptTool
+from cake.library.filesys import FileSystemTool
+
+configuration = Script.getCurrent().configuration
+variant = Variant()
+variant.tools["script"] = ScriptTool(configuration=configuration)
+variant.tools["filesys"] = FileSystemTool(configuration=configuration)
+configuration.addVariant(variant)
+"""
+
+_leafScript = """\
+import os
+from cake.tools import script, filesys
+
+engine = script.configuration.engine
+for f in filesys.findFiles(script.cwd(), recursive=False):
+  engine.getTimestamp(script.configuration.abspath(script.cwd(f)))
+script.addDefaultTarget(filesys.copyFile(script.cwd("a.txt"), script.cwd("out/a.txt")))
+"""
+
+def generateTree(path, count):
+  f = open(os.path.join(path, "config.cake"), "w")
+  f.write(_configScript)
+  f.close()
+
+  names = []
+  for i in xrange(count):
+    name = "s%04i" % i
+    names.append(name + "/build.cake")
+    d = os.path.join(path, name)
+    os.makedirs(d)
+    f = open(os.path.join(d, "build.cake"), "w")
+    f.write(_leafScript)
+    f.close()
+    for n in ("a.txt", "b.txt", "c.txt", "d.txt"):
+      f = open(os.path.join(d, n), "w")
+      f.write(n)
+      f.close()
+
+  f = open(os.path.join(path, "build.cake"), "w")
+  f.write("from cake.tools import script\n")
+  f.write("script.execute(%r)\n" % names)
+  f.close()
+
+def runCake(path, args):
+  start = time.time()
+  p = subprocess.Popen(
+    [sys.executable, runPath, "-s", "--jobs=4"] + args,
+    cwd=path,
+    stdout=subprocess.PIPE,
+    stderr=subprocess.STDOUT,
+    )
+  output = p.communicate()[0]
+  if p.returncode != 0:
+    sys.stderr.write(output[-3000:])
+    raise RuntimeError("cake failed")
+  return time.time() - start
+
+def main():
+  if len(sys.argv) > 1:
+    count = int(sys.argv[1])
+  else:
+    count = 2000
+  if len(sys.argv) > 2:
+    threadCounts = [int(n) for n in sys.argv[2].split(",")]
+  else:
+    threadCounts = [1, 2, 4]
+
+  path = tempfile.mkdtemp()
+  try:
+    generateTree(path, count)
+    print "%i scripts, initial build: %.2fs" % (count, runCake(path, []))
+    for threads in threadCounts:
+      elapsed = min(
+        runCake(path, ["--script-threads=%i" % threads]) for _ in xrange(3)
+        )
+      print "--script-threads=%-3i %.2fs" % (threads, elapsed)
+  finally:
+    shutil.rmtree(path)
+
+if __name__ == "__main__":
+  main()
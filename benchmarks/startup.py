@@ -0,0 +1,90 @@
+"""Benchmark how long cake takes to start.
+
+Times 'cake --version', the import of cake.runner and a no-op build of a
+small project using the default config script. The no-op build reports
+the breakdown given by '--debug=startup'.
+
+Usage: python benchmarks/startup.py [repeatCount]
+"""
+
+import sys
+import os
+import os.path
+import shutil
+import subprocess
+import tempfile
+import time
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+srcDir = os.path.join(os.path.dirname(rootDir), "src")
+runPath = os.path.join(srcDir, "run.py")
+
+_buildScript = """\
+from cake.tools import script, filesys
+script.addDefaultTarget(filesys.copyFile(script.cwd("a.txt"), script.cwd("out/a.txt")))
+"""
+
+def timeProcess(args, cwd=None):
+  env = dict(os.environ)
+  env["PYTHONPATH"] = srcDir
+  start = time.time()
+  p = subprocess.Popen(
+    args,
+    cwd=cwd,
+    env=env,
+    stdout=subprocess.PIPE,
+    stderr=subprocess.STDOUT,
+    )
+  output = p.communicate()[0]
+  return time.time() - start, output
+
+def timeImport(repeat):
+  code = (
+    "import time; t = time.time(); import cake.runner; "
+    "print time.time() - t"
+    )
+  times = []
+  for _ in xrange(repeat):
+    elapsed, output = timeProcess([sys.executable, "-c", code])
+    times.append(float(output.strip().splitlines()[-1]))
+  return min(times)
+
+def main():
+  if len(sys.argv) > 1:
+    repeat = int(sys.argv[1])
+  else:
+    repeat = 10
+
+  python = min(
+    timeProcess([sys.executable, "-c", "pass"])[0] for _ in xrange(repeat)
+    )
+  print "python startup        %.3fs" % python
+  print "import cake.runner    %.3fs" % timeImport(repeat)
+
+  version = min(
+    timeProcess([sys.executable, runPath, "--version"])[0] for _ in xrange(repeat)
+    )
+  print "cake --version        %.3fs" % version
+
+  path = tempfile.mkdtemp()
+  try:
+    f = open(os.path.join(path, "build.cake"), "w")
+    f.write(_buildScript)
+    f.close()
+    f = open(os.path.join(path, "a.txt"), "w")
+    f.write("a")
+    f.close()
+
+    args = [sys.executable, runPath, "--debug=startup", "compiler=dummy"]
+    timeProcess(args, cwd=path)
+    results = [timeProcess(args, cwd=path) for _ in xrange(repeat)]
+    elapsed, output = min(results)
+    print "no-op build           %.3fs" % elapsed
+    for line in output.splitlines():
+      if line.startswith("startup:"):
+        print "  " + line
+  finally:
+    shutil.rmtree(path)
+
+if __name__ == "__main__":
+  main()
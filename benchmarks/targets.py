@@ -0,0 +1,68 @@
+"""Benchmark registering the targets of a large number of objects.
+
+Adds object targets to a script the way Compiler.object() does, both by
+looking up a ScriptTarget for each name and by registering the names
+with Script.registerTarget(), then looks up one named target. Each mode
+runs in its own process so their peak memory use can be compared.
+
+Usage: python benchmarks/targets.py [objectCount]
+"""
+
+import sys
+import os.path
+import resource
+import subprocess
+import time
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(rootDir), "src"))
+
+def run(mode, count):
+  import cake.engine
+  import cake.logging
+  import cake.task
+  from cake.script import Script
+  from cake.target import FileTarget
+
+  engine = cake.engine.Engine(cake.logging.Logger(), None, [])
+  script = Script("build.cake", None, None, engine, cake.task.Task())
+  defaultTarget = script.getDefaultTarget()
+
+  start = time.time()
+  for i in xrange(count):
+    target = FileTarget("obj/f%06i.o" % i, cake.task.Task())
+    defaultTarget.addTarget(target)
+    names = ("objects", "f%06i.o" % i, "f%06i.cpp" % i)
+    if mode == "lookup":
+      for name in names:
+        script.getTarget(name).addTarget(target)
+    else:
+      script.registerTarget(target, names)
+  elapsed = time.time() - start
+
+  start = time.time()
+  script.getTarget("f%06i.o" % (count / 2))
+  lookup = time.time() - start
+
+  maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  print "%-9s add %.2fs  lookup %.3fs  peak %iMB" % (
+    mode, elapsed, lookup, maxRss / 1024,
+    )
+
+def main():
+  if len(sys.argv) > 2:
+    run(sys.argv[1], int(sys.argv[2]))
+    return
+
+  if len(sys.argv) > 1:
+    count = sys.argv[1]
+  else:
+    count = "100000"
+
+  print "%s objects" % count
+  for mode in ("lookup", "register"):
+    sys.stdout.flush()
+    subprocess.check_call([sys.executable, __file__, mode, count])
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,678 @@
+"""Action Cache.
+
+Build actions whose outputs depend only on their arguments and the
+contents of their inputs can restore their outputs from a cache instead
+of running. Compilers cache objects, precompiled headers, libraries,
+modules and programs in their object cache, see
+L{cake.library.compilers.Compiler.objectCachePath}. The shell and script
+tools can cache the targets of the commands and functions they run.
+
+Actions are cached with the manifests and object files of
+L{cake.objectcache}, looked up by the path of the action's first target.
+An action's other targets, eg. import libraries, map files and
+manifests, are cached alongside it. So is any output the action wrote,
+such as compiler warnings, which is output again when the action is
+restored from the cache, and the permissions of executable targets.
+
+Actions can also be found by a key that doesn't depend on the paths of
+their inputs, eg. the digest of an object's preprocessed source, see
+L{ActionCache.restorePreprocessed()}. The outputs are then also listed
+in a manifest named after the key.
+
+Outputs are stored in the background so actions don't wait for the
+cache, see L{StoreQueue}. Every lookup and store is counted in the
+engine's cache statistics, see L{cake.cachestats}.
+
+All actions use the cache the same way::
+  cache = ActionCache(configuration, path)
+  if cache.restore(target, args, message):
+    return # Restored from the cache
+  ... run the action, recording its output with recordOutput() ...
+  dependencyInfo = configuration.createDependencyInfo(
+    targets, args, cache.normalizePaths(dependencies), calculateDigests=True,
+    )
+  configuration.storeDependencyInfo(dependencyInfo)
+  cache.store(dependencyInfo, getRecordedOutput(task))
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+import stat
+import threading
+import time
+import traceback
+
+import cake.cachecodec
+import cake.filesys
+import cake.hash
+import cake.objectcache
+import cake.path
+import cake.script
+import cake.task
+import cake.threadpool
+
+storeThreadCount = 2
+"""The number of threads that store outputs in the caches.
+@type: int
+"""
+
+maximumQueuedStores = 64
+"""The number of stores that can be waiting before actions that add
+outputs to a cache have to wait for them.
+@type: int
+"""
+
+_executeBits = stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+
+def startRecording(task):
+  """Record the output written by a task and the tasks it creates.
+
+  @param task: The task that runs an action.
+  @type task: L{cake.task.Task}
+  """
+  task.actionOutput = []
+
+def recordOutput(text):
+  """Record output written by the action running on the current task.
+
+  Does nothing if the action's output isn't being recorded.
+
+  @param text: The text that was output.
+  @type text: string
+  """
+  task = cake.task.Task.getCurrent()
+  while task is not None:
+    output = getattr(task, "actionOutput", None)
+    if output is not None:
+      output.append(text)
+      return
+    task = task.parent
+
+def startTiming(task):
+  """Note that a task's action has started running.
+
+  @param task: A task passed to L{startRecording()}.
+  @type task: L{cake.task.Task}
+  """
+  task.actionStartTime = time.time()
+
+def getRecordedDuration(task):
+  """Return how long a task's action has been running.
+
+  @param task: A task passed to L{startTiming()}.
+  @type task: L{cake.task.Task}
+
+  @return: The duration in seconds or None if the action wasn't timed.
+  @rtype: float or None
+  """
+  startTime = getattr(task, "actionStartTime", None)
+  if startTime is None:
+    return None
+  return time.time() - startTime
+
+def getRecordedOutput(task):
+  """Return the output recorded for a task.
+
+  @param task: A task passed to L{startRecording()}.
+  @type task: L{cake.task.Task}
+
+  @rtype: string
+  """
+  return "".join(getattr(task, "actionOutput", ()))
+
+def getKeyManifestName(key):
+  """Return the name of the manifest of the outputs found by a key.
+
+  @param key: The key, see L{ActionCache.restorePreprocessed()}.
+  @type key: string of 20 bytes
+  """
+  return cake.objectcache.getCacheName(key) + ".pp.manifest"
+
+def _getVariantName():
+  script = cake.script.Script.getCurrent()
+  if script is not None and script.variant is not None:
+    return repr(script.variant)
+  return ""
+
+def _findFirst(entries, predicate):
+  for index, entry in enumerate(entries):
+    if predicate(entry):
+      return index
+  return -1
+
+class StoreQueue(object):
+  """A bounded queue of stores run by background threads.
+
+  Used by L{ActionCache.store()} so that actions don't wait for the
+  cache, eg. when it's on a slow network share.
+  """
+
+  def __init__(
+    self,
+    threadCount=None,
+    maximumSize=None,
+    logger=None,
+    ):
+    """Construct a store queue.
+
+    @param threadCount: The number of threads that run the stores, or
+    None for L{storeThreadCount}.
+    @type threadCount: int or None
+    @param maximumSize: The number of stores that can be queued or
+    running before L{queue()} waits for one to finish, or None for
+    L{maximumQueuedStores}.
+    @type maximumSize: int or None
+    @param logger: The logger to report unexpected errors to.
+    @type logger: L{cake.logging.Logger} or None
+    """
+    if threadCount is None:
+      threadCount = storeThreadCount
+    if maximumSize is None:
+      maximumSize = maximumQueuedStores
+    self._threadCount = threadCount
+    self._maximumSize = maximumSize
+    self._logger = logger
+    self._threadPool = None
+    self._lock = threading.Lock()
+    self._changed = threading.Condition(self._lock)
+    self._pendingCount = 0
+
+  def queue(self, func):
+    """Queue a store, waiting first if the queue is full.
+
+    @param func: The function that does the store. It should handle its
+    own errors.
+    @type func: callable
+    """
+    self._lock.acquire()
+    try:
+      while self._pendingCount >= self._maximumSize:
+        self._changed.wait()
+      self._pendingCount += 1
+      threadPool = self._threadPool
+      if threadPool is None:
+        threadPool = cake.threadpool.ThreadPool(self._threadCount)
+        self._threadPool = threadPool
+    finally:
+      self._lock.release()
+
+    def job():
+      try:
+        try:
+          func()
+        except Exception:
+          if self._logger is not None:
+            self._logger.outputDebug("cache", traceback.format_exc())
+      finally:
+        self._lock.acquire()
+        try:
+          self._pendingCount -= 1
+          self._changed.notifyAll()
+        finally:
+          self._lock.release()
+
+    threadPool.queueJob(job)
+
+  def flush(self):
+    """Wait for all queued stores to finish.
+    """
+    self._lock.acquire()
+    try:
+      while self._pendingCount:
+        self._changed.wait()
+    finally:
+      self._lock.release()
+
+class ActionCache(object):
+  """A cache of the outputs of build actions.
+
+  @ivar configuration: The configuration the actions belong to.
+  @type configuration: L{cake.engine.Configuration}
+  @ivar path: The absolute path of the local cache directory.
+  @type path: string
+  @ivar codec: The codec the outputs are stored with.
+  @type codec: L{cake.cachecodec.Codec}
+  @ivar remoteCache: The remote level of the cache or None.
+  @type remoteCache: L{cake.remotecache.RemoteCache} or None
+  """
+
+  def __init__(
+    self,
+    configuration,
+    path,
+    codec="zlib",
+    remote=None,
+    maximumSize=None,
+    workspaceRoot=None,
+    ):
+    """Construct an action cache.
+
+    @param configuration: The configuration the actions belong to.
+    @type configuration: L{cake.engine.Configuration}
+    @param path: The path of the local cache directory.
+    @type path: string
+    @param codec: The name of the codec to store outputs with, see
+    L{cake.cachecodec.getCodec()}.
+    @type codec: string
+    @param remote: The location of a remote cache, see
+    L{cake.remotecache.createStore()}, or None.
+    @type remote: string or None
+    @param maximumSize: The maximum size of the local cache in bytes or
+    None if it has no maximum size.
+    @type maximumSize: int or None
+    @param workspaceRoot: Inputs and outputs under this directory are
+    stored relative to it so workspaces at other paths can share the
+    cache. None to store absolute paths.
+    @type workspaceRoot: string or None
+
+    @raise ValueError: If the codec or remote location is invalid.
+    """
+    self.configuration = configuration
+    self.engine = configuration.engine
+    self.path = configuration.abspath(path)
+    self.codec = cake.cachecodec.getCodec(codec)
+    if remote is not None:
+      self.remoteCache = self.engine.getRemoteCache(self.path, remote)
+    else:
+      self.remoteCache = None
+    self.maximumSize = maximumSize
+    if workspaceRoot is not None:
+      self._workspaceRoot = os.path.normcase(
+        configuration.abspath(workspaceRoot)
+        ) + os.path.sep
+    else:
+      self._workspaceRoot = None
+
+  def normalizePaths(self, paths):
+    """Return the paths of an action's inputs or outputs as they are
+    stored in the cache.
+
+    @param paths: The paths.
+    @type paths: list of string
+
+    @return: The absolute paths, or the paths relative to the workspace
+    root for paths under it.
+    @rtype: list of string
+    """
+    abspath = self.configuration.abspath
+    normpath = os.path.normpath
+    workspaceRoot = self._workspaceRoot
+    if workspaceRoot is None:
+      return [normpath(abspath(p)) for p in paths]
+
+    workspaceRootLen = len(workspaceRoot)
+    results = []
+    for path in paths:
+      path = normpath(abspath(path))
+      if os.path.normcase(path).startswith(workspaceRoot):
+        path = path[workspaceRootLen:]
+      results.append(path)
+    return results
+
+  def _getManifestName(self, target):
+    # The manifest is found with the digest of the target's path, relative
+    # to the workspace root if the target is under it.
+    targetDigestPath = self.configuration.abspath(target)
+    workspaceRoot = self._workspaceRoot
+    if workspaceRoot is not None:
+      if os.path.normcase(targetDigestPath).startswith(workspaceRoot):
+        targetDigestPath = targetDigestPath[len(workspaceRoot):]
+    targetDigest = cake.hash.sha1(targetDigestPath.encode("utf8")).digest()
+    return cake.objectcache.getManifestName(targetDigest)
+
+  def _getLocalPath(self, name):
+    return cake.path.join(self.path, name)
+
+  def prefetch(self, target):
+    """Start fetching an action's outputs from the remote cache.
+
+    Does nothing if there is no remote cache.
+
+    @param target: The first target of the action.
+    @type target: string
+    """
+    if self.remoteCache is not None and not self.engine.forceBuild:
+      self.remoteCache.prefetch(self._getManifestName(target), self.codec.suffix)
+
+  def releaseTargets(self, targets):
+    """Unlink an action's targets that may be hard linked to the cache.
+
+    Should be called before an action that writes to its targets in
+    place is run.
+
+    @param targets: The targets of the action.
+    @type targets: list of string
+    """
+    abspath = self.configuration.abspath
+    for target in targets:
+      cake.objectcache.releaseTarget(abspath(target))
+
+  def _addStatistics(self, target, variant=None, **counts):
+    """Add to the engine's cache statistics for a target.
+
+    The variant is that of the current script if it isn't given.
+    """
+    if variant is None:
+      variant = _getVariantName()
+    directory = os.path.dirname(self.normalizePaths([target])[0])
+    self.engine.cacheStatistics.add(variant, directory, **counts)
+
+  def _addHitStatistics(self, target, entry, startTime, bytesRead, **counts):
+    """Add the statistics of a target restored from the cache.
+    """
+    lookupSeconds = time.time() - startTime
+    duration = cake.objectcache.getEntryDuration(entry)
+    if duration is not None:
+      counts["savedSeconds"] = duration - lookupSeconds
+    self._addStatistics(
+      target,
+      hits=1,
+      bytesRead=bytesRead,
+      lookupSeconds=lookupSeconds,
+      **counts
+      )
+
+  def _hasOutputs(self, entry):
+    """Check that all of an entry's outputs are in the local cache,
+    fetching them from the remote cache if necessary.
+    """
+    remoteCache = self.remoteCache
+    suffix = self.codec.suffix
+    for digest in cake.objectcache.getEntryDigests(entry):
+      name = cake.objectcache.getCacheName(digest) + suffix
+      if remoteCache is not None:
+        # Fetches the output into the local cache if it's missing.
+        found = remoteCache.fetchObject(name)
+      else:
+        found = cake.filesys.isFile(self._getLocalPath(name))
+      if not found:
+        return False
+    return True
+
+  def _findEntry(self, entries, argsDigest):
+    """Find an entry whose outputs are all in the local cache.
+    """
+    abspath = self.configuration.abspath
+    getFileDigest = self.engine.getFileDigest
+    index = cake.objectcache.findEntry(
+      entries,
+      argsDigest,
+      lambda p: getFileDigest(abspath(p)),
+      )
+    if index < 0 or not self._hasOutputs(entries[index]):
+      return -1
+    return index
+
+  def _lookup(self, manifestName, findEntry):
+    """Look up an entry in a local manifest, then the remote manifest.
+
+    @return: A tuple of (entries, index, entry) where entries are the
+    local manifest's entries, index is the index of the entry in them or
+    -1 if it came from the remote cache. The entry is None if there was
+    no match.
+    """
+    entries = cake.objectcache.readManifest(self._getLocalPath(manifestName))
+    index = findEntry(entries)
+    if index >= 0:
+      return entries, index, entries[index]
+    if self.remoteCache is not None:
+      remoteEntries = self.remoteCache.getManifest(manifestName)
+      remoteIndex = findEntry(remoteEntries)
+      if remoteIndex >= 0:
+        return entries, -1, remoteEntries[remoteIndex]
+    return entries, -1, None
+
+  def _restoreEntry(self, target, args, entry, dependencies, message):
+    """Restore the outputs of an entry and store their dependency info.
+
+    @return: A tuple of the new dependency info and the number of bytes
+    read from the cache, or None if the outputs couldn't be restored.
+    """
+    engine = self.engine
+    configuration = self.configuration
+    abspath = configuration.abspath
+    engine.logger.outputInfo(message)
+
+    outputs, output, modes = cake.objectcache.getEntryOutputs(entry)
+    targets = [target] + list(outputs)
+    suffix = self.codec.suffix
+    bytesRead = 0
+    try:
+      digests = cake.objectcache.getEntryDigests(entry)
+      for i, path in enumerate(targets):
+        absPath = abspath(path)
+        cachePath = self._getLocalPath(
+          cake.objectcache.getCacheName(digests[i]) + suffix
+          )
+        bytesRead += os.path.getsize(cachePath)
+        cake.objectcache.restoreObject(cachePath, absPath, self.codec)
+        # Hard linked outputs already share the cached file's permissions.
+        if modes and os.stat(absPath).st_nlink == 1:
+          os.chmod(absPath, modes[i])
+    except EnvironmentError:
+      return None # Invalid or removed cache file, run it instead.
+
+    if output:
+      engine.logger.outputError(output)
+
+    newDependencyInfo = configuration.createDependencyInfo(
+      targets=targets,
+      args=args,
+      dependencies=dependencies,
+      calculateDigests=True,
+      )
+    configuration.storeDependencyInfo(newDependencyInfo)
+    return newDependencyInfo, bytesRead
+
+  def _updateManifest(self, manifestName, entries, entry):
+    try:
+      cake.objectcache.writeManifest(
+        self._getLocalPath(manifestName),
+        cake.objectcache.addEntry(entries, entry),
+        )
+    except EnvironmentError:
+      pass # Only affects later lookups.
+
+  def restore(self, target, args, message):
+    """Restore the outputs of an action from the cache.
+
+    The action's output is written again, its dependency info is stored
+    and the cache records that the outputs were used.
+
+    @param target: The first target of the action.
+    @type target: string
+    @param args: The arguments of the action, as passed to
+    L{cake.engine.Configuration.checkDependencyInfo()}.
+    @type args: object
+    @param message: The message to output if the outputs are found, eg.
+    'Cached foo.c'.
+    @type message: string
+
+    @return: True if the outputs were restored, False if the action
+    needs to be run.
+    @rtype: bool
+    """
+    if self.engine.forceBuild:
+      return False
+
+    startTime = time.time()
+    manifestName = self._getManifestName(target)
+    argsDigest = cake.hash.sha1(repr(args)).digest()
+    entries, index, entry = self._lookup(
+      manifestName,
+      lambda entries: self._findEntry(entries, argsDigest),
+      )
+    if entry is not None:
+      result = self._restoreEntry(target, args, entry, entry[1], message)
+    else:
+      result = None
+    if result is None:
+      self._addStatistics(
+        target,
+        lookups=1,
+        misses=1,
+        lookupSeconds=time.time() - startTime,
+        )
+      return False
+
+    self._addHitStatistics(target, entry, startTime, result[1], lookups=1)
+    if index != 0:
+      # Move the entry to the front, or add it if the outputs came from
+      # the remote cache.
+      self._updateManifest(manifestName, entries, entry)
+    return True
+
+  def restorePreprocessed(self, target, args, key, dependencies, message):
+    """Restore the outputs of an action found by a key that doesn't
+    depend on the paths of its inputs.
+
+    Used when L{restore()} fails, eg. to find an object by the digest of
+    its preprocessed source. The outputs are restored as L{restore()}
+    does, and an entry for the inputs is added to the target's manifest so
+    the next lookup finds it with L{restore()}.
+
+    @param target: The first target of the action.
+    @type target: string
+    @param args: The arguments of the action.
+    @type args: object
+    @param key: The digest of everything the outputs depend on.
+    @type key: string of 20 bytes
+    @param dependencies: The inputs of the action, as returned by
+    L{normalizePaths()}.
+    @type dependencies: list of string
+    @param message: The message to output if the outputs are found.
+    @type message: string
+
+    @return: True if the outputs were restored.
+    @rtype: bool
+    """
+    if self.engine.forceBuild:
+      return False
+
+    # The lookup was counted as a miss by restore().
+    startTime = time.time()
+    keyManifestName = getKeyManifestName(key)
+    keyEntries, index, entry = self._lookup(
+      keyManifestName,
+      lambda entries: _findFirst(entries, self._hasOutputs),
+      )
+    if entry is not None:
+      result = self._restoreEntry(target, args, entry, dependencies, message)
+    else:
+      result = None
+    if result is None:
+      self._addStatistics(target, lookupSeconds=time.time() - startTime)
+      return False
+
+    newDependencyInfo, bytesRead = result
+    self._addHitStatistics(target, entry, startTime, bytesRead, misses=-1)
+
+    if index != 0:
+      self._updateManifest(keyManifestName, keyEntries, entry)
+    manifestName = self._getManifestName(target)
+    self._updateManifest(
+      manifestName,
+      cake.objectcache.readManifest(self._getLocalPath(manifestName)),
+      (
+        cake.hash.sha1(repr(args)).digest(),
+        newDependencyInfo.depPaths,
+        newDependencyInfo.depDigests,
+        ) + entry[3:],
+      )
+    return True
+
+  def store(self, dependencyInfo, output="", key=None, duration=None):
+    """Add the outputs of an action that has just run to the cache.
+
+    The outputs are stored in the background by the engine's store
+    queue, see L{cake.engine.Engine.flushCacheStores()}, so the action
+    can complete without waiting for the cache. This only waits if the
+    queue is full. Errors writing to the cache are counted in the cache
+    statistics but otherwise ignored.
+
+    @param dependencyInfo: The action's dependency info, created with
+    calculateDigests=True from paths returned by L{normalizePaths()}. Its
+    targets are the outputs that are cached.
+    @type dependencyInfo: L{cake.engine.DependencyInfo}
+    @param output: The output of the action, see L{getRecordedOutput()}.
+    @type output: string
+    @param key: The key to find the outputs by with
+    L{restorePreprocessed()} as well, or None.
+    @type key: string of 20 bytes or None
+    @param duration: How long the action took in seconds, see
+    L{getRecordedDuration()}, or None if it wasn't timed. Used to work
+    out the time saved when the outputs are restored.
+    @type duration: float or None
+    """
+    # Background threads don't have a current script to find the variant.
+    variant = _getVariantName()
+    self.engine.cacheStoreQueue.queue(
+      lambda: self._store(dependencyInfo, output, key, duration, variant)
+      )
+
+  def _store(self, dependencyInfo, output, key, duration, variant):
+    configuration = self.configuration
+    abspath = configuration.abspath
+    targets = dependencyInfo.targets
+    try:
+      resultDigest = configuration.calculateDigest(dependencyInfo)
+      outputs = self.normalizePaths(targets[1:])
+      modes = tuple(
+        stat.S_IMODE(os.stat(abspath(path)).st_mode) for path in targets
+        )
+      if not any(mode & _executeBits for mode in modes):
+        modes = ()
+      entry = (
+        cake.hash.sha1(repr(dependencyInfo.args)).digest(),
+        dependencyInfo.depPaths,
+        dependencyInfo.depDigests,
+        resultDigest,
+        )
+      if duration is not None:
+        entry += ((tuple(outputs), output, modes, duration),)
+      elif outputs or output or modes:
+        entry += ((tuple(outputs), output, modes),)
+
+      # Store the outputs first, then update the manifest so that other
+      # processes won't find the entry until the outputs are ready.
+      suffix = self.codec.suffix
+      names = []
+      bytesWritten = 0
+      for path, digest in zip(targets, cake.objectcache.getEntryDigests(entry)):
+        name = cake.objectcache.getCacheName(digest) + suffix
+        cachePath = self._getLocalPath(name)
+        cake.objectcache.storeObject(abspath(path), cachePath, self.codec)
+        bytesWritten += os.path.getsize(cachePath)
+        names.append(name)
+      self.engine.addObjectCache(self.path, self.maximumSize)
+
+      manifestNames = [self._getManifestName(targets[0])]
+      if key is not None:
+        manifestNames.append(getKeyManifestName(key))
+      for manifestName in manifestNames:
+        manifestPath = self._getLocalPath(manifestName)
+        cake.objectcache.writeManifest(
+          manifestPath,
+          cake.objectcache.addEntry(
+            cake.objectcache.readManifest(manifestPath),
+            entry,
+            ),
+          )
+
+      if self.remoteCache is not None:
+        self.remoteCache.upload(names, manifestNames, entry)
+    except EnvironmentError:
+      # Don't worry if we can't put the outputs in the cache, the build
+      # shouldn't fail.
+      self._addStatistics(targets[0], variant, storeFailures=1)
+    else:
+      self._addStatistics(
+        targets[0],
+        variant,
+        stores=1,
+        bytesWritten=bytesWritten,
+        )
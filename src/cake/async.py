@@ -25,23 +25,28 @@ class DeferredResult(AsyncResult):
   def result(self):
     return self.task.result
 
+_sequenceTypes = (list, tuple, set, frozenset)
+
 def _findAsyncResults(value):
-  """Return a sequence of AsyncResult objects found in the specified value.
+  """Return a list of AsyncResult objects found in the specified value.
 
   Recursively searches builtin types 'list', 'tuple', 'set', 'frozenset' and 'dict'.
+  The search uses an explicit stack rather than recursive generators so that
+  deeply nested or very long argument lists are cheap to search.
   """
-  if isinstance(value, AsyncResult):
-    yield value
-  elif isinstance(value, (list, tuple, set, frozenset)):
-    for item in value:
-      for result in _findAsyncResults(item):
-        yield result
-  elif isinstance(value, dict):
-    for k, v in value.iteritems():
-      for result in _findAsyncResults(k):
-        yield result
-      for result in _findAsyncResults(v):
-        yield result
+  results = []
+  stack = [value]
+  pop = stack.pop
+  while stack:
+    value = pop()
+    if isinstance(value, AsyncResult):
+      results.append(value)
+    elif isinstance(value, _sequenceTypes):
+      stack.extend(value)
+    elif isinstance(value, dict):
+      stack.extend(value.iterkeys())
+      stack.extend(value.itervalues())
+  return results
 
 def _resolveAsyncResults(value):
   """Return the equivalent value with all AsyncResults resolved with their
@@ -62,28 +67,41 @@ def _resolveAsyncResults(value):
   else:
     return value
 
-def _getWaitTasks(asyncResults, taskFactory):
-  waitTasks = []
-  for asyncResult in asyncResults:
-    task = asyncResult.task
-    if task:
-      waitTask = taskFactory(lambda r=asyncResult: _onAsyncResultReady(r, taskFactory))
-      waitTask.startAfter(task)
-      waitTasks.append(waitTask)
-  return waitTasks
+def _getWaitTask(asyncResults, taskFactory):
+  """Return a single task that completes once all of the AsyncResults, and any
+  AsyncResults nested within their results, are available.
+
+  Rather than creating a wait task per AsyncResult this joins on all of the
+  distinct result tasks at once and only creates another wait task for each
+  level of nesting found in the results.
+
+  @return: The wait task or None if there is nothing to wait for.
+  """
+  asyncResults = [r for r in asyncResults if r.task]
+  if not asyncResults:
+    return None
 
-def _onAsyncResultReady(asyncResult, taskFactory):
-  """Called when an AsyncResult is ready.
+  tasks = list(set(r.task for r in asyncResults))
+  waitTask = taskFactory(lambda: _onAsyncResultsReady(asyncResults, taskFactory))
+  waitTask.startAfter(tasks)
+  return waitTask
 
-  Recurse on the result to see if it contains any nested AsyncResult objects.
+def _onAsyncResultsReady(asyncResults, taskFactory):
+  """Called when a batch of AsyncResults are ready.
+
+  Search the results to see if they contain any nested AsyncResult objects.
   If so then the task for this callback will only complete after those nested
   AsyncResult values are available.
   """
-  waitTasks = _getWaitTasks(_findAsyncResults(asyncResult.result), taskFactory)
-  if waitTasks:
+  nestedResults = []
+  for asyncResult in asyncResults:
+    nestedResults.extend(_findAsyncResults(asyncResult.result))
+
+  waitTask = _getWaitTask(nestedResults, taskFactory)
+  if waitTask is not None:
     parentTask = Task.getCurrent()
     if parentTask:
-      parentTask.completeAfter(waitTasks)
+      parentTask.completeAfter(waitTask)
 
 def _getTaskFactory():
   # If called from within a Script we use Engine.createTask
@@ -112,8 +130,9 @@ def waitForAsyncResult(func):
   """
   def call(*args, **kwargs):
 
-    asyncResults = list(_findAsyncResults(args))
-    asyncResults.extend(_findAsyncResults(kwargs))
+    asyncResults = _findAsyncResults(args)
+    if kwargs:
+      asyncResults.extend(_findAsyncResults(kwargs))
 
     if not asyncResults:
       return func(*args, **kwargs)
@@ -126,7 +145,7 @@ def waitForAsyncResult(func):
     taskFactory = _getTaskFactory()
 
     runTask = taskFactory(run)
-    runTask.startAfter(_getWaitTasks(asyncResults, taskFactory))
+    runTask.startAfter(_getWaitTask(asyncResults, taskFactory))
 
     parentTask = Task.getCurrent()
     if parentTask:
@@ -160,14 +179,20 @@ def flatten(value):
   @return: The flattened list or if any of the items are AsyncResult values then
   an AsyncResult value that results in the flattened items.
   """
-  sequenceTypes = (list, tuple, set, frozenset)
-  
-  def _flatten(value):
-    if isinstance(value, sequenceTypes):
-      for item in value:
-        for x in _flatten(item):
-          yield x
+  if not isinstance(value, _sequenceTypes):
+    return [value]
+
+  # Walk the nested sequences with an explicit stack of iterators so that
+  # items are visited in order without creating a generator per level.
+  results = []
+  append = results.append
+  stack = [iter(value)]
+  while stack:
+    for item in stack[-1]:
+      if isinstance(item, _sequenceTypes):
+        stack.append(iter(item))
+        break
+      append(item)
     else:
-      yield value
-
-  return list(_flatten(value))
+      stack.pop()
+  return results
@@ -8,10 +8,15 @@
 import __builtin__
 import imp
 import marshal
+import mmap
 import os
 import sys
 import struct
 import platform
+import stat
+import threading
+
+import cake.hash
 
 # Magic header written at start of file
 _MAGIC = imp.get_magic()
@@ -29,6 +34,21 @@ else:
   def _setCreatorType(file):
     pass
       
+def _dontWriteByteCode():
+  try:
+    return sys.dont_write_bytecode
+  except AttributeError:
+    # Fallback for Python 2.5 or earlier
+    return "PYTHONDONTWRITEBYTECODE" in os.environ
+
+def _compileSource(codestring, filename):
+  # Source needs a trailing newline to compile correctly
+  if not codestring.endswith('\n'):
+    codestring = codestring + '\n'
+    
+  # Compile the source
+  return __builtin__.compile(codestring, filename, 'exec')
+
 def loadCode(file, cfile=None, dfile=None, cached=True):
   """Load the code object for the specified python file.
   
@@ -56,13 +76,8 @@ def loadCode(file, cfile=None, dfile=None, cached=True):
 
   timestamp = None
 
-  try:
-    if sys.dont_write_bytecode:
-      cached = False
-  except AttributeError:
-    # Fallback for Python 2.5 or earlier
-    if "PYTHONDONTWRITEBYTECODE" in os.environ:
-      cached = False
+  if _dontWriteByteCode():
+    cached = False
 
   if cached:
     # Try to load the cache file if possible, don't sweat if we can't
@@ -92,12 +107,7 @@ def loadCode(file, cfile=None, dfile=None, cached=True):
   finally:
     f.close()
     
-  # Source needs a trailing newline to compile correctly
-  if not codestring.endswith('\n'):
-    codestring = codestring + '\n'
-    
-  # Compile the source
-  codeobject = __builtin__.compile(codestring, dfile or file, 'exec')
+  codeobject = _compileSource(codestring, dfile or file)
   
   if cached:
     # Try to save the cache file if possible, don't sweat if we can't
@@ -117,3 +127,269 @@ def loadCode(file, cfile=None, dfile=None, cached=True):
       pass
   
   return codeobject
+
+# Header written at the start of a consolidated cache file. Includes the
+# Python magic so the cache is discarded when the Python version changes.
+_CACHE_MAGIC = _MAGIC + "CKBC\x01"
+_CACHE_MAGIC_LEN = len(_CACHE_MAGIC)
+
+# Each record starts with the length of its key and code strings.
+_RECORD_HEADER = struct.Struct('<II')
+
+def _getFileKey(st):
+  """Return the (mtimeNs, size) part of a cache key from a stat result.
+  """
+  try:
+    mtimeNs = st.st_mtime_ns
+  except AttributeError:
+    # Scaling the float timestamp would round away nanoseconds, so only
+    # use it for the fraction of a second.
+    seconds = st[stat.ST_MTIME]
+    mtimeNs = seconds * 1000000000L + int(round((st.st_mtime - seconds) * 1e9))
+  return mtimeNs, st.st_size
+
+class ByteCodeCache(object):
+  """A single file holding the byte code of many scripts.
+
+  Loading a separate cache file per script means hundreds of small file
+  opens at startup. Instead this cache keeps the byte code for every
+  script in one file. The file is memory-mapped and its index read once,
+  the byte code of each script is only unmarshalled when it is loaded.
+
+  Entries are keyed by the script's path, modification time in
+  nanoseconds, size and SHA-1 digest of its source. If the modification
+  time or size differ then the source digest is checked before deciding
+  to recompile. Recompiled scripts are appended to the end of the file
+  so unchanged entries never need rewriting. The file is compacted when
+  it contains more superseded entries than live ones.
+  """
+
+  # Don't bother compacting cache files smaller than this.
+  _minCompactSize = 1024 * 1024
+
+  def __init__(self, path):
+    """Construct a cache stored in the specified file.
+
+    @param path: The path of the cache file. It is created if it does
+    not exist.
+    @type path: string
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._loaded = False
+    self._index = {}
+    self._map = None
+    self._file = None
+    self._appendFile = None
+    self._validSize = 0
+    self._liveBytes = 0
+
+  def _load(self):
+    """Read the index of the cache file.
+    """
+    self._loaded = True
+    try:
+      self._file = open(self.path, 'rb')
+    except EnvironmentError:
+      return
+
+    try:
+      size = os.fstat(self._file.fileno()).st_size
+      if size < _CACHE_MAGIC_LEN:
+        return
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    except EnvironmentError:
+      return
+
+    m = self._map
+    if m[:_CACHE_MAGIC_LEN] != _CACHE_MAGIC:
+      return
+
+    index = self._index
+    offset = _CACHE_MAGIC_LEN
+    headerSize = _RECORD_HEADER.size
+    while offset + headerSize <= size:
+      keyLen, codeLen = _RECORD_HEADER.unpack_from(m, offset)
+      keyOffset = offset + headerSize
+      codeOffset = keyOffset + keyLen
+      end = codeOffset + codeLen
+      if end > size:
+        break # Truncated by an interrupted write
+      try:
+        path, mtimeNs, fileSize, digest = marshal.loads(m[keyOffset:codeOffset])
+      except Exception:
+        break # Corrupt
+      # Later entries supersede earlier ones for the same script.
+      index[path] = (mtimeNs, fileSize, digest, codeOffset, codeLen, end - offset)
+      offset = end
+    self._validSize = offset
+    self._liveBytes = sum(entry[5] for entry in index.itervalues())
+
+  def _compact(self):
+    """Rewrite the cache file keeping only the latest entry for each script.
+    """
+    tmpPath = self.path + ".tmp%i" % os.getpid()
+    m = self._map
+    index = {}
+    f = open(tmpPath, 'wb')
+    try:
+      f.write(_CACHE_MAGIC)
+      offset = _CACHE_MAGIC_LEN
+      for path, entry in self._index.iteritems():
+        recordSize = entry[5]
+        recordStart = entry[3] + entry[4] - recordSize
+        f.write(m[recordStart:recordStart + recordSize])
+        codeOffset = offset + (entry[3] - recordStart)
+        index[path] = entry[:3] + (codeOffset,) + entry[4:]
+        offset += recordSize
+    finally:
+      f.close()
+
+    self._closeMap()
+    try:
+      if os.path.exists(self.path):
+        os.remove(self.path) # Required on Windows
+      os.rename(tmpPath, self.path)
+    except EnvironmentError:
+      try:
+        os.remove(tmpPath)
+      except EnvironmentError:
+        pass
+      self._index = {}
+      return
+
+    self._index = index
+    self._file = open(self.path, 'rb')
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+  def _closeMap(self):
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def _openAppendFile(self):
+    """Open the cache file for appending.
+
+    The file is never truncated as another process may be appending to
+    it. If it is empty or invalid a new file holding just the magic is
+    renamed over it, so a file being appended to always starts with the
+    magic.
+    """
+    f = open(self.path, 'a+b')
+    try:
+      f.seek(0, 0)
+      magic = f.read(_CACHE_MAGIC_LEN)
+      f.seek(0, 2)
+    except:
+      f.close()
+      raise
+    if magic == _CACHE_MAGIC:
+      return f
+    f.close()
+
+    # Missing, empty or invalid, start again.
+    self._closeMap()
+    self._index = {}
+    tmpPath = self.path + ".tmp%i" % os.getpid()
+    f = open(tmpPath, 'wb')
+    try:
+      f.write(_CACHE_MAGIC)
+    finally:
+      f.close()
+    try:
+      if os.path.exists(self.path):
+        os.remove(self.path) # Required on Windows
+      os.rename(tmpPath, self.path)
+    except EnvironmentError:
+      try:
+        os.remove(tmpPath)
+      except EnvironmentError:
+        pass
+      raise
+    return open(self.path, 'ab')
+
+  def _append(self, path, key, codeobject):
+    """Append a newly compiled script to the end of the cache file.
+    """
+    try:
+      if self._appendFile is None:
+        self._appendFile = self._openAppendFile()
+      keyString = marshal.dumps((path,) + key)
+      codeString = marshal.dumps(codeobject)
+      # Write the whole record at once so concurrent writers don't interleave.
+      self._appendFile.write(
+        _RECORD_HEADER.pack(len(keyString), len(codeString)) + keyString + codeString
+        )
+      self._appendFile.flush()
+    except Exception:
+      # Don't sweat if we can't update the cache.
+      pass
+
+  def loadCode(self, file, dfile=None):
+    """Load the code object for the specified python file.
+
+    @param file: Path of the source file to load.
+
+    @param dfile: If specified, the path of the file to show in error
+    messages. Defaults to C{file}.
+
+    @return: The code object resulting from compiling the python source file.
+    This can be executed by the 'exec' statement/function.
+    """
+    self._lock.acquire()
+    try:
+      if not self._loaded:
+        self._load()
+        if (self._map is not None and
+            self._validSize > self._minCompactSize and
+            self._liveBytes * 2 < self._validSize):
+          self._compact()
+
+      st = os.stat(file)
+      fileKey = _getFileKey(st)
+      entry = self._index.get(file, None)
+      if entry is not None and entry[:2] == fileKey:
+        try:
+          return marshal.loads(self._map[entry[3]:entry[3] + entry[4]])
+        except Exception:
+          pass # Fall back to compiling
+
+      f = open(file, 'rb')
+      try:
+        codestring = f.read()
+      finally:
+        f.close()
+      digest = cake.hash.sha1(codestring).digest()
+
+      codeobject = None
+      if entry is not None and entry[2] == digest:
+        # Only the timestamp changed, reuse the code.
+        try:
+          codeobject = marshal.loads(self._map[entry[3]:entry[3] + entry[4]])
+        except Exception:
+          pass
+      if codeobject is None:
+        # Universal newline translation, as for files opened with 'rU'.
+        codestring = codestring.replace('\r\n', '\n').replace('\r', '\n')
+        codeobject = _compileSource(codestring, dfile or file)
+
+      if not _dontWriteByteCode():
+        self._append(file, fileKey + (digest,), codeobject)
+      return codeobject
+    finally:
+      self._lock.release()
+
+  def close(self):
+    """Close the cache file.
+    """
+    self._lock.acquire()
+    try:
+      self._closeMap()
+      if self._appendFile is not None:
+        self._appendFile.close()
+        self._appendFile = None
+    finally:
+      self._lock.release()
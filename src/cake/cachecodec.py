@@ -0,0 +1,321 @@
+"""Object Cache Codecs.
+
+A codec controls how objects are stored in the object cache, see
+L{cake.objectcache}. Codecs are looked up by name with L{getCodec()}:
+
+  - 'none' stores objects uncompressed. Cache hits are copied without
+    reading the object into Python, using a reflink or copy_file_range()
+    where supported. Suits local caches.
+  - 'link' stores objects uncompressed and hard links cache hits to their
+    targets, falling back to a copy. Cached objects are made read-only
+    as they share their data with the targets.
+  - 'zlib' or 'zlib-N' compresses objects with zlib at level N (default 1).
+  - 'lzma' or 'lzma-N' compresses objects with LZMA preset N (default 6).
+    Requires the 'lzma' module or the 'backports.lzma' package.
+
+Compressing codecs stream objects a block at a time so memory use is
+bounded however big the objects are. Other codecs can be added with
+L{registerCodec()}.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import stat
+import thread
+import threading
+import zlib
+
+import cake.filesys
+
+_blockSize = 1024 * 1024
+_writeBits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+class Codec(object):
+  """Base class for the ways objects can be stored in the cache.
+
+  @ivar name: The name the codec was looked up with.
+  @type name: string
+  """
+
+  suffix = ""
+  """The suffix added to the names of objects stored by this codec.
+
+  Codecs that store objects in the same format must use the same suffix.
+  @type: string
+  """
+
+  def __init__(self, name, level=None):
+    """Construct a codec.
+
+    @param name: The name the codec was looked up with.
+    @type name: string
+    @param level: The level given after the codec name, eg. 9 for
+    'zlib-9', or None if no level was given.
+    @type level: int or None
+    """
+    if level is not None:
+      raise ValueError("codec '%s' doesn't take a level" % name)
+    self.name = name
+
+  def store(self, sourcePath, cachePath):
+    """Store a file in the cache.
+
+    @param sourcePath: The path of the file to store.
+    @type sourcePath: string
+    @param cachePath: The path to store it at. The path is renamed once
+    the file has been stored.
+    @type cachePath: string
+
+    @raise EnvironmentError: If the file couldn't be stored.
+    """
+    raise NotImplementedError()
+
+  def restore(self, cachePath, targetPath):
+    """Restore a file from the cache.
+
+    @param cachePath: The path of the file in the cache.
+    @type cachePath: string
+    @param targetPath: The path to restore it to. The file is either
+    replaced or written to in place.
+    @type targetPath: string
+
+    @raise EnvironmentError: If the file couldn't be restored.
+    """
+    raise NotImplementedError()
+
+class CopyCodec(Codec):
+  """Stores objects uncompressed and copies them without reading them
+  into Python.
+  """
+
+  suffix = ".raw"
+
+  def store(self, sourcePath, cachePath):
+    cake.filesys.cloneFile(sourcePath, cachePath)
+
+  def restore(self, cachePath, targetPath):
+    cake.filesys.cloneFile(cachePath, targetPath)
+
+class LinkCodec(CopyCodec):
+  """Stores objects uncompressed and hard links them to their targets.
+  """
+
+  def store(self, sourcePath, cachePath):
+    if not _link(sourcePath, cachePath):
+      CopyCodec.store(self, sourcePath, cachePath)
+    # Writing to the target would also modify the cached object. Keep the
+    # other permissions as they are shared with the target, eg. a program.
+    mode = stat.S_IMODE(os.stat(cachePath).st_mode)
+    os.chmod(cachePath, (mode | stat.S_IREAD) & ~_writeBits)
+
+  def restore(self, cachePath, targetPath):
+    # Link beside the target then rename as links can't replace files.
+    tmpPath = "%s.%i.%i.tmp" % (targetPath, os.getpid(), thread.get_ident())
+    if _link(cachePath, tmpPath):
+      cake.filesys.renameFile(tmpPath, targetPath)
+    else:
+      CopyCodec.restore(self, cachePath, targetPath)
+
+def _link(source, target):
+  try:
+    link = os.link
+  except AttributeError:
+    return False # Windows with Python 2
+  try:
+    link(source, target)
+  except EnvironmentError:
+    return False # Eg. on another file system.
+  return True
+
+class StreamCodec(Codec):
+  """Base class for codecs that compress objects as a stream.
+
+  Only a block of the object is held in memory at a time.
+  """
+
+  def createCompressor(self):
+    """Return an object with compress(data) and flush() methods.
+    """
+    raise NotImplementedError()
+
+  def createDecompressor(self):
+    """Return an object with a decompress(data) method.
+    """
+    raise NotImplementedError()
+
+  def decompress(self, decompressor, data):
+    """Decompress a block of data.
+
+    @return: The blocks of decompressed data.
+    @rtype: iterable of string
+    """
+    return [decompressor.decompress(data)]
+
+  def store(self, sourcePath, cachePath):
+    compressor = self.createCompressor()
+    s = open(sourcePath, "rb")
+    try:
+      t = open(cachePath, "wb")
+      try:
+        while True:
+          data = s.read(_blockSize)
+          if not data:
+            break
+          t.write(compressor.compress(data))
+        t.write(compressor.flush())
+      finally:
+        t.close()
+    finally:
+      s.close()
+
+  def restore(self, cachePath, targetPath):
+    decompressor = self.createDecompressor()
+    s = open(cachePath, "rb")
+    try:
+      t = open(targetPath, "wb")
+      try:
+        while True:
+          data = s.read(_blockSize)
+          if not data:
+            break
+          try:
+            for block in self.decompress(decompressor, data):
+              t.write(block)
+          except Exception, e:
+            raise EnvironmentError("%s: %s" % (cachePath, e))
+      finally:
+        t.close()
+    finally:
+      s.close()
+
+class ZlibCodec(StreamCodec):
+  """Compresses objects with zlib.
+
+  Stores objects in the same format as earlier versions of Cake.
+  """
+
+  def __init__(self, name, level=None):
+    if level is None:
+      level = 1
+    elif not 0 <= level <= 9:
+      raise ValueError("zlib level must be 0-9, not %i" % level)
+    self.name = name
+    self.level = level
+
+  def createCompressor(self):
+    return zlib.compressobj(self.level)
+
+  def createDecompressor(self):
+    return zlib.decompressobj()
+
+  def decompress(self, decompressor, data):
+    # Limit the size of each block in case the data compressed well.
+    while data:
+      yield decompressor.decompress(data, _blockSize)
+      data = decompressor.unconsumed_tail
+
+class LzmaCodec(StreamCodec):
+  """Compresses objects with LZMA.
+  """
+
+  suffix = ".xz"
+
+  def __init__(self, name, level=None):
+    try:
+      import lzma
+    except ImportError:
+      try:
+        from backports import lzma
+      except ImportError:
+        raise ValueError(
+          "codec '%s' requires the 'lzma' module or 'backports.lzma' package" % name
+          )
+    if level is None:
+      level = 6
+    elif not 0 <= level <= 9:
+      raise ValueError("lzma preset must be 0-9, not %i" % level)
+    self.name = name
+    self.level = level
+    self._lzma = lzma
+
+  def createCompressor(self):
+    return self._lzma.LZMACompressor(preset=self.level)
+
+  def createDecompressor(self):
+    return self._lzma.LZMADecompressor()
+
+_codecTypes = {
+  "none": CopyCodec,
+  "link": LinkCodec,
+  "zlib": ZlibCodec,
+  "lzma": LzmaCodec,
+  }
+_codecs = {}
+_codecsLock = threading.Lock()
+
+def registerCodec(name, codecType):
+  """Register a new type of codec.
+
+  @param name: The name of the codec.
+  @type name: string
+  @param codecType: The L{Codec} subclass. It is constructed with the
+  name and level when the codec is first looked up.
+  @type codecType: type
+  """
+  _codecsLock.acquire()
+  try:
+    _codecTypes[name] = codecType
+    for key in list(_codecs):
+      if key == name or key.startswith(name + "-"):
+        del _codecs[key]
+  finally:
+    _codecsLock.release()
+
+def getCodec(name):
+  """Look up a codec by name.
+
+  @param name: The name of the codec, optionally followed by '-' and a
+  level, eg. 'zlib-9'.
+  @type name: string
+
+  @return: The codec.
+  @rtype: L{Codec}
+
+  @raise ValueError: If the codec is unknown, can't be used or the level
+  is invalid.
+  """
+  codec = _codecs.get(name, None)
+  if codec is not None:
+    return codec
+
+  baseName, sep, level = name.partition("-")
+  if sep:
+    try:
+      level = int(level)
+    except ValueError:
+      raise ValueError("invalid codec '%s'" % name)
+  else:
+    level = None
+
+  _codecsLock.acquire()
+  try:
+    codec = _codecs.get(name, None)
+    if codec is None:
+      codecType = _codecTypes.get(baseName, None)
+      if codecType is None:
+        raise ValueError("unknown codec '%s'" % name)
+      codec = codecType(name, level)
+      _codecs[name] = codec
+  finally:
+    _codecsLock.release()
+  return codec
+
+def getSuffixes():
+  """Return the suffixes of the objects stored by the registered codecs.
+
+  @rtype: set of string
+  """
+  return set(t.suffix for t in _codecTypes.values())
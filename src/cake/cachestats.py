@@ -0,0 +1,179 @@
+"""Object Cache Statistics.
+
+Counts how well the object caches used by a build worked, see
+L{cake.actioncache}. Each count is kept per variant and per directory of
+the targets so the caches can be tuned, eg. to see which parts of a
+build rarely hit. A summary is output at the end of a build, and
+'cake --cache-stats=<file>' writes all the counts to a JSON file.
+
+The time saved by a hit is estimated from how long the target took to
+build when it was added to the cache, less the time taken to look it up
+and restore it. It can be negative if the cache is slow, eg. a network
+share that is further away than the compiler.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import json
+import threading
+
+import cake.filesys
+
+counterNames = (
+  "lookups",
+  "hits",
+  "misses",
+  "stores",
+  "storeFailures",
+  "bytesRead",
+  "bytesWritten",
+  "lookupSeconds",
+  "savedSeconds",
+  )
+"""The names of the counts kept for each variant and directory.
+@type: tuple of string
+"""
+
+def _createCounts():
+  return dict.fromkeys(counterNames, 0)
+
+def _addCounts(total, counts):
+  for name, value in counts.iteritems():
+    total[name] += value
+
+def formatSize(size):
+  """Return a string representation of a size in bytes.
+
+  Used by the cache summary and the report of 'cake --cache-trim'.
+
+  @param size: The size in bytes.
+  @type size: int or float
+
+  @rtype: string
+  """
+  for unit in ("bytes", "KB", "MB", "GB"):
+    if size < 1024:
+      break
+    size /= 1024.0
+  else:
+    unit = "TB"
+  if unit == "bytes":
+    return "%i %s" % (size, unit)
+  else:
+    return "%.1f%s" % (size, unit)
+
+class CacheStatistics(object):
+  """Counts of the lookups and stores of the object caches used by a
+  build.
+
+  Safe to use from multiple threads.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._counts = {}
+
+  def add(self, variant, directory, **counts):
+    """Add to the counts of a variant and directory.
+
+    @param variant: The name of the variant, eg. 'Variant(release=True)'.
+    @type variant: string
+    @param directory: The directory of the target.
+    @type directory: string
+    @param counts: The amounts to add to the counts named in
+    L{counterNames}.
+    @type counts: int or float
+    """
+    key = (variant, directory)
+    self._lock.acquire()
+    try:
+      total = self._counts.get(key, None)
+      if total is None:
+        total = self._counts[key] = _createCounts()
+      _addCounts(total, counts)
+    finally:
+      self._lock.release()
+
+  def getCounts(self):
+    """Return the counts of each variant and directory.
+
+    @return: A dictionary of the counts, see L{counterNames}, keyed by
+    (variant, directory) tuples.
+    @rtype: dict of (string, string) to dict of string to number
+    """
+    self._lock.acquire()
+    try:
+      return dict((k, dict(v)) for k, v in self._counts.iteritems())
+    finally:
+      self._lock.release()
+
+  def getTotals(self):
+    """Return the counts summed over every variant and directory.
+
+    @rtype: dict of string to number
+    """
+    total = _createCounts()
+    for counts in self.getCounts().itervalues():
+      _addCounts(total, counts)
+    return total
+
+  def formatSummary(self):
+    """Return a one line summary of the totals for the build summary.
+
+    @return: The summary or an empty string if no caches were used.
+    @rtype: string
+    """
+    total = self.getTotals()
+    if not total["lookups"] and not total["stores"]:
+      return ""
+    if total["lookups"]:
+      hitRate = 100.0 * total["hits"] / total["lookups"]
+    else:
+      hitRate = 0.0
+    summary = (
+      "Cache: %i hits, %i misses (%.0f%%), read %s, wrote %s, "
+      "lookups took %.2fs, saved %.1fs" % (
+        total["hits"],
+        total["misses"],
+        hitRate,
+        formatSize(total["bytesRead"]),
+        formatSize(total["bytesWritten"]),
+        total["lookupSeconds"],
+        total["savedSeconds"],
+        ))
+    if total["storeFailures"]:
+      summary += ", %i stores failed" % total["storeFailures"]
+    return summary + ".\n"
+
+  def writeFile(self, path):
+    """Write the counts to a JSON file.
+
+    The file holds an object with the 'total' counts and a 'variants'
+    object keyed by variant name. Each variant has its 'total' counts and
+    a 'directories' object of the counts keyed by directory.
+
+    @param path: The path of the file.
+    @type path: string
+
+    @raise EnvironmentError: If the file couldn't be written.
+    """
+    variants = {}
+    for (variant, directory), counts in self.getCounts().iteritems():
+      variantStats = variants.get(variant, None)
+      if variantStats is None:
+        variantStats = variants[variant] = {
+          "total": _createCounts(),
+          "directories": {},
+          }
+      _addCounts(variantStats["total"], counts)
+      variantStats["directories"][directory] = counts
+
+    data = json.dumps(
+      {"total": self.getTotals(), "variants": variants},
+      indent=2,
+      separators=(",", ": "),
+      sort_keys=True,
+      )
+    cake.filesys.writeFile(path, data + "\n")
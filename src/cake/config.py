@@ -4,8 +4,6 @@
 #-------------------------------------------------------------------------------
 from cake.engine import Variant
 from cake.async import waitForAsyncResult
-from cake.library.compilers import CompilerNotFoundError
-from cake.library.compilers.dummy import DummyCompiler
 from cake.library.env import EnvironmentTool
 from cake.library.filesys import FileSystemTool
 from cake.library.logging import LoggingTool
@@ -16,6 +14,8 @@ from cake.library.variant import VariantTool
 from cake.library.zipping import ZipTool
 from cake.script import Script
 
+import os.path
+
 import cake.path
 import cake.system
 
@@ -62,14 +62,51 @@ projectTool.enabled = hasattr(engine.options, "createProjects") and engine.optio
 # Add a build success callback that will do the actual project generation.
 engine.addBuildSuccessCallback(projectTool.build)
 
-def createVariants(platform, architecture, compiler):
-  for target in ["debug", "release"]:
-    variant = Variant(
-      platform=platform,
-      architecture=architecture,
-      compiler=compiler.name,
-      target=target,
-      )
+# Cache the results of probing for compilers between builds.
+homeDir = os.path.expanduser("~")
+if engine.probeCachePath is None and homeDir != "~":
+  engine.probeCachePath = cake.path.join(homeDir, ".cake", "probes.cache")
+
+def prefetchCompilers():
+  """Start probing for all compilers when the first one is needed.
+  
+  Lets the probes that aren't cached run in parallel.
+  """
+  if prefetched:
+    return
+  prefetched.append(True)
+  
+  from cake.library.compilers.gcc import prefetchGccCompiler
+  prefetchGccCompiler(configuration=configuration)
+  if cake.system.isWindows():
+    from cake.library.compilers.gcc import prefetchMinGWCompiler
+    prefetchMinGWCompiler(configuration=configuration)
+prefetched = []
+
+def createVariants(platform, architecture, compilerName, findCompiler):
+  """Declare the debug and release variants for a compiler.
+
+  The variants' tools are only created, and the compiler only searched
+  for, when a variant is selected for a build.
+  """
+  compilers = []
+  
+  def getCompiler():
+    # Share the compiler search between the debug and release variants.
+    if not compilers:
+      from cake.library.compilers import CompilerNotFoundError
+      try:
+        compilers.append(findCompiler())
+      except CompilerNotFoundError:
+        compilers.append(None)
+    return compilers[0]
+
+  def construct(variant):
+    compiler = getCompiler()
+    if compiler is None:
+      return False
+
+    target = variant.keywords["target"]
     variant.tools["env"] = env = EnvironmentTool(configuration=configuration)
     variant.tools["script"] = ScriptTool(configuration=configuration)
     variant.tools["logging"] = LoggingTool(configuration=configuration)
@@ -107,38 +144,53 @@ def createVariants(platform, architecture, compiler):
       for tool in variant.tools.itervalues():
         if not isinstance(tool, ProjectTool):
           tool.enabled = False
-              
+
+  for target in ["debug", "release"]:
+    variant = Variant(
+      platform=platform,
+      architecture=architecture,
+      compiler=compilerName,
+      target=target,
+      )
+    variant.factory = construct
     configuration.addVariant(variant)
 
 # Create Dummy Compiler.
-compiler = DummyCompiler(configuration=configuration)
-createVariants(platform, "none", compiler)
+def findDummy():
+  from cake.library.compilers.dummy import DummyCompiler
+  return DummyCompiler(configuration=configuration)
+createVariants(platform, "none", "dummy", findDummy)
 
 # Create GCC Compiler.
-try:
+def findGcc():
+  prefetchCompilers()
   from cake.library.compilers.gcc import findGccCompiler
   compiler = findGccCompiler(configuration=configuration)
   compiler.addLibrary("stdc++")
-  createVariants(platform, hostArchitecture, compiler)
-except CompilerNotFoundError:
-  pass
+  return compiler
+createVariants(platform, hostArchitecture, "gcc", findGcc)
 
 if cake.system.isWindows():
   # Create MinGW Compiler.
-  try:
+  def findMinGW():
+    prefetchCompilers()
     from cake.library.compilers.gcc import findMinGWCompiler
-    compiler = findMinGWCompiler(configuration=configuration)
-    createVariants(platform, hostArchitecture, compiler)
-  except CompilerNotFoundError:
-    pass
+    return findMinGWCompiler(configuration=configuration)
+  createVariants(platform, hostArchitecture, "mingw", findMinGW)
+
   # Create MSVC Compilers.
-  try:
+  def findMsvc(architecture):
+    prefetchCompilers()
     from cake.library.compilers.msvc import findMsvcCompiler
-    for architecture in ["x86", "amd64", "ia64"]:
-      compiler = findMsvcCompiler(configuration=configuration, architecture=architecture)
-      compiler.addDefine("WIN32")
-      if architecture in ["amd64", "ia64"]:
-        compiler.addDefine("WIN64")
-      createVariants(platform, architecture, compiler)
-  except CompilerNotFoundError:
-    pass
+    compiler = findMsvcCompiler(configuration=configuration, architecture=architecture)
+    compiler.addDefine("WIN32")
+    if architecture in ["amd64", "ia64"]:
+      compiler.addDefine("WIN64")
+    return compiler
+  for architecture in ["x86", "amd64", "ia64"]:
+    createVariants(
+      platform,
+      architecture,
+      "msvc",
+      lambda a=architecture: findMsvc(a),
+      )
@@ -0,0 +1,348 @@
+"""Coroutine Tasks.
+
+Allows a task to be written as a generator that yields whenever it needs
+to wait for something, rather than blocking a thread-pool thread while it
+waits. For example::
+
+  def copyFromCache(path, cachePath):
+    data = yield readFile(cachePath)
+    yield writeFile(path, data)
+    returnValue(len(data))
+
+  task = engine.createTask(lambda: copyFromCache(path, cachePath))
+
+A coroutine may yield any of the following:
+  - a L{Task}, resuming with the task's result once it has completed;
+  - an L{AsyncResult}, resuming with its result once available;
+  - a L{Target}, resuming with the target once it has been built;
+  - a list or tuple of the above, resuming with a list of their results
+    once they have all completed.
+
+If a yielded task fails then an exception is thrown into the coroutine at
+the point of the yield.
+
+Each step of the coroutine between yields runs as a separate task on the
+thread pool. While the coroutine is waiting no thread is in use, so many
+thousands of coroutines can be waiting on I/O at once.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import types
+import threading
+
+from cake.task import Task, TaskError
+from cake.async import AsyncResult, getResult
+from cake.target import Target
+
+class CoroutineReturn(Exception):
+  """Exception used to return a value from a coroutine.
+
+  @see: L{returnValue()}
+  """
+
+  def __init__(self, value):
+    Exception.__init__(self, value)
+    self.value = value
+
+def returnValue(value):
+  """Return a value from a coroutine.
+
+  Generators can't use 'return' with a value so coroutines should call
+  this function instead.
+  """
+  raise CoroutineReturn(value)
+
+def isCoroutine(value):
+  """Returns True if the value is a coroutine that can be run with run().
+  """
+  return isinstance(value, types.GeneratorType)
+
+def run(coroutine, taskFactory=Task, failureType=TaskError):
+  """Run a coroutine until it returns.
+
+  The coroutine runs up to its first yield on the calling thread.
+
+  @param coroutine: The generator to run.
+  @type coroutine: generator
+
+  @param taskFactory: The function used to create the task for each step
+  of the coroutine.
+  @type taskFactory: any callable
+
+  @param failureType: The type of exception thrown into the coroutine
+  when a task it is waiting on fails.
+  @type failureType: type
+
+  @return: A task whose result is the value returned by the coroutine.
+  Returning this task from a task function makes that task complete with
+  the coroutine's result.
+  @rtype: L{Task}
+  """
+  c = _Coroutine(coroutine, taskFactory, failureType)
+  c.step(None, None)
+  return c.doneTask
+
+def _getWaitTask(value):
+  """Return a task that completes once the yielded value is available.
+  """
+  if isinstance(value, Task):
+    return value
+  elif isinstance(value, (AsyncResult, Target)):
+    return value.task
+  elif isinstance(value, (list, tuple)):
+    tasks = []
+    for v in value:
+      task = _getWaitTask(v)
+      if task is not None:
+        tasks.append(task)
+    if not tasks:
+      return None
+    task = Task()
+    task.startAfter(tasks)
+    return task
+  elif value is None:
+    return None
+  else:
+    raise TypeError("Coroutines can't yield %r" % (value,))
+
+def _getYieldResult(value):
+  """Return the value sent back to the coroutine for a yielded value.
+  """
+  if isinstance(value, Task):
+    return value.result
+  elif isinstance(value, AsyncResult):
+    return getResult(value)
+  elif isinstance(value, (list, tuple)):
+    return [_getYieldResult(v) for v in value]
+  else:
+    return value
+
+class _Coroutine(object):
+  """Drives a coroutine from one yield to the next.
+  """
+
+  def __init__(self, coroutine, taskFactory, failureType):
+    self.coroutine = coroutine
+    self.taskFactory = taskFactory
+    self.failureType = failureType
+    self.value = None
+    # Completes with the coroutine's return value. Each step is a separate
+    # task rather than each returning the next, so a long running coroutine
+    # doesn't build up a chain of tasks that must complete recursively.
+    self.doneTask = Task(lambda: self.value)
+
+  def step(self, yielded, waitTask):
+    """Resume the coroutine now the value it yielded is available.
+    """
+    try:
+      if waitTask is not None and waitTask.failed:
+        yielded = self.coroutine.throw(self.failureType())
+      else:
+        yielded = self.coroutine.send(_getYieldResult(yielded))
+    except CoroutineReturn, e:
+      self._finish(e.value)
+      return
+    except StopIteration:
+      self._finish(None)
+      return
+
+    try:
+      waitTask = _getWaitTask(yielded)
+    except TypeError:
+      self.coroutine.close()
+      raise
+
+    stepTask = self.taskFactory(lambda: self.step(yielded, waitTask))
+    stepTask.addCallback(lambda: self._onStepComplete(stepTask))
+    if waitTask is None:
+      stepTask.start()
+    else:
+      # Make sure lazily started tasks are executed.
+      waitTask._require()
+      waitTask.addCallback(stepTask.start)
+
+  def _finish(self, value):
+    self.value = value
+    self.doneTask.start(immediate=True)
+
+  def _onStepComplete(self, stepTask):
+    if stepTask.failed:
+      try:
+        self.doneTask.cancel()
+      except TaskError:
+        pass # Already completed
+
+_ioLoop = None
+_ioLoopLock = threading.Lock()
+
+def _getIoLoop():
+  global _ioLoop
+  if _ioLoop is None:
+    _ioLoopLock.acquire()
+    try:
+      if _ioLoop is None:
+        _ioLoop = _IoLoop()
+    finally:
+      _ioLoopLock.release()
+  return _ioLoop
+
+class _IoLoop(object):
+  """Completes tasks when file descriptors become ready for I/O.
+  """
+
+  def __init__(self):
+    # Only needed by coroutines that wait on file descriptors.
+    import cake.reactor
+    if not cake.reactor.isSupported():
+      raise EnvironmentError("Waiting on file descriptors is not supported on this platform.")
+
+    self._lock = threading.Lock()
+    self._waiting = {}
+    self._added = []
+    self._poller = cake.reactor._Poller()
+    self._wakeRead, self._wakeWrite = os.pipe()
+    cake.reactor._setCloseOnExec(self._wakeRead)
+    cake.reactor._setCloseOnExec(self._wakeWrite)
+    self._poller.register(self._wakeRead)
+
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def wait(self, fd, write):
+    task = Task()
+    self._lock.acquire()
+    try:
+      self._added.append((fd, write, task))
+    finally:
+      self._lock.release()
+    os.write(self._wakeWrite, "x")
+    return task
+
+  def _run(self):
+    poller = self._poller
+    waiting = self._waiting
+    while True:
+      self._lock.acquire()
+      try:
+        added = self._added
+        self._added = []
+      finally:
+        self._lock.release()
+
+      for fd, write, task in added:
+        try:
+          poller.register(fd, write)
+        except EnvironmentError:
+          # Let the task find out about the bad fd when it does the I/O.
+          task.start(immediate=True)
+          continue
+        waiting[fd] = task
+
+      for fd in poller.poll(None):
+        if fd == self._wakeRead:
+          os.read(fd, 4096)
+          continue
+
+        task = waiting.pop(fd, None)
+        if task is not None:
+          poller.unregister(fd)
+          task.start(immediate=True)
+
+def waitForRead(fd):
+  """Wait for a file descriptor to become readable.
+
+  Only supported on platforms where L{cake.reactor.isSupported()} is True.
+
+  @param fd: The file descriptor or an object with a fileno() method such
+  as a socket.
+
+  @return: A task that completes once the file descriptor is readable.
+  @rtype: L{Task}
+  """
+  if not isinstance(fd, (int, long)):
+    fd = fd.fileno()
+  return _getIoLoop().wait(fd, write=False)
+
+def waitForWrite(fd):
+  """Wait for a file descriptor to become writable.
+
+  Only supported on platforms where L{cake.reactor.isSupported()} is True.
+
+  @param fd: The file descriptor or an object with a fileno() method such
+  as a socket.
+
+  @return: A task that completes once the file descriptor is writable.
+  @rtype: L{Task}
+  """
+  if not isinstance(fd, (int, long)):
+    fd = fd.fileno()
+  return _getIoLoop().wait(fd, write=True)
+
+_ioThreadPool = None
+_ioThreadPoolLock = threading.Lock()
+
+ioThreadCount = 4
+"""The number of threads used to perform blocking file I/O for coroutines.
+"""
+
+def _getIoThreadPool():
+  global _ioThreadPool
+  if _ioThreadPool is None:
+    _ioThreadPoolLock.acquire()
+    try:
+      if _ioThreadPool is None:
+        import cake.threadpool
+        _ioThreadPool = cake.threadpool.ThreadPool(ioThreadCount)
+    finally:
+      _ioThreadPoolLock.release()
+  return _ioThreadPool
+
+def runIo(func):
+  """Run a blocking I/O function on the I/O thread pool.
+
+  Regular files can't be waited on with poll so blocking file operations
+  are performed by a small dedicated pool of threads. This keeps the main
+  thread pool free for compute work.
+
+  @param func: The function to run.
+  @type func: any callable
+
+  @return: A task whose result is the return value of the function.
+  @rtype: L{Task}
+  """
+  task = Task(func)
+  task.start(threadPool=_getIoThreadPool())
+  return task
+
+def readFile(path):
+  """Read the contents of a file without blocking the thread pool.
+
+  @return: A task whose result is the contents of the file.
+  @rtype: L{Task}
+  """
+  def read():
+    f = open(path, "rb")
+    try:
+      return f.read()
+    finally:
+      f.close()
+  return runIo(read)
+
+def writeFile(path, data):
+  """Write the contents of a file without blocking the thread pool.
+
+  @return: A task that completes once the file has been written.
+  @rtype: L{Task}
+  """
+  def write():
+    f = open(path, "wb")
+    try:
+      f.write(data)
+    finally:
+      f.close()
+  return runIo(write)
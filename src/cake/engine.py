@@ -12,6 +12,7 @@ import sys
 import os
 import os.path
 import time
+import weakref
 
 import math
 try:
@@ -21,6 +22,8 @@ except ImportError:
 
 import cake.bytecode
 import cake.task
+import cake.coroutine
+import cake.graph
 import cake.path
 import cake.hash
 import cake.filesys
@@ -54,6 +57,21 @@ class Variant(object):
   @type: string or None
   """
   
+  factory = None
+  """Function used to construct this variant's tools before it is used for the first time.
+  
+  The function is called with the variant as its only argument once the
+  variant matches the keywords passed to L{Configuration.findAllVariants()}
+  or L{Configuration.findVariant()}. The variant's construction script is
+  still only run when a script is first executed with the variant. This
+  allows a config script to declare
+  many variants without creating their tools or searching for their
+  compilers until they are needed. The function may return False if the
+  variant can't be used, eg. because its compiler wasn't found, in which
+  case the variant will never be selected.
+  @type: callable or None
+  """
+  
   def __init__(self, **keywords):
     """Construct an empty variant.
     """
@@ -61,6 +79,8 @@ class Variant(object):
     self.tools = {}
     self._constructionLock = threading.Lock()
     self._isConstructed = False
+    self._isCreated = False
+    self._isAvailable = True
   
   def __repr__(self):
     keywords = ", ".join('%s=%r' % (k, v) for k, v in self.keywords.iteritems())
@@ -74,16 +94,41 @@ class Variant(object):
     """
     return self.keywords[key]
   
+  def _create(self):
+    """Call the variant's factory if it hasn't been called yet.
+    
+    @return: True if the variant is available.
+    @rtype: bool
+    """
+    # Do an initial check without acquiring the lock (which is slow).
+    if self._isCreated:
+      return self._isAvailable
+    
+    self._constructionLock.acquire()
+    try:
+      # Check again in case someone else got here first.
+      if not self._isCreated:
+        if self.factory is not None:
+          if self.factory(self) is False:
+            self._isAvailable = False
+        self._isCreated = True
+    finally:
+      self._constructionLock.release()
+    
+    return self._isAvailable
+  
   def _construct(self, configuration):
     # Do an initial check without acquiring the lock (which is slow).
     if self._isConstructed:
-      return
+      return self._isAvailable
+    
+    self._create()
     
     self._constructionLock.acquire()
     try:
       # Check again in case someone else got here first.
       if not self._isConstructed:
-        if self.constructionScriptPath is not None:
+        if self._isAvailable and self.constructionScriptPath is not None:
           script = _Script(
             path=self.constructionScriptPath,
             configuration=configuration,
@@ -95,6 +140,8 @@ class Variant(object):
         self._isConstructed = True
     finally:
       self._constructionLock.release()
+    
+    return self._isAvailable
 
   def matches(*args, **keywords):
     """Query if this variant matches the specified keywords.
@@ -130,17 +177,22 @@ class Variant(object):
     newKeywords.update(keywords)
     v = Variant(**newKeywords)
     v.tools = dict((name, tool.clone()) for name, tool in self.tools.iteritems())
+    if not self._isCreated:
+      # Let the copy create its own tools when it is first used.
+      v.factory = self.factory
     return v
 
 class Engine(object):
   """Main object that holds all of the singleton resources for a build.
   
-  @ivar scriptThreadPool: The scriptThreadPool is a single-threaded thread
-  pool that is used to speed up incremental builds on multi-core platforms.
-  It is used to execute scripts and check dependencies, both of which
-  mainly use Python code. Threaded Python code executes under a
+  @ivar scriptThreadPool: The scriptThreadPool is a thread pool, single-threaded
+  by default, that is used to speed up incremental builds on multi-core
+  platforms. It is used to execute scripts and check dependencies, both of
+  which mainly use Python code. Threaded Python code executes under a
   notoriously slow GIL (Global Interpreter Lock). By executing most
-  Python code on the same thread we can avoid the expensive GIL locking.  
+  Python code on the same thread we can avoid the expensive GIL locking.
+  Builds that spend much of their script time waiting on the file system
+  may benefit from more threads, see L{scriptThreadCount}.
   @type scriptThreadPool: L{ThreadPool}
 
   @ivar logger: The object used to output build messages.
@@ -167,6 +219,14 @@ class Engine(object):
   script files themselves with a different extension (usually .cakec).
   @type: string or None
   """
+  byteCodeCachePath = None
+  """Path to a single file that caches the byte code of all scripts.
+  
+  If set then the byte code of every script is stored in this one file
+  rather than a separate cache file per script, see
+  L{cake.bytecode.ByteCodeCache}. Takes precedence over L{scriptCachePath}.
+  @type: string or None
+  """
   dependencyInfoPath = None
   """Path to store dependency info files.
   
@@ -176,19 +236,93 @@ class Engine(object):
   @type: string or None
   """
   
+  graphCachePath = None
+  """Path to the file that caches the build graph.
+  
+  If set then a record of what each script did is stored in this file
+  and scripts that haven't changed are replayed rather than executed on
+  the next build, see L{cake.graph}.
+  @type: string or None
+  """
+  graphCacheReplay = True
+  """Whether unchanged scripts may be replayed from the graph cache.
+  
+  If False then every script is executed but the graph cache is still
+  updated.
+  @type: bool
+  """
+  
+  probeCachePath = None
+  """Path to the file that caches the results of toolchain probes.
+  
+  If None the results of probes, eg. running a compiler to find its
+  version, are only cached for the duration of the build, see
+  L{cake.probe}.
+  @type: string or None
+  """
+  
+  processReactor = None
+  """The reactor used to run external processes asynchronously.
+  
+  If set then tools may launch processes through this reactor so that
+  waiting for a process to finish doesn't block a worker thread. If None
+  then processes are run and waited on by the worker thread that
+  launched them.
+  @type: L{cake.reactor.ProcessReactor} or None
+  """
+  
+  scriptThreadCount = 1
+  """The number of threads used to execute scripts and check dependencies.
+  
+  Must be set before the L{scriptThreadPool} is first used.
+  @type: int
+  """
+  
   forceBuild = False
   defaultConfigScriptName = "config.cake"
   maximumErrorCount = None
   
+  failFast = False
+  """Abort the build as soon as the maximum error count is reached.
+  
+  If True then once L{maximumErrorCount} errors have been reported all
+  tasks that have been started but have not yet begun executing are
+  cancelled and any running processes are terminated. Otherwise each
+  pending task fails individually as it is dequeued.
+  @type: bool
+  """
+  
+  boundedMemory = False
+  """Release state that is no longer needed as the build progresses.
+  
+  If True then script targets replace their list of targets with compact
+  path records once they have been built. Use together with
+  L{cake.task.setReleaseCompleted()} to bound memory usage on very large
+  builds.
+  @type: bool
+  """
+  
   def __init__(self, logger, parser, args):
     """Default Constructor.
     """
     self._byteCodeCache = {}
+    self._consolidatedByteCodeCache = None
     self._timestampCache = {}
     self._digestCache = {}
     self._searchUpCache = {}
     self._configurations = {}
-    self.scriptThreadPool = cake.threadpool.ThreadPool(1)
+    self._scriptThreadPool = None
+    self._scriptThreadPoolLock = threading.Lock()
+    self._byteCodeLock = threading.Lock()
+    self._graphCache = None
+    self._graphCacheLock = threading.Lock()
+    self._probeCache = None
+    self._probeCacheLock = threading.Lock()
+    self._objectCaches = {}
+    self._objectCachesLock = threading.Lock()
+    self._remoteCaches = {}
+    self._cacheStatistics = None
+    self._cacheStoreQueue = None
     self.errors = []
     self.warnings = []
     self.failedTargets = []
@@ -199,6 +333,101 @@ class Engine(object):
     self.oscwd = os.getcwd() # Save original cwd in case someone changes it.
     self.buildSuccessCallbacks = []
     self.buildFailureCallbacks = []
+    self.aborted = False
+    self.skippedCount = 0
+    self._abortLock = threading.Lock()
+    self._pendingTasks = weakref.WeakKeyDictionary()
+    self._processes = set()
+
+  @property
+  def scriptThreadPool(self):
+    pool = self._scriptThreadPool
+    if pool is None:
+      self._scriptThreadPoolLock.acquire()
+      try:
+        pool = self._scriptThreadPool
+        if pool is None:
+          pool = cake.threadpool.ThreadPool(max(1, self.scriptThreadCount))
+          self._scriptThreadPool = pool
+      finally:
+        self._scriptThreadPoolLock.release()
+    return pool
+
+  @property
+  def cacheStatistics(self):
+    """The statistics of the object caches used by the build.
+    @type: L{cake.cachestats.CacheStatistics}
+    """
+    stats = self._cacheStatistics
+    if stats is None:
+      self._objectCachesLock.acquire()
+      try:
+        stats = self._cacheStatistics
+        if stats is None:
+          import cake.cachestats
+          stats = cake.cachestats.CacheStatistics()
+          self._cacheStatistics = stats
+      finally:
+        self._objectCachesLock.release()
+    return stats
+
+  @property
+  def cacheStoreQueue(self):
+    """The queue of outputs waiting to be stored in action caches.
+    @type: L{cake.actioncache.StoreQueue}
+    """
+    storeQueue = self._cacheStoreQueue
+    if storeQueue is None:
+      self._objectCachesLock.acquire()
+      try:
+        storeQueue = self._cacheStoreQueue
+        if storeQueue is None:
+          import cake.actioncache
+          storeQueue = cake.actioncache.StoreQueue(logger=self.logger)
+          self._cacheStoreQueue = storeQueue
+      finally:
+        self._objectCachesLock.release()
+    return storeQueue
+
+  @property
+  def graphCache(self):
+    """The graph cache or None if L{graphCachePath} isn't set.
+    
+    @type: L{cake.graph.GraphCache} or None
+    """
+    if self.graphCachePath is None:
+      return None
+    
+    graphCache = self._graphCache
+    if graphCache is None:
+      self._graphCacheLock.acquire()
+      try:
+        graphCache = self._graphCache
+        if graphCache is None:
+          graphCache = cake.graph.GraphCache(self, self.graphCachePath)
+          self._graphCache = graphCache
+      finally:
+        self._graphCacheLock.release()
+    return graphCache
+
+  @property
+  def probeCache(self):
+    """The cache used for the results of toolchain probes.
+    
+    @type: L{cake.probe.ProbeCache}
+    """
+    probeCache = self._probeCache
+    if probeCache is None:
+      self._probeCacheLock.acquire()
+      try:
+        probeCache = self._probeCache
+        if probeCache is None:
+          import cake.probe
+          probeCache = cake.probe.ProbeCache(self.probeCachePath)
+          self._probeCache = probeCache
+      finally:
+        self._probeCacheLock.release()
+    return probeCache
 
   @property
   def errorCount(self):
@@ -207,6 +436,92 @@ class Engine(object):
   @property
   def warningCount(self):
     return len(self.warnings)
+
+  def registerProcess(self, process):
+    """Register a running process so it can be terminated if the build
+    is aborted.
+    
+    @param process: The running process.
+    @type process: C{subprocess.Popen}
+    """
+    self._abortLock.acquire()
+    try:
+      self._processes.add(process)
+    finally:
+      self._abortLock.release()
+
+  def unregisterProcess(self, process):
+    """Unregister a process previously registered with registerProcess().
+    
+    @param process: The process that has finished running.
+    @type process: C{subprocess.Popen}
+    """
+    self._abortLock.acquire()
+    try:
+      self._processes.discard(process)
+    finally:
+      self._abortLock.release()
+
+  def _checkErrorLimit(self):
+    """Abort the build if fail-fast is enabled and we've hit the error limit.
+    """
+    if (self.failFast and self.maximumErrorCount and
+        self.errorCount >= self.maximumErrorCount):
+      self.abort()
+
+  def abort(self):
+    """Abort the build.
+    
+    Cancels all tasks that have been started but have not begun executing
+    and terminates any running processes. Tasks waiting on cancelled tasks
+    will fail as a result.
+    
+    Only the first call has any effect.
+    """
+    self._abortLock.acquire()
+    try:
+      if self.aborted:
+        return
+      self.aborted = True
+      pendingTasks = self._pendingTasks.keys()
+      self._pendingTasks.clear()
+      processes = list(self._processes)
+    finally:
+      self._abortLock.release()
+
+    self.logger.outputError(
+      "cake: Maximum error count reached, aborting build.\n"
+      )
+
+    cancelled = 0
+    for task in pendingTasks:
+      # Tasks that haven't been started yet will fail when executed.
+      if not task.started:
+        continue
+      try:
+        task.cancel()
+        cancelled += 1
+      except cake.task.TaskError:
+        pass # Completed in the meantime
+
+    if self.processReactor is not None:
+      # Processes still queued in the reactor never get to run.
+      cancelled += self.processReactor.pendingCount
+      self.processReactor.terminateAll()
+    self._addSkipped(cancelled)
+
+    for process in processes:
+      try:
+        process.terminate()
+      except EnvironmentError:
+        pass # Already exited
+
+  def _addSkipped(self, count):
+    self._abortLock.acquire()
+    try:
+      self.skippedCount += count
+    finally:
+      self._abortLock.release()
   
   def searchUpForFile(self, path, fileName):
     """Attempt to find a file in a particular path or any of its parent
@@ -399,6 +714,88 @@ class Engine(object):
     """    
     self.buildSuccessCallbacks.append(callback)
   
+  def addObjectCache(self, path, maximumSize):
+    """Record that objects were added to an object cache.
+    
+    Caches that have a maximum size are trimmed in a background process
+    once the build has succeeded, see L{cake.objectcache.startTrim()}.
+    
+    @param path: The absolute path of the object cache.
+    @type path: string
+    @param maximumSize: The maximum size of the cache in bytes or None
+    if it has no maximum size.
+    @type maximumSize: int or None
+    """
+    self._objectCachesLock.acquire()
+    try:
+      if path in self._objectCaches:
+        return
+      self._objectCaches[path] = maximumSize
+    finally:
+      self._objectCachesLock.release()
+    
+    if maximumSize is not None:
+      def trim():
+        import cake.objectcache
+        cake.objectcache.startTrim(path, maximumSize)
+      self.addBuildSuccessCallback(trim)
+  
+  def getRemoteCache(self, path, location):
+    """Return the remote level of an object cache.
+    
+    @param path: The absolute path of the local object cache.
+    @type path: string
+    @param location: The location of the remote cache, see
+    L{cake.remotecache.createStore()}.
+    @type location: string
+    
+    @return: The remote cache, shared by all compilers using the same
+    local and remote caches.
+    @rtype: L{cake.remotecache.RemoteCache}
+    
+    @raise ValueError: If the location is invalid.
+    """
+    key = (path, location)
+    self._objectCachesLock.acquire()
+    try:
+      remoteCache = self._remoteCaches.get(key, None)
+      if remoteCache is None:
+        import cake.remotecache
+        remoteCache = cake.remotecache.RemoteCache(
+          path,
+          cake.remotecache.createStore(location),
+          self.logger,
+          )
+        self._remoteCaches[key] = remoteCache
+    finally:
+      self._objectCachesLock.release()
+    return remoteCache
+  
+  def flushCacheStores(self):
+    """Wait for outputs queued to be stored in action caches.
+
+    Should be called once the build has finished, before the object
+    caches are trimmed.
+    """
+    self._objectCachesLock.acquire()
+    try:
+      storeQueue = self._cacheStoreQueue
+    finally:
+      self._objectCachesLock.release()
+    if storeQueue is not None:
+      storeQueue.flush()
+
+  def flushRemoteCaches(self):
+    """Wait for remote object caches to finish their uploads.
+    """
+    self._objectCachesLock.acquire()
+    try:
+      remoteCaches = self._remoteCaches.values()
+    finally:
+      self._objectCachesLock.release()
+    for remoteCache in remoteCaches:
+      remoteCache.flush()
+  
   def addBuildFailureCallback(self, callback):
     """Register a callback to be run if the build fails.
     
@@ -426,6 +823,10 @@ class Engine(object):
     the stacktrace and exception details if an exception is raised by the
     function.
     
+    If the function returns a generator then the generator is run as a
+    coroutine (see L{cake.coroutine}) and the task completes with the
+    coroutine's return value once it has finished.
+    
     @param func: The function that will be called with no args by the task once
     the task has been started.
     @type func: any callable
@@ -441,10 +842,17 @@ class Engine(object):
     currentScript = _Script.getCurrent()
     
     def _wrapper():
+      if self.failFast:
+        self._abortLock.acquire()
+        try:
+          self._pendingTasks.pop(task, None)
+        finally:
+          self._abortLock.release()
+
       if self.maximumErrorCount and self.errorCount >= self.maximumErrorCount:
-        # TODO: Output some sort of message saying the build is being terminated
-        # because of too many errors. But only output it once. Perhaps just set
-        # a flag and check that in the runner.
+        if self.aborted:
+          # Only tasks stopped by a fail-fast abort count as skipped.
+          self._addSkipped(1)
         raise BuildError()
       
       try:
@@ -452,7 +860,16 @@ class Engine(object):
         oldScript = _Script.getCurrent()
         _Script._current.value = currentScript
         try:
-          return func()
+          result = func()
+          if cake.coroutine.isCoroutine(result):
+            # Drive generator functions as coroutines, the task completes
+            # once the coroutine returns.
+            result = cake.coroutine.run(
+              result,
+              taskFactory=self.createTask,
+              failureType=BuildError,
+              )
+          return result
         finally:
           _Script._current.value = oldScript
       except BuildError:
@@ -477,10 +894,20 @@ class Engine(object):
           message += "Pass '--debug=stack' if you require a more complete stack trace.\n"
         self.logger.outputError(message)
         self.errors.append(message)
+        self._checkErrorLimit()
         raise
 
     task = cake.task.Task(_wrapper)
 
+    if self.failFast:
+      # Track the task so it can be cancelled if the build is aborted
+      # before it begins executing.
+      self._abortLock.acquire()
+      try:
+        self._pendingTasks[task] = None
+      finally:
+        self._abortLock.release()
+
     # Set a traceback for the parent script task
     if self.logger.debugEnabled("stack"):    
       if currentScript is not None:
@@ -503,6 +930,7 @@ class Engine(object):
       append = self.failedTargets.append
       for t in targets:
         append(t)
+    self._checkErrorLimit()
     raise BuildError(message)
     
   def getByteCode(self, path, cached=True):
@@ -520,7 +948,28 @@ class Engine(object):
     @rtype: C{types.CodeType}
     """
     byteCode = self._byteCodeCache.get(path, None)
-    if byteCode is None:
+    if byteCode is not None:
+      return byteCode
+
+    # Scripts may be executed on several threads at once. Make sure two
+    # threads don't write the same cache file at the same time.
+    self._byteCodeLock.acquire()
+    try:
+      return self._loadByteCode(path, cached)
+    finally:
+      self._byteCodeLock.release()
+
+  def _loadByteCode(self, path, cached):
+    byteCode = self._byteCodeCache.get(path, None)
+    if byteCode is None and cached and self.byteCodeCachePath is not None:
+      if self._consolidatedByteCodeCache is None:
+        cake.filesys.makeDirs(cake.path.dirName(self.byteCodeCachePath))
+        self._consolidatedByteCodeCache = cake.bytecode.ByteCodeCache(
+          self.byteCodeCachePath
+          )
+      byteCode = self._consolidatedByteCodeCache.loadCode(path)
+      self._byteCodeCache[path] = byteCode
+    elif byteCode is None:
       # Cache the code in a user-supplied directory if provided.
       if self.scriptCachePath is not None:
         assert cake.path.isAbs(path) # Need an absolute path to get a unique hash.
@@ -771,6 +1220,7 @@ class Configuration(object):
     self.baseDir = self.dir
     self.scriptGlobals = {}
     self._variants = {}
+    self._variantIndex = {}
     self._executed = {}
     self._executedLock = threading.Lock()
   
@@ -812,18 +1262,60 @@ class Configuration(object):
       raise KeyError("Already added variant with these keywords: %r" % variant)
     
     self._variants[key] = variant
+    
+    index = self._variantIndex
+    for name, value in variant.keywords.iteritems():
+      index.setdefault(name, {}).setdefault(value, set()).add(key)
+
+  def _findCandidateVariants(self, keywords):
+    """Use the keyword index to find the variants that may match the keywords.
+    
+    The variants returned still need to be checked with L{Variant.matches()}.
+    """
+    index = self._variantIndex
+    candidates = None
+    for name, value in keywords.iteritems():
+      if isinstance(value, basestring):
+        if value == "all":
+          continue
+        matches = index.get(name, {}).get(value, ())
+      elif isinstance(value, (list, tuple)):
+        if not all(isinstance(v, basestring) for v in value):
+          continue # None matches variants without the keyword.
+        valueIndex = index.get(name, {})
+        matches = set()
+        for v in value:
+          matches.update(valueIndex.get(v, ()))
+      else:
+        continue
+      
+      if candidates is None:
+        candidates = set(matches)
+      else:
+        candidates.intersection_update(matches)
+      if not candidates:
+        return []
+
+    if candidates is None:
+      return self._variants.values()
+    else:
+      variants = self._variants
+      return [variants[key] for key in candidates]
 
   def findAllVariants(self, keywords={}):
     """Find all variants that match the specified keywords.
     
+    The factories of matching variants are called when they are first
+    matched, see L{Variant.factory}.
+    
     @param keywords: A collection of keywords to match against.
     @type keywords: dictionary of string -> string or list of string
     
     @return: Sequence of Variant objects that match the keywords.
     @rtype: sequence of L{Variant}
     """
-    for variant in self._variants.itervalues():
-      if variant.matches(**keywords):
+    for variant in self._findCandidateVariants(keywords):
+      if variant.matches(**keywords) and variant._create():
         yield variant
   
   def findVariant(self, keywords, baseVariant=None):
@@ -849,14 +1341,19 @@ class Configuration(object):
     else:
       results = []
       getBaseValue = baseVariant.keywords.get
-      for variant in self.findAllVariants(keywords):
+      for variant in self._findCandidateVariants(keywords):
+        if not variant.matches(**keywords):
+          continue
         for key, value in variant.keywords.iteritems():
           if key not in keywords:
+            # Keywords that aren't specified must match the base variant.
             baseValue = getBaseValue(key, None)
             if value != baseValue:
               break
         else:
           results.append(variant)
+      # Only create the variants that were selected.
+      results = [v for v in results if v._create()]
     
     if not results:
       raise LookupError("No variants matched criteria.")
@@ -901,6 +1398,8 @@ class Configuration(object):
     # Make sure the variant is constructed and ready for use.  
     variant._construct(self)
     
+    graphCache = self.engine.graphCache
+    
     self._executedLock.acquire()
     try:
       script = self._executed.get(key, None)
@@ -918,7 +1417,10 @@ class Configuration(object):
             "script",
             "Executing %s\n" % script.path,
             )
-          script.execute()
+          if graphCache is not None:
+            graphCache.execute(script)
+          else:
+            script.execute()
         task = self.engine.createTask(execute)
         script = _Script(
           path=path,
@@ -929,6 +1431,8 @@ class Configuration(object):
           engine=self.engine,
           )
         self._executed[key] = script
+        if graphCache is not None:
+          graphCache.onScriptCreated(script)
         task.addCallback(
           lambda: self.engine.logger.outputDebug(
             "script",
@@ -939,6 +1443,9 @@ class Configuration(object):
     finally:
       self._executedLock.release()
 
+    if currentScript is not None and currentScript.root._graphRecord is not None:
+      currentScript.root._graphRecord.addScript(script)
+
     return script
 
   def createDependencyInfo(self, targets, args, dependencies, calculateDigests=False):
@@ -993,6 +1500,12 @@ class Configuration(object):
     to date.
     @rtype: tuple of (L{DependencyInfo} or None, string or None)
     """
+    currentRoot = _Script.getCurrentRoot()
+    if currentRoot is not None and currentRoot._graphRecord is not None:
+      currentRoot._graphRecord.actions.append((self.abspath(targetPath), args))
+    return self._checkDependencyInfo(targetPath, args)
+
+  def _checkDependencyInfo(self, targetPath, args, getTimestamp=None):
     abspath = self.abspath
     absTargetPath = abspath(targetPath)
     try:
@@ -1011,7 +1524,8 @@ class Configuration(object):
       if not isFile(abspath(target)):
         return dependencyInfo, "'" + target + "' doesn't exist"
     
-    getTimestamp = self.engine.getTimestamp
+    if getTimestamp is None:
+      getTimestamp = self.engine.getTimestamp
     paths = dependencyInfo.depPaths
     timestamps = dependencyInfo.depTimestamps
     assert len(paths) == len(timestamps)
@@ -8,10 +8,18 @@
 import shutil
 import os
 import os.path
+import sys
 import time
 
 import cake.path
 
+_blockSize = 1024 * 1024
+
+# ioctl request that clones a file's data blocks (Linux, see ioctl_ficlone(2)).
+_FICLONE = 0x40049409
+
+_copyFileRange = None
+
 def toUtc(timestamp):
   """Convert a timestamp from local time-zone to UTC.
   """
@@ -98,6 +106,79 @@ def copyFile(source, target):
   """
   shutil.copyfile(source, target)
 
+def cloneFile(source, target):
+  """Copy a file from source path to target path without reading it into
+  memory.
+  
+  On Linux the target shares the source's data blocks if the file system
+  supports reflinks, otherwise the data is copied by the kernel with
+  copy_file_range(). Elsewhere the file is copied a block at a time.
+  
+  @param source: The path of the source file.
+  @type source: string
+  @param target: The path of the target file.
+  @type target: string
+  """
+  s = open(source, "rb")
+  try:
+    t = open(target, "wb")
+    try:
+      if not _kernelCopy(s.fileno(), t.fileno()):
+        s.seek(0)
+        t.seek(0)
+        t.truncate()
+        shutil.copyfileobj(s, t, _blockSize)
+    finally:
+      t.close()
+  finally:
+    s.close()
+
+def _kernelCopy(sourceFd, targetFd):
+  """Try to copy a file within the kernel.
+  
+  @return: True if the file was copied, False if it should be copied
+  some other way.
+  """
+  if not sys.platform.startswith("linux"):
+    return False
+  
+  import fcntl
+  try:
+    fcntl.ioctl(targetFd, _FICLONE, sourceFd)
+    return True
+  except EnvironmentError:
+    pass # Not supported by the file system.
+  
+  copyFileRange = _getCopyFileRange()
+  if copyFileRange is False:
+    return False
+  
+  size = os.fstat(sourceFd).st_size
+  copied = 0
+  while copied < size:
+    count = copyFileRange(sourceFd, None, targetFd, None, size - copied, 0)
+    if count <= 0:
+      return False # Eg. not supported across file systems.
+    copied += count
+  return True
+
+def _getCopyFileRange():
+  global _copyFileRange
+  if _copyFileRange is None:
+    try:
+      import ctypes
+      func = ctypes.CDLL(None, use_errno=True).copy_file_range
+      func.argtypes = [
+        ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_size_t, ctypes.c_uint,
+        ]
+      func.restype = ctypes.c_ssize_t
+      _copyFileRange = func
+    except (ImportError, AttributeError, EnvironmentError):
+      _copyFileRange = False # Needs glibc 2.27
+  return _copyFileRange
+
 def makeDirs(path):
   """Recursively create directories.
   
@@ -201,3 +282,19 @@ def writeFile(path, data):
     f.write(data)
   finally:
     f.close()
+
+def renameFile(source, target):
+  """Rename a file, replacing the target file if it exists.
+
+  The replacement is atomic on platforms that support it so readers
+  see either the old or the new file but never a partially written one.
+
+  @param source: The path of the file to rename.
+  @type source: string
+  @param target: The new path of the file.
+  @type target: string
+  """
+  if os.name == "nt" and os.path.isfile(target):
+    # os.rename() fails on Windows if the target exists.
+    os.remove(target)
+  os.rename(source, target)
@@ -0,0 +1,576 @@
+"""Build Graph Cache.
+
+Executing every build script, even when nothing has changed, is the
+largest fixed cost of an incremental build. The graph cache records what
+each script did the last time it was executed with a particular variant
+and on the next build replays that record instead of executing the script
+again.
+
+A recorded script is replayed only if:
+  - the script, the scripts it included and its config script are
+    unchanged;
+  - the directories it listed and the glob patterns it matched are
+    unchanged;
+  - every build action it performed is still up to date;
+  - none of its actions depend on files built by a script that will be
+    executed again, and it didn't read the results of such a script.
+
+Replaying a script restores its results and the targets it added to its
+default and named script targets. Scripts that perform build actions
+without dependency info (eg. copying files or running commands without
+targets) are always executed. Scripts that perform build actions
+without using Cake's tools should call L{markNotReplayable()}.
+
+Enable the graph cache by setting L{Engine.graphCachePath} in a config
+script.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+import sys
+import glob
+import threading
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+import cake.hash
+import cake.filesys
+import cake.version
+
+from cake.async import AsyncResult
+from cake.target import Target, FileTarget, DirectoryTarget
+from cake.script import Script, ScriptTarget
+
+_MAGIC = "CKGC"
+_VERSION = 1
+
+_volatileOptions = frozenset([
+  "outputVersion",
+  "listTargetsMode",
+  "forceBuild",
+  "debugComponents",
+  "quiet",
+  "jobs",
+  "useReactor",
+  "maximumErrorCount",
+  "failFast",
+  "scriptThreads",
+  "boundedMemory",
+  "noGraphCache",
+  ])
+"""Command line options that can't change what a script does.
+"""
+
+volatileEnvironment = set(["PWD", "OLDPWD", "SHLVL", "_"])
+"""Environment variables that can't change what a script does.
+
+Changing any other environment variable causes every script to be
+executed. Config scripts may add to this set if the environment contains
+variables that change between builds.
+"""
+
+def getScriptKey(script):
+  """Get the key that identifies the record of a script.
+
+  @param script: The root script.
+  @type script: L{Script}
+
+  @return: A tuple of the config script path, absolute script path
+  and variant keywords.
+  @rtype: tuple
+  """
+  configuration = script.configuration
+  absPath = os.path.normpath(configuration.abspath(script.path))
+  keywords = tuple(sorted(script.variant.keywords.items()))
+  return (configuration.path, absPath, keywords)
+
+def _normPath(path):
+  return os.path.normcase(os.path.normpath(path))
+
+def _getCurrentRecord():
+  root = Script.getCurrentRoot()
+  if root is not None:
+    return root._graphRecord
+  else:
+    return None
+
+def isRecording():
+  """Returns True if the currently executing script is being recorded.
+  """
+  return _getCurrentRecord() is not None
+
+def markNotReplayable(outputs=None):
+  """Prevent the currently executing script from being replayed.
+
+  Must be called by scripts or tools that perform build actions whose
+  dependencies aren't stored as dependency info.
+
+  @param outputs: The absolute paths of the files or directories the
+  actions may write to. If None then the outputs are unknown and no
+  scripts will be replayed on the next build.
+  @type outputs: list of string or None
+  """
+  record = _getCurrentRecord()
+  if record is not None:
+    record.replayable = False
+    if outputs is None:
+      record.knownOutputs = False
+    else:
+      record.outputs.extend(_normPath(p) for p in outputs)
+
+def recordListing(absPath):
+  """Record that the currently executing script listed a directory.
+  """
+  record = _getCurrentRecord()
+  if record is not None:
+    try:
+      mtime = os.stat(absPath).st_mtime
+    except EnvironmentError:
+      mtime = None
+    record.listings.append(("dir", absPath, mtime))
+
+def recordGlob(absPattern, paths):
+  """Record that the currently executing script matched a glob pattern.
+  """
+  record = _getCurrentRecord()
+  if record is not None:
+    record.listings.append(("glob", absPattern, sorted(paths)))
+
+def _stripTasks(value):
+  """Return a copy of a script result that can be pickled.
+
+  @raise TypeError: If the value contains a target or asynchronous
+  result that can't be stored.
+  """
+  if isinstance(value, FileTarget):
+    return FileTarget(value.path)
+  elif isinstance(value, DirectoryTarget):
+    return DirectoryTarget(value.path)
+  elif isinstance(value, Target):
+    raise TypeError("can't store %s" % type(value).__name__)
+  elif isinstance(value, AsyncResult):
+    if value.task is not None and not value.task.succeeded:
+      raise TypeError("result is not available")
+    return _stripTasks(value.result)
+  elif isinstance(value, list):
+    return [_stripTasks(v) for v in value]
+  elif isinstance(value, tuple):
+    return tuple(_stripTasks(v) for v in value)
+  elif isinstance(value, dict):
+    return dict((k, _stripTasks(v)) for k, v in value.iteritems())
+  else:
+    return value
+
+def _haveSucceeded(targets):
+  """Return True if all of the targets have been built successfully.
+  """
+  for target in targets:
+    task = target.task
+    if task is not None and not task.succeeded:
+      return False
+  return True
+
+class ScriptRecord(object):
+  """A record of what a script did when it was last executed.
+
+  @ivar key: The key of the script, see L{getScriptKey()}.
+  @ivar inputs: Maps the absolute path of each script and config script
+  the script depends on to a (timestamp, digest) tuple.
+  @ivar listings: The directories listed and glob patterns matched.
+  @ivar actions: A (target path, args) tuple for every dependency info
+  check performed by the script's actions.
+  @ivar scripts: The keys of other scripts that were executed.
+  @ivar resultScripts: The keys of scripts whose results were read.
+  @ivar results: The pickled results of the script.
+  @ivar targets: Maps each script target name that was built to a list
+  of the targets it contained.
+  @ivar outputs: The paths written to by actions without dependency info.
+  @ivar replayable: Whether the script can be replayed.
+  @ivar knownOutputs: Whether all of the paths written to by the script's
+  actions are known.
+  """
+
+  def __init__(self, key):
+    self.key = key
+    self.inputs = {}
+    self.listings = []
+    self.actions = []
+    self.scripts = set()
+    self.resultScripts = set()
+    self.results = None
+    self.targets = {}
+    self.outputs = []
+    self.replayable = True
+    self.knownOutputs = True
+
+  def addInput(self, engine, absPath):
+    """Record a script file that was executed.
+    """
+    if absPath not in self.inputs:
+      try:
+        self.inputs[absPath] = (
+          engine.getTimestamp(absPath),
+          engine.getFileDigest(absPath),
+          )
+      except EnvironmentError:
+        self.replayable = False
+
+  def addScript(self, script):
+    """Record another script that was executed.
+    """
+    self.scripts.add(getScriptKey(script))
+
+  def addResultScript(self, script):
+    """Record another script whose results were read.
+    """
+    self.resultScripts.add(getScriptKey(script))
+
+  def finish(self, script):
+    """Record the results and targets of a script once it has been built.
+    """
+    try:
+      self.results = pickle.dumps(_stripTasks(script._results), 2)
+    except Exception:
+      self.replayable = False
+
+    namedTargets = script.getNamedTargets()
+    if script._defaultTarget.task.succeeded:
+      namedTargets[None] = script._defaultTarget.targets
+    else:
+      namedTargets = {}
+    for name, targets in namedTargets.items():
+      if not _haveSucceeded(targets):
+        continue
+      entries = []
+      for target in targets:
+        if isinstance(target, FileTarget):
+          entries.append(("file", target.path))
+        elif isinstance(target, DirectoryTarget):
+          entries.append(("dir", target.path))
+        elif isinstance(target, ScriptTarget):
+          entries.append(("script", getScriptKey(target.script.root), target.name))
+        else:
+          self.replayable = False
+      self.targets[name] = entries
+
+class GraphCache(object):
+  """Records and replays the execution of build scripts.
+  """
+
+  def __init__(self, engine, path):
+    """Construct a graph cache.
+
+    @param engine: The engine the graph cache belongs to.
+    @type engine: L{Engine}
+    @param path: The path of the file the graph cache is stored in.
+    @type path: string
+    """
+    self.engine = engine
+    self.path = path
+    self._header = self._getHeader()
+    self._records = self._load()
+    self._recording = []
+    self._roots = set()
+    self._lock = threading.Lock()
+    self._replayable = None
+    self._disabled = not engine.graphCacheReplay or engine.forceBuild
+
+  def _getHeader(self):
+    # Anything that may change what every script does.
+    options = self.engine.options
+    if options is not None:
+      options = sorted(
+        (k, v) for k, v in vars(options).items()
+        if k not in _volatileOptions
+        )
+    environ = sorted(
+      (k, v) for k, v in os.environ.items()
+      if k not in volatileEnvironment
+      )
+    environ = cake.hash.sha1(repr(environ)).digest()
+    return (_VERSION, cake.version.__version__, sys.version, repr(options), environ)
+
+  def _load(self):
+    try:
+      data = cake.filesys.readFile(self.path)
+    except EnvironmentError:
+      return {}
+
+    if not data.startswith(_MAGIC):
+      return {}
+
+    try:
+      header, records = pickle.loads(data[len(_MAGIC):])
+    except Exception:
+      return {}
+
+    if header != self._header:
+      self.engine.logger.outputDebug(
+        "graph",
+        "Ignoring graph cache because the environment or options have changed\n",
+        )
+      return {}
+
+    return records
+
+  def save(self):
+    """Save the records of scripts that were executed successfully.
+
+    Should only be called once the build has succeeded.
+    """
+    records = self._records
+    for script, record in self._recording:
+      if script.task.succeeded:
+        record.finish(script)
+        # Script targets that weren't built this time are the same as
+        # last time if the script hasn't changed.
+        oldRecord = records.get(record.key, None)
+        if oldRecord is not None and oldRecord.inputs == record.inputs:
+          for name, entries in oldRecord.targets.items():
+            record.targets.setdefault(name, entries)
+        records[record.key] = record
+      else:
+        records.pop(record.key, None)
+
+    data = _MAGIC + pickle.dumps((self._header, records), 2)
+    tmpPath = self.path + ".tmp"
+    try:
+      cake.filesys.writeFile(tmpPath, data)
+      cake.filesys.renameFile(tmpPath, self.path)
+    except EnvironmentError, e:
+      self.engine.logger.outputWarning(
+        "Warning: Failed to write graph cache %s: %s\n" % (self.path, str(e))
+        )
+
+  def onScriptCreated(self, script):
+    """Called when a root script is first referenced in this build.
+    """
+    if self._disabled:
+      return
+
+    key = getScriptKey(script)
+    if key not in self._records:
+      # A script we know nothing about may write to files any recorded
+      # script depends on.
+      self.engine.logger.outputDebug(
+        "graph",
+        "Not replaying scripts because %s has no record\n" % script.path,
+        )
+      self._disabled = True
+    elif script.parent is None and Script.getCurrent() is None:
+      self._roots.add(key)
+
+  def execute(self, script):
+    """Execute a root script or replay it if it hasn't changed.
+
+    @param script: The root script to execute.
+    @type script: L{Script}
+    """
+    key = getScriptKey(script)
+    record = self._records.get(key, None)
+    if record is not None and key in self._getReplayable() and self._canReplay(script, record):
+      self.engine.logger.outputDebug("graph", "Replaying %s\n" % script.path)
+      self._replay(script, record)
+      return
+
+    record = ScriptRecord(key)
+    configuration = script.configuration
+    record.addInput(self.engine, configuration.path)
+    constructionScriptPath = script.variant.constructionScriptPath
+    if constructionScriptPath is not None:
+      record.addInput(self.engine, configuration.abspath(constructionScriptPath))
+    script._graphRecord = record
+    self._lock.acquire()
+    try:
+      self._recording.append((script, record))
+    finally:
+      self._lock.release()
+    script.execute()
+
+  def _canReplay(self, script, record):
+    # Every script target that is going to be built must have been
+    # recorded. The default target may be required after we replay so it
+    # must always have been recorded.
+    if None not in record.targets:
+      return False
+    for name, target in script._targets.items():
+      if target.task.required and name not in record.targets:
+        return False
+    return True
+
+  def _replay(self, script, record):
+    if record.results is not None:
+      script._results.update(pickle.loads(record.results))
+
+    old = Script.getCurrent()
+    Script._current.value = script
+    try:
+      for name, entries in record.targets.items():
+        targets = [self._getTarget(entry) for entry in entries]
+        if name is None:
+          script.getDefaultTarget().addTargets(targets)
+        else:
+          for target in targets:
+            script.registerTarget(target, (name,))
+    finally:
+      Script._current.value = old
+
+    script._executed = True
+
+  def _getTarget(self, entry):
+    kind = entry[0]
+    if kind == "file":
+      return FileTarget(entry[1])
+    elif kind == "dir":
+      return DirectoryTarget(entry[1])
+    else:
+      configPath, absPath, keywords = entry[1]
+      configuration = self.engine.getConfiguration(configPath)
+      variant = configuration.findVariant(dict(keywords))
+      return configuration.execute(absPath, variant).getTarget(entry[2])
+
+  def _getReplayable(self):
+    replayable = self._replayable
+    if replayable is None:
+      self._lock.acquire()
+      try:
+        replayable = self._replayable
+        if replayable is None:
+          if self._disabled:
+            replayable = frozenset()
+          else:
+            replayable = frozenset(self._validate())
+          self._replayable = replayable
+      finally:
+        self._lock.release()
+    return replayable
+
+  def _debug(self, message):
+    self.engine.logger.outputDebug("graph", message)
+
+  def _validate(self):
+    """Find the recorded scripts that can be replayed.
+
+    @return: The keys of the scripts that can be replayed.
+    @rtype: set of tuple
+    """
+    engine = self.engine
+    records = self._records
+
+    # Find every script the requested scripts executed last time.
+    reachable = set()
+    pending = list(self._roots)
+    while pending:
+      key = pending.pop()
+      if key in reachable:
+        continue
+      record = records.get(key, None)
+      if record is None:
+        self._debug("Not replaying scripts because %s has no record\n" % key[1])
+        return set()
+      reachable.add(key)
+      pending.extend(record.scripts)
+      pending.extend(record.resultScripts)
+
+    # If any script changed it may now execute scripts or build targets
+    # we have no record of.
+    for key in reachable:
+      record = records[key]
+      reason = self._checkInputs(record)
+      if reason is not None:
+        self._debug("Not replaying scripts because %s\n" % reason)
+        return set()
+      if not record.knownOutputs:
+        self._debug("Not replaying scripts because %s has actions with unknown outputs\n" % key[1])
+        return set()
+
+    invalid = set()
+    outputs = {}
+    dependencies = {}
+    for key in reachable:
+      record = records[key]
+      configuration = engine.getConfiguration(key[0])
+      abspath = configuration.abspath
+      keyOutputs = outputs[key] = set(record.outputs)
+      keyDependencies = dependencies[key] = set()
+      if not record.replayable:
+        invalid.add(key)
+      for targetPath, args in record.actions:
+        # Don't cache timestamps, the files may be rebuilt later on.
+        dependencyInfo, reason = configuration._checkDependencyInfo(
+          targetPath,
+          args,
+          getTimestamp=_getTimestamp,
+          )
+        if reason is not None:
+          if key not in invalid:
+            self._debug("Executing %s because %s\n" % (key[1], reason))
+          invalid.add(key)
+        keyOutputs.add(_normPath(targetPath))
+        if dependencyInfo is not None:
+          keyOutputs.update(_normPath(abspath(p)) for p in dependencyInfo.targets)
+          keyDependencies.update(_normPath(abspath(p)) for p in dependencyInfo.depPaths)
+
+    # Scripts that depend on files built by scripts that will be executed
+    # must also be executed.
+    changed = bool(invalid)
+    while changed:
+      changed = False
+      changingOutputs = set()
+      for key in invalid:
+        changingOutputs.update(outputs[key])
+      for key in reachable.difference(invalid):
+        if records[key].resultScripts & invalid or \
+          _isAnyUnder(dependencies[key], changingOutputs):
+          self._debug("Executing %s because a script it depends on will be executed\n" % key[1])
+          invalid.add(key)
+          changed = True
+
+    return reachable.difference(invalid)
+
+  def _checkInputs(self, record):
+    engine = self.engine
+    for path, (timestamp, digest) in record.inputs.items():
+      try:
+        if engine.getTimestamp(path) != timestamp and engine.getFileDigest(path) != digest:
+          return "'%s' has been changed" % path
+      except EnvironmentError:
+        return "'%s' no longer exists" % path
+
+    for kind, path, value in record.listings:
+      if kind == "dir":
+        try:
+          mtime = os.stat(path).st_mtime
+        except EnvironmentError:
+          mtime = None
+        if mtime != value:
+          return "the contents of '%s' have changed" % path
+      elif sorted(glob.glob(path)) != value:
+        return "the files matching '%s' have changed" % path
+
+    return None
+
+def _getTimestamp(path):
+  return os.stat(path).st_mtime
+
+def _isAnyUnder(paths, directories):
+  """Return True if any of the paths is or is under one of the directories.
+  """
+  if not directories:
+    return False
+  for path in paths:
+    while True:
+      if path in directories:
+        return True
+      parent = os.path.dirname(path)
+      if parent == path:
+        break
+      path = parent
+  return False
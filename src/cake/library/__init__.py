@@ -32,25 +32,48 @@ class ToolMetaclass(type):
 def memoise(func):
   """Decorator that can be placed on Tool methods to memoise the result.
   
-  The result cache is invalidated whenever an attribute is set on the
-  instance.
+  The attributes of the instance that are read while computing the result
+  are recorded, and the result is only invalidated when one of those
+  attributes is set or modified through L{Tool._mutable()}. Clones
+  inherit the results that are still valid for them.
+  
+  Attributes are recorded by calling the method with a stand-in for the
+  instance, so the method shouldn't return anything that keeps a
+  reference to 'self'.
   
   @param func: The function to memoise.
   @type func: function
   """
   
-  undefined = object()
-  def run(*args, **kwargs):
-    kwargsTuple = tuple((k,v) for k, v in kwargs.iteritems())
+  def run(self, *args, **kwargs):
+    if kwargs:
+      key = (func, args, tuple(sorted(kwargs.iteritems())))
+    else:
+      key = (func, args)
     
-    self = args[0]
-    key = (func, args[1:], kwargsTuple)
-
-    cache = self._Tool__memoise
-    result = cache.get(key, undefined)
-    if result is undefined:
-      result = func(*args, **kwargs)
-      cache[key] = result
+    if type(self) in _recorderTypes:
+      # Called from another memoised method, pass on what we read.
+      state = object.__getattribute__(self, '__dict__')
+      tool = state['tool']
+      outerReads = state['reads']
+    else:
+      tool = self
+      outerReads = None
+    
+    # Store in the cache we looked in. If it has since been replaced due
+    # to some change then our result may be stale.
+    cache = tool._Tool__memoise
+    entry = cache.get(key, None)
+    if entry is None:
+      recorder = _createRecorder(tool)
+      result = func(recorder, *args, **kwargs)
+      reads = frozenset(object.__getattribute__(recorder, '__dict__')['reads'])
+      cache[key] = (result, reads)
+    else:
+      result, reads = entry
+    
+    if outerReads is not None:
+      outerReads.update(reads)
     return result
   
   try:
@@ -61,6 +84,45 @@ def memoise(func):
   
   return run
 
+class _Recorder(object):
+  """Stand-in for a Tool that records the attributes read from it.
+  
+  Recorder classes derive from the class of the tool being recorded so
+  that methods called on the recorder (including unbound calls of base
+  class methods) are passed the recorder as 'self'.
+  """
+  
+  def __getattribute__(self, name):
+    state = object.__getattribute__(self, '__dict__')
+    tool = state['tool']
+    if name == '__dict__':
+      return tool.__dict__
+    state['reads'].add(name)
+    try:
+      return tool.__dict__[name]
+    except KeyError:
+      # Class attributes and methods, bound to the recorder.
+      return object.__getattribute__(self, name)
+  
+  def __setattr__(self, name, value):
+    setattr(object.__getattribute__(self, '__dict__')['tool'], name, value)
+
+_recorderClasses = {}
+_recorderTypes = set()
+
+def _createRecorder(tool):
+  """Create a L{_Recorder} for a tool.
+  """
+  cls = tool.__class__
+  recorderClass = _recorderClasses.get(cls, None)
+  if recorderClass is None:
+    recorderClass = type(cls)("_Recorder" + cls.__name__, (_Recorder, cls), {})
+    _recorderClasses[cls] = recorderClass
+    _recorderTypes.add(recorderClass)
+  recorder = object.__new__(recorderClass)
+  object.__getattribute__(recorder, '__dict__').update(tool=tool, reads=set())
+  return recorder
+
 class Tool(object):
   """Base class for user-defined Cake tools.
   """
@@ -78,19 +140,62 @@ class Tool(object):
   """
   
   def __init__(self, configuration):
+    self.__shared = _noNames
     self.__memoise = {}
     self.configuration = configuration
     self.engine = configuration.engine
   
   def __setattr__(self, name, value):
-    if name != '_Tool__memoise' and hasattr(self, '_Tool__memoise'):
-      self._clearCache()
     super(Tool, self).__setattr__(name, value)
+    if name != '_Tool__memoise' and hasattr(self, '_Tool__memoise'):
+      self._clearCache(name)
+      shared = self.__shared
+      if name in shared:
+        self.__dict__['_Tool__shared'] = shared - frozenset([name])
   
-  def _clearCache(self):
+  def _clearCache(self, *names):
     """Clear the memoise cache due to some change.
+    
+    @param names: The names of the attributes that were changed. Only
+    results that read these attributes are removed. If no names are
+    given then all results are removed.
+    @type names: tuple of string
+    """
+    # Replace rather than modify the cache so a memoised call that is
+    # running on another thread can't store a stale result in the new cache.
+    # Clones may also be sharing the cache.
+    cache = self.__memoise
+    if not cache:
+      return
+    if names:
+      self.__dict__['_Tool__memoise'] = dict(
+        (key, entry) for key, entry in cache.items()
+        if entry[1].isdisjoint(names)
+        )
+    else:
+      self.__dict__['_Tool__memoise'] = {}
+  
+  def _mutable(self, name):
+    """Return an attribute's value so that it can be modified in place.
+    
+    Clones share their private builtin dict, list and set attributes,
+    those whose names start with an underscore, with the tool they were
+    cloned from. This copies the value first if it is still shared so
+    that the modification isn't seen by other tools.
+    
+    @param name: The name of the attribute.
+    @type name: string
+    
+    @return: The value of the attribute owned only by this tool.
     """
-    self.__memoise.clear()
+    value = getattr(self, name)
+    shared = self.__shared
+    if name in shared:
+      value = cloneTools(value)
+      # Bypass __setattr__, the copy doesn't invalidate the memoise cache.
+      self.__dict__[name] = value
+      self.__dict__['_Tool__shared'] = shared - frozenset([name])
+    return value
   
   def clone(self):
     """Return an independent clone of this tool.
@@ -99,11 +204,41 @@ class Tool(object):
     types, and a clone of any Tool-derived objects. Everything else
     will be shallow copied. You should override this method if you
     need a more sophisticated clone.
+    
+    Private builtin dict, list and set attributes, those whose names
+    start with an underscore, are instead shared and only copied when
+    they are first modified by either tool through L{_mutable()}, so
+    methods that modify them in place must use it.
     """
     new = object.__new__(self.__class__)
-    new.__dict__ = cloneTools(self.__dict__)
+    newDict = dict(self.__dict__)
+    names = []
+    for name, value in newDict.iteritems():
+      if name.startswith('_') and not name.startswith('_Tool__'):
+        if isinstance(value, Tool):
+          newDict[name] = value.clone()
+        elif isinstance(value, _mutableTypes):
+          names.append(name)
+      elif name != '_Tool__memoise':
+        newDict[name] = cloneTools(value)
+    
+    # The clone inherits the results that are still valid, but stores its
+    # own results separately as they may depend on its modified values.
+    newDict['_Tool__memoise'] = dict(self.__memoise)
+    
+    # Both tools now share the containers. The set of shared names is
+    # immutable so it can itself be shared by all clones.
+    shared = self.__shared
+    if not shared.issuperset(names):
+      shared = shared.union(names)
+      self.__dict__['_Tool__shared'] = shared
+    newDict['_Tool__shared'] = shared
+    new.__dict__ = newDict
     return new
 
+_mutableTypes = (dict, list, set)
+_noNames = frozenset()
+
 def cloneTools(obj):
   """Return a deep copy of any Tool-derived objects or builtin types.
 
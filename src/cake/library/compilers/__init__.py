@@ -6,31 +6,35 @@
 """
 
 import sys
+import re
 import weakref
 import os
 import os.path
 import datetime
+import time
 import tempfile
 import subprocess
 import itertools
-try:
-  import cPickle as pickle
-except ImportError:
-  import pickle
 
+import cake.actioncache
 import cake.filesys
+import cake.graph
 import cake.hash
 import cake.path
 import cake.system
-import cake.zipping
+import cake.unity
 
 from cake.gnu import parseDependencyFile
+from cake.engine import BuildError
 from cake.async import AsyncResult, waitForAsyncResult, flatten, getResult
 from cake.target import FileTarget, getPath, getPaths, getTask, getTasks
 from cake.task import Task
 from cake.library import Tool, memoise
 from cake.script import Script
 
+# Preprocessor line markers, eg. '# 12 "foo.h" 1' or '#line 12 "foo.h"'.
+_lineMarkerRe = re.compile(r'#(?:line)? (\d+)(?: "(?:[^"\\]|\\.)*")?(.*)')
+
 def _totalSeconds(td):
   """Return the total number of seconds for a datetime.timedelta value.
   """
@@ -461,6 +465,11 @@ class Compiler(Tool):
   dependencies exists in the cache then it will be copied from the cache
   rather than being compiled.
   
+  Precompiled headers, libraries, modules and programs are cached too,
+  along with their other outputs such as import libraries and map files.
+  Warnings output when a target was built are output again when it is
+  copied from the cache. See L{cake.actioncache} for details.
+  
   You can share an object cache with others by putting the object cache
   on a network share. You will also have to make sure all of your project
   paths match. This could be done by using a virtual drive. An alternative
@@ -470,17 +479,136 @@ class Compiler(Tool):
   If the value is None then object caching will be turned off.
   @type: string or None
   """
+  objectCacheMaximumSize = None
+  """Set the maximum size of the object cache in bytes.
+  
+  If set then once a build that added objects to the cache has succeeded
+  the least recently used objects are removed in a background process
+  until the cache is under this size. The cache can also be trimmed by
+  running 'cake --cache-trim', see L{cake.objectcache.trimCache()}.
+  
+  If the value is None then the cache can grow without limit.
+  @type: int or None
+  """
+  objectCacheCodec = "zlib"
+  """Set how objects are stored in the object cache.
+  
+  'zlib' compresses objects and suits shared or network caches. 'none'
+  stores objects uncompressed and copies cache hits without reading them
+  into Python, using a reflink where the file system supports it. 'link'
+  also stores objects uncompressed and hard links cache hits to their
+  targets where the cache is on the same file system. 'lzma' compresses
+  objects further but requires an lzma module. A compression level can
+  be appended, eg. 'zlib-6'. See L{cake.cachecodec} for details.
+  
+  Objects stored with one codec are not found by builds using another.
+  @type: string
+  """
+  objectCacheRemote = None
+  """Set the location of a second level object cache shared by a team.
+  
+  Either the path of a directory, eg. on a network share, or an
+  'http://' URL of a server that supports GET and PUT. Objects that
+  aren't in the local cache set by L{objectCachePath} are fetched from
+  the remote cache into the local cache. Objects added to the local
+  cache are uploaded to the remote cache in the background. See
+  L{cake.remotecache} for details.
+  
+  If the value is None then only the local cache is used.
+  @type: string or None
+  """
+  objectCachePreprocess = False
+  """Find objects in the object cache by their preprocessed source.
+  
+  Normally objects are found by the paths and contents of the source
+  and every header it includes, so builds on machines where the headers
+  are at different paths, eg. a different SDK install directory, never
+  share objects. If this is True then when an object isn't found that
+  way its source is preprocessed and the object is looked up by the
+  preprocessed source and the compiler arguments that affect code
+  generation instead. An object found this way is added to the target's
+  manifest so later builds find it without preprocessing.
+  
+  Only supported by compilers that implement
+  L{getObjectPreprocessCommand()}, and not for objects that use a
+  precompiled header.
+  @type: bool
+  """
   objectCacheWorkspaceRoot = None
   """Set the object cache workspace root.
   
   Set this if the object cache is to be shared across workspaces.
   This will cause objects and their dependencies under this directory
   to be stored as paths relative to this directory. This allows 
-  workspaces at different paths to reuse object files with the 
-  potential danger of debug information embedded in the object
-  files referring to paths in the wrong workspace.
+  workspaces at different paths to reuse object files. Compilers that
+  support it also map the workspace root to L{objectCachePrefixMap} in
+  the objects they compile, otherwise debug information embedded in the
+  object files may refer to paths in the wrong workspace.
+  @type: string or None
+  """
+  objectCachePrefixMap = "."
+  """Set the path the workspace root is mapped to in compiled objects.
+  
+  If the object cache and L{objectCacheWorkspaceRoot} are set then
+  compilers that support it replace the workspace root with this path
+  in the debug information and __FILE__ macros of the objects they
+  compile, eg. with Gcc's -ffile-prefix-map. Objects compiled in
+  workspaces at different paths are then identical. The workspace root
+  is also replaced with a fixed token in the compiler arguments objects
+  are cached by so the workspaces share them.
+  
+  Debuggers may need to be told where to find the sources of objects
+  with mapped paths, eg. with gdb's 'set substitute-path'.
+  
+  If the value is None then paths aren't mapped.
+  
+  Related compiler options::
+    GCC:   -ffile-prefix-map=<workspaceRoot>=<objectCachePrefixMap>
+    Clang: -ffile-prefix-map=<workspaceRoot>=<objectCachePrefixMap>
   @type: string or None
   """
+  unityBuild = False
+  """Compile the sources passed to objects() and sharedObjects() in
+  unity (jumbo) translation units.
+  
+  If True then the sources are grouped and each group is compiled as one
+  object from a generated source that includes each of them, named
+  after the group's first source, eg. 'foo.unity.cpp'. Only sources with
+  the same extension are grouped together. Sources that are themselves
+  built are compiled separately.
+  
+  Grouping is stable, so adding, removing or editing a source only
+  changes its own group, see L{cake.unity}. A group's object is rebuilt
+  when any of its sources or the headers they include change.
+  
+  Sources compiled together share a translation unit, so static
+  functions and variables, anonymous namespaces and macros of one are
+  visible to the others and may clash.
+  @type: bool
+  """
+  unityMaximumSources = 8
+  """Set the maximum number of sources in a unity translation unit.
+  
+  If the value is None then groups have no maximum number of sources.
+  @type: int or None
+  """
+  unityMaximumBytes = None
+  """Set the maximum total size in bytes of the sources in a unity
+  translation unit.
+  
+  If the value is None then groups have no maximum size.
+  @type: int or None
+  """
+  unityIsolateRecent = None
+  """Compile sources edited in the last this many seconds separately.
+  
+  While a source is being edited its object compiles faster on its own
+  than as part of a unity translation unit. Its group is rebuilt once
+  when it is split out and again when the source is put back.
+  
+  If the value is None then sources are always compiled in their groups.
+  @type: int or float or None
+  """
   language = None
   """Set the compilation language.
   
@@ -694,7 +822,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.cFlags.append(flag)
-    self._clearCache()
+    self._clearCache("cFlags")
     
   def addCppFlag(self, flag):
     """Add a flag to be used during .cpp compilation.
@@ -703,7 +831,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.cppFlags.append(flag)
-    self._clearCache()
+    self._clearCache("cppFlags")
 
   def addMFlag(self, flag):
     """Add a flag to be used during Objective C compilation.
@@ -712,7 +840,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.mFlags.append(flag)
-    self._clearCache()
+    self._clearCache("mFlags")
 
   def addMmFlag(self, flag):
     """Add a flag to be used during Objective C++ compilation.
@@ -721,7 +849,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.mmFlags.append(flag)
-    self._clearCache()
+    self._clearCache("mmFlags")
     
   def addLibraryFlag(self, flag):
     """Add a flag to be used during library compilation.
@@ -730,7 +858,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.libraryFlags.append(flag)
-    self._clearCache()
+    self._clearCache("libraryFlags")
     
   def addModuleFlag(self, flag):
     """Add a flag to be used during linking of modules.
@@ -739,7 +867,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.moduleFlags.append(flag)
-    self._clearCache()
+    self._clearCache("moduleFlags")
     
   def addProgramFlag(self, flag):
     """Add a flag to be used during linking of programs.
@@ -748,7 +876,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.programFlags.append(flag)
-    self._clearCache()
+    self._clearCache("programFlags")
 
   def addResourceFlag(self, flag):
     """Add a flag to be used during resource compilation.
@@ -757,7 +885,7 @@ class Compiler(Tool):
     @type flag: string
     """
     self.resourceFlags.append(flag)
-    self._clearCache()
+    self._clearCache("resourceFlags")
     
   def addIncludePath(self, path):
     """Add an include path to the preprocessor search path.
@@ -769,7 +897,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.includePaths.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("includePaths")
     
   def insertIncludePath(self, index, path):
     """Insert an include path into the preprocessor search paths.
@@ -783,7 +911,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.includePaths.insert(index, self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("includePaths")
         
   def getIncludePaths(self):
     """Get an iterator for include paths.
@@ -808,7 +936,7 @@ class Compiler(Tool):
       self.defines.append(name)
     else:
       self.defines.append("%s=%s" % (name, value))
-    self._clearCache()
+    self._clearCache("defines")
     
   def insertDefine(self, index, name, value=None):
     """Insert a define into the preprocessor command-line.
@@ -827,7 +955,7 @@ class Compiler(Tool):
       self.defines.insert(index, name)
     else:
       self.defines.insert(index, "%s=%s" % (name, value))
-    self._clearCache()
+    self._clearCache("defines")
 
   def getDefines(self):
     """Get an iterator for preprocessor defines.
@@ -849,7 +977,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.forcedIncludes.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("forcedIncludes")
   
   def insertForcedInclude(self, index, path):
     """Insert a forcibly included file into the command-line.
@@ -863,7 +991,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.forcedIncludes.insert(index, self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("forcedIncludes")
     
   def getForcedIncludes(self):
     """Get an iterator for forced includes.
@@ -899,7 +1027,7 @@ class Compiler(Tool):
     @type name: string
     """
     self.libraries.append(name)
-    self._clearCache()
+    self._clearCache("libraries")
 
   def insertLibrary(self, index, name):
     """Insert a library into the list of libraries to link with.
@@ -913,7 +1041,7 @@ class Compiler(Tool):
     @type name: string
     """
     self.libraries.insert(index, name)
-    self._clearCache()
+    self._clearCache("libraries")
     
   def getLibraries(self):
     """Get an iterator for libraries.
@@ -933,7 +1061,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.libraryPaths.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("libraryPaths")
 
   def insertLibraryPath(self, index, path):
     """Insert a path into the list of library search paths.
@@ -947,7 +1075,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.libraryPaths.insert(index, self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("libraryPaths")
       
   def getLibraryPaths(self):
     """Get an iterator for library paths.
@@ -964,7 +1092,7 @@ class Compiler(Tool):
     @type path: string
     """
     self.modules.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache("modules")
     
   def copyModulesTo(self, targetDir, **kwargs):
     """Copy modules to the given target directory.
@@ -987,6 +1115,9 @@ class Compiler(Tool):
 
   def _copyModulesTo(self, targetDir):
     
+    # Copies are checked by timestamp rather than dependency info.
+    cake.graph.markNotReplayable([self.configuration.abspath(targetDir)])
+    
     def doCopy(source, target):
       
       abspath = self.configuration.abspath
@@ -1139,8 +1270,7 @@ class Compiler(Tool):
         )
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(pchTarget)
-      currentScript.getTarget(cake.path.baseName(target)).addTarget(pchTarget)
-      currentScript.getTarget("pch").addTarget(pchTarget)
+      currentScript.registerTarget(pchTarget, (cake.path.baseName(target), "pch"))
       return pchTarget
       
     allPrerequisites = flatten([
@@ -1235,6 +1365,8 @@ class Compiler(Tool):
           lambda t=target, s=sourcePath, p=pch, h=shared, c=self:
             c.buildObject(t, s, p, h)
           )
+        if self._usesRemoteCache():
+          tasks.append(self._createPrefetchTask(target))
         objectTask.lazyStartAfter(tasks, threadPool=self.engine.scriptThreadPool)
       else:
         objectTask = None
@@ -1246,9 +1378,11 @@ class Compiler(Tool):
         )
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(objectTarget)
-      currentScript.getTarget("objects").addTarget(objectTarget)
-      currentScript.getTarget(cake.path.baseName(target)).addTarget(objectTarget)
-      currentScript.getTarget(cake.path.baseName(sourcePath)).addTarget(objectTarget)
+      currentScript.registerTarget(objectTarget, (
+        "objects",
+        cake.path.baseName(target),
+        cake.path.baseName(sourcePath),
+        ))
       return objectTarget
       
     allPrerequisites = flatten([
@@ -1259,6 +1393,155 @@ class Compiler(Tool):
       
     return run(target, source, pch, allPrerequisites)
     
+  def _objects(self, targetDir, sources, pch=None, prerequisites=[],
+               shared=False):
+    """Create the objects for a list of sources in one pass.
+    
+    Unlike calling L{_object()} for each source this waits for the sources,
+    pch and prerequisites once, and the prerequisites shared by the batch
+    are grouped under a single task that each object task starts after.
+    """
+    
+    @waitForAsyncResult
+    def run(targetDir, sources, pch, prerequisites):
+      objectSuffix = self.objectSuffix
+      enabled = self.enabled
+      
+      if enabled:
+        engine = self.engine
+        createTask = engine.createTask
+        threadPool = engine.scriptThreadPool
+        batchTask = getTask((pch, prerequisites))
+        if self._usesRemoteCache():
+          createPrefetchTask = self._createPrefetchTask
+        else:
+          createPrefetchTask = lambda target: None
+      
+      currentScript = Script.getCurrent()
+      registerTarget = currentScript.registerTarget
+      results = []
+      
+      def addObject(target, sourcePaths, sourceTask, build):
+        if enabled:
+          objectTask = createTask(build)
+          objectTask.lazyStartAfter(
+            [t for t in (sourceTask, batchTask, createPrefetchTask(target))
+             if t is not None],
+            threadPool=threadPool,
+            )
+        else:
+          objectTask = None
+        
+        objectTarget = ObjectTarget(
+          path=target,
+          task=objectTask,
+          compiler=self,
+          )
+        registerTarget(objectTarget, (
+          "objects",
+          cake.path.baseName(target),
+          ) + tuple(cake.path.baseName(p) for p in sourcePaths))
+        results.append(objectTarget)
+      
+      if self.unityBuild:
+        unityGroups = self._getUnityGroups(sources)
+      else:
+        unityGroups = {}
+      
+      for source in sources:
+        sourcePath = getPath(source)
+        group = unityGroups.get(sourcePath, None)
+        if group is not None:
+          if group[0] != sourcePath:
+            continue # Added with the group's first source.
+          unitySource = cake.path.join(
+            targetDir,
+            cake.path.baseNameWithoutExtension(sourcePath) + ".unity" +
+            cake.path.extension(sourcePath),
+            )
+          target = cake.path.forceExtension(
+            cake.path.stripExtension(unitySource),
+            objectSuffix,
+            )
+          addObject(
+            target,
+            group,
+            None,
+            lambda t=target, s=unitySource, g=group:
+              self.buildUnityObject(t, s, g, pch, shared),
+            )
+          continue
+        
+        sourceName = cake.path.baseNameWithoutExtension(sourcePath)
+        target = cake.path.forceExtension(
+          cake.path.join(targetDir, sourceName),
+          objectSuffix,
+          )
+        addObject(
+          target,
+          [sourcePath],
+          getTask(source),
+          lambda t=target, s=sourcePath: self.buildObject(t, s, pch, shared),
+          )
+      
+      currentScript.getDefaultTarget().addTargets(results)
+      return results
+    
+    allPrerequisites = flatten([
+      prerequisites,
+      self.objectPrerequisites,
+      self._getObjectPrerequisiteTasks(),
+      ])
+    
+    return run(targetDir, sources, pch, allPrerequisites)
+  
+  def _getUnityGroups(self, sources):
+    """Group sources into unity translation units.
+    
+    @return: A dictionary of the groups of more than one source keyed by
+    the path of each of their sources.
+    @rtype: dict of string to list of string
+    """
+    abspath = self.configuration.abspath
+    maximumBytes = self.unityMaximumBytes
+    isolateRecent = self.unityIsolateRecent
+    now = time.time()
+    
+    pathsByExtension = {}
+    sizes = {}
+    recent = set()
+    for source in sources:
+      if getTask(source) is not None:
+        continue # Built sources may not exist yet.
+      path = getPath(source)
+      if maximumBytes is not None or isolateRecent is not None:
+        try:
+          st = os.stat(abspath(path))
+        except EnvironmentError:
+          continue # Compile it separately so the error is reported.
+        sizes[path] = st.st_size
+        if isolateRecent is not None and now - st.st_mtime < isolateRecent:
+          recent.add(path)
+      extension = os.path.normcase(cake.path.extension(path))
+      pathsByExtension.setdefault(extension, []).append(path)
+    
+    unityGroups = {}
+    for paths in pathsByExtension.itervalues():
+      groups = cake.unity.groupSources(
+        paths,
+        maximumSources=self.unityMaximumSources,
+        maximumBytes=maximumBytes,
+        sizes=sizes,
+        )
+      for group in groups:
+        # Recent sources are removed after grouping so the other groups
+        # don't change.
+        group = [p for p in group if p not in recent]
+        if len(group) > 1:
+          for path in group:
+            unityGroups[path] = group
+    return unityGroups
+    
   @memoise
   def _getObjectPrerequisiteTasks(self):
     """Return a list of the tasks that are prerequisites for
@@ -1285,26 +1568,16 @@ class Compiler(Tool):
     @type prerequisites: list of Task or FileTarget
     
     @return: A list of FileTarget objects, one for each object being
-    built.
+    built. Sources compiled together by a unity build share an object,
+    see L{unityBuild}.
     """
     compiler = self.clone()
     for k, v in kwargs.iteritems():
       setattr(compiler, k, v)
     
-    @waitForAsyncResult
-    def run(targetDir, sources, prerequisites):
-      results = []
-      for source in sources:
-        sourcePath = getPath(source)
-        sourceName = cake.path.baseNameWithoutExtension(sourcePath)
-        targetPath = cake.path.join(targetDir, sourceName)
-        results.append(compiler._object(targetPath, source,
-                                        pch=pch, prerequisites=prerequisites))
-      return results
-
     basePath = self.configuration.basePath
     
-    return run(basePath(targetDir), basePath(flatten(sources)), prerequisites)
+    return compiler._objects(basePath(targetDir), basePath(flatten(sources)), pch, prerequisites)
 
   def sharedObjects(self, targetDir, sources, pch=None, prerequisites=[],
                     **kwargs):
@@ -1326,31 +1599,16 @@ class Compiler(Tool):
     @type prerequisites: list of Task or FileTarget
     
     @return: A list of FileTarget objects, one for each object being
-    built.
+    built. Sources compiled together by a unity build share an object,
+    see L{unityBuild}.
     """
     compiler = self.clone()
     for k, v in kwargs.iteritems():
       setattr(compiler, k, v)
 
-    @waitForAsyncResult
-    def run(targetDir, sources, prerequisites):
-      results = []
-      for source in sources:
-        sourcePath = getPath(source)
-        sourceName = cake.path.baseNameWithoutExtension(sourcePath)
-        targetPath = cake.path.join(targetDir, sourceName)
-        results.append(compiler._object(
-          targetPath,
-          source,
-          pch=pch,
-          prerequisites=prerequisites,
-          shared=True
-          ))
-      return results
-    
     basePath = self.configuration.basePath
     
-    return run(basePath(targetDir), basePath(sources), prerequisites)
+    return compiler._objects(basePath(targetDir), basePath(flatten(sources)), pch, prerequisites, shared=True)
     
   def library(self, target, sources, prerequisites=[], forceExtension=True, **kwargs):
     """Build a library from a collection of objects.
@@ -1440,8 +1698,7 @@ class Compiler(Tool):
         )
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(libraryTarget)
-      currentScript.getTarget("libs").addTarget(libraryTarget)
-      currentScript.getTarget(cake.path.baseName(target)).addTarget(libraryTarget)
+      currentScript.registerTarget(libraryTarget, ("libs", cake.path.baseName(target)))
       return libraryTarget
 
     return run(target, flatten(sources), flatten(prerequisites))
@@ -1575,10 +1832,9 @@ class Compiler(Tool):
 
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(moduleTarget)
-      currentScript.getTarget(cake.path.baseName(target)).addTarget(moduleTarget)
-      currentScript.getTarget("modules").addTarget(moduleTarget)
+      currentScript.registerTarget(moduleTarget, (cake.path.baseName(target), "modules"))
       if moduleTarget.library:
-        currentScript.getTarget("libs").addTarget(moduleTarget.library)
+        currentScript.registerTarget(moduleTarget.library, ("libs",))
 
       return moduleTarget
 
@@ -1676,8 +1932,7 @@ class Compiler(Tool):
 
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(programTarget)
-      currentScript.getTarget("programs").addTarget(programTarget)
-      currentScript.getTarget(cake.path.baseName(target)).addTarget(programTarget)
+      currentScript.registerTarget(programTarget, ("programs", cake.path.baseName(target)))
 
       return programTarget
       
@@ -1769,7 +2024,7 @@ class Compiler(Tool):
 
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(resourceTarget)
-      currentScript.getTarget(cake.path.baseName(target)).addTarget(resourceTarget)
+      currentScript.registerTarget(resourceTarget, (cake.path.baseName(target),))
 
       return resourceTarget
       
@@ -1869,6 +2124,7 @@ class Compiler(Tool):
 
   def _outputStderr(self, text):
     text = text.replace("\r\n", "\n")
+    cake.actioncache.recordOutput(text)
     self.engine.logger.outputError(text)
         
   def _outputStdout(self, text):
@@ -1878,6 +2134,7 @@ class Compiler(Tool):
     # An example of a compiler outputting errors to stdout is Msvc's link
     # error, "LINK : fatal error LNK1104: cannot open file '<filename>'".
     text = text.replace("\r\n", "\n")
+    cake.actioncache.recordOutput(text)
     self.engine.logger.outputError(text)
       
   def _resolveObjects(self):
@@ -1906,6 +2163,72 @@ class Compiler(Tool):
         
     return objects, newLibraries
   
+  def _createTargetDir(self, target):
+    """Create the directory that will contain a process's target file.
+    """
+    if target is not None:
+      absTarget = self.configuration.abspath(target)
+      try:
+        cake.filesys.makeDirs(cake.path.dirName(absTarget))
+      except Exception, e:
+        msg = "cake: Error creating target directory %s: %s\n" % (
+          cake.path.dirName(target), str(e))
+        self.engine.raiseError(msg, targets=[target])
+
+  def _writeResponseFile(self, args):
+    """Write all but the first argument to a response file.
+    
+    @return: A tuple of (args, argsPath, argsFileString) where args is the
+    new command-line that refers to the response file at argsPath.
+    """
+    argsTemp, argsPath = tempfile.mkstemp(text=True)
+    argsFileString = "\n".join(_escapeArgs(args[1:]))
+    argsFile = os.fdopen(argsTemp, "wt")
+    argsFile.write(argsFileString)
+    argsFile.close()
+    return [args[0], '@' + argsPath], argsPath, argsFileString
+
+  def _processOutput(
+    self,
+    args,
+    target,
+    stdoutText,
+    stderrText,
+    exitCode,
+    processStdout=None,
+    processStderr=None,
+    processExitCode=None,
+    ):
+    """Handle the output and exit code of a finished process.
+    """
+    if self.engine.aborted:
+      # The process was probably terminated by the abort, don't report
+      # its output or exit code as an error.
+      raise BuildError()
+
+    if stdoutText:
+      if processStdout is not None:
+        processStdout(stdoutText)
+      else:
+        self._outputStdout(stdoutText)
+    
+    if stderrText:
+      if processStderr is not None:
+        processStderr(stderrText)
+      else:
+        self._outputStderr(stderrText)
+      
+    if processExitCode is not None:
+      processExitCode(exitCode)
+    elif exitCode != 0:
+      self.engine.raiseError(
+        "%s: failed with exit code %i\n" % (args[0], exitCode),
+        targets=[target],
+        )
+      
+    # TODO: Return DLL's/EXE's used by gcc.exe or MSVC as well.
+    return [args[0]]
+
   def _runProcess(
     self,
     args,
@@ -1916,14 +2239,7 @@ class Compiler(Tool):
     allowResponseFile=True,
     ):
 
-    if target is not None:
-      absTarget = self.configuration.abspath(target)
-      try:
-        cake.filesys.makeDirs(cake.path.dirName(absTarget))
-      except Exception, e:
-        msg = "cake: Error creating target directory %s: %s\n" % (
-          cake.path.dirName(target), str(e))
-        self.engine.raiseError(msg, targets=[target])
+    self._createTargetDir(target)
 
     stdout = None
     stderr = None
@@ -1933,12 +2249,7 @@ class Compiler(Tool):
       stderr = tempfile.TemporaryFile(mode="w+t")
       
       if allowResponseFile and self.useResponseFile:
-        argsTemp, argsPath = tempfile.mkstemp(text=True)
-        argsFileString = "\n".join(_escapeArgs(args[1:]))
-        argsFile = os.fdopen(argsTemp, "wt")
-        argsFile.write(argsFileString)
-        argsFile.close()
-        args = [args[0], '@' + argsPath]
+        args, argsPath, argsFileString = self._writeResponseFile(args)
       
       argsString = " ".join(_escapeArgs(args))
       
@@ -1983,7 +2294,11 @@ class Compiler(Tool):
           )
       p.stdin.close()
   
-      exitCode = p.wait()
+      self.engine.registerProcess(p)
+      try:
+        exitCode = p.wait()
+      finally:
+        self.engine.unregisterProcess(p)
   
       if isTiming:
         elapsed = (datetime.datetime.utcnow() - start)
@@ -2006,28 +2321,124 @@ class Compiler(Tool):
       if argsPath is not None:
         os.remove(argsPath)
     
-    if stdoutText:
-      if processStdout is not None:
-        processStdout(stdoutText)
-      else:
-        self._outputStdout(stdoutText)
+    return self._processOutput(
+      args,
+      target,
+      stdoutText,
+      stderrText,
+      exitCode,
+      processStdout,
+      processStderr,
+      processExitCode,
+      )
+  
+  def _runProcessAsync(
+    self,
+    args,
+    target=None,
+    processStdout=None,
+    processStderr=None,
+    processExitCode=None,
+    allowResponseFile=True,
+    ):
+    """Run a process using the engine's process reactor.
     
-    if stderrText:
-      if processStderr is not None:
-        processStderr(stderrText)
-      else:
-        self._outputStderr(stderrText)
+    Behaves like _runProcess() except that the current thread does not wait
+    for the process to exit.
+    
+    @return: A Task that completes once the process has exited and its output
+    has been handled. The task's result is the same as the return value of
+    _runProcess().
+    @rtype: L{Task}
+    """
+    reactor = self.engine.processReactor
+    
+    self._createTargetDir(target)
+    
+    argsPath = None
+    if allowResponseFile and self.useResponseFile:
+      args, argsPath, argsFileString = self._writeResponseFile(args)
+    
+    argsString = " ".join(_escapeArgs(args))
+    
+    debugString = "run: %s\n" % argsString
+    if argsPath is not None:
+      debugString += "contents of %s: %s\n" % (argsPath, argsFileString)
       
-    if processExitCode is not None:
-      processExitCode(exitCode)
-    elif exitCode != 0:
-      self.engine.raiseError(
-        "%s: failed with exit code %i\n" % (args[0], exitCode),
-        targets=[target],
+    self.engine.logger.outputDebug(
+      "run",
+      debugString,
+      )
+
+    isTiming = self.engine.logger.debugEnabled("time")
+    if isTiming:
+      start = datetime.datetime.utcnow()
+
+    # The reactor is only supported on POSIX platforms so we always
+    # use the shell here as _runProcess() does.
+    processTask = reactor.spawn(
+      args=argsString,
+      shell=True,
+      cwd=self.configuration.baseDir,
+      env=self._getProcessEnv(),
+      )
+    
+    def finish():
+      if argsPath is not None:
+        os.remove(argsPath)
+
+      result = processTask.result
+      if self.engine.aborted:
+        raise BuildError()
+      if result.error is not None:
+        self.engine.raiseError(
+          "cake: failed to launch %s: %s\n" % (args[0], str(result.error)),
+          targets=[target],
+          )
+
+      if isTiming:
+        elapsed = (datetime.datetime.utcnow() - start)
+        totalSeconds = _totalSeconds(elapsed)
+        self.engine.logger.outputDebug(
+          "time",
+          "time: %.3fs %s\n" % (totalSeconds, debugString[5:]),
+          )
+
+      return self._processOutput(
+        args,
+        target,
+        result.stdout,
+        result.stderr,
+        result.exitCode,
+        processStdout,
+        processStderr,
+        processExitCode,
         )
       
-    # TODO: Return DLL's/EXE's used by gcc.exe or MSVC as well.
-    return [args[0]]
+    finishTask = self.engine.createTask(finish)
+    finishTask.startAfter(processTask, immediate=True)
+    return finishTask
+  
+  def _runCompileProcess(self, args, target, scan):
+    """Run a compile process then scan for its dependencies.
+    
+    If the engine has a process reactor the process is run asynchronously.
+    
+    @param scan: A function that takes the list of dependencies returned
+    by _runProcess() and returns the complete list of dependencies.
+    @type scan: any callable
+    
+    @return: The result of scan(), or if the process is run asynchronously
+    a Task whose result will be the result of scan().
+    @rtype: list of string or L{Task}
+    """
+    if self.engine.processReactor is None:
+      return scan(self._runProcess(args, target))
+
+    runTask = self._runProcessAsync(args, target)
+    scanTask = self.engine.createTask(lambda: scan(runTask.result))
+    scanTask.startAfter(runTask, immediate=True)
+    return scanTask
   
   def _scanDependencyFile(self, depPath, target):
     self.engine.logger.outputDebug(
@@ -2095,54 +2506,78 @@ class Compiler(Tool):
     libraryObjects[path] = tuple(objectPaths)
   
   def buildPch(self, target, source, header, object):
-    compile, args, _ = self.getPchCommands(
+    compile, args, canBeCached = self.getPchCommands(
       target,
       source,
       header,
       object,
       )
     
-    # Check if the target needs building
-    _, reasonToBuild = self.configuration.checkDependencyInfo(target, args)
-    if not reasonToBuild:
-      return # Target is up to date
-    self.engine.logger.outputDebug(
-      "reason",
-      "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
-      )
-
     targets = [target]
     if object is not None:
       targets.append(object)
 
-    def command():
-      message = self.pchMessage(target, source, header=header, cached=False)
-      self.engine.logger.outputInfo(message)
-      return compile()
-
-    compileTask = self.engine.createTask(command)
-    compileTask.parent.completeAfter(compileTask)
-    compileTask.start(immediate=True)
+    self._buildCompiledTarget(
+      targets,
+      args,
+      compile,
+      canBeCached,
+      message=self.pchMessage(target, source, header=header, cached=False),
+      cachedMessage=self.pchMessage(target, source, header=header, cached=True),
+      )
 
-    def storeDependencyInfo():
-      abspath = self.configuration.abspath
-      normpath = os.path.normpath
-      dependencies = [
-          normpath(abspath(p))
-          for p in compileTask.result
-          ]
-      newDependencyInfo = self.configuration.createDependencyInfo(
-        targets=[target],
-        args=args,
-        dependencies=dependencies,
-        calculateDigests=False,
+  def _getActionCache(self, target):
+    """Return the cache of this compiler's build actions.
+    
+    @return: The cache or None if L{objectCachePath} isn't set.
+    @rtype: L{cake.actioncache.ActionCache} or None
+    """
+    if self.objectCachePath is None:
+      return None
+    try:
+      return cake.actioncache.ActionCache(
+        self.configuration,
+        self.objectCachePath,
+        codec=self.objectCacheCodec,
+        remote=self.objectCacheRemote,
+        maximumSize=self.objectCacheMaximumSize,
+        workspaceRoot=self.objectCacheWorkspaceRoot,
         )
-      self.configuration.storeDependencyInfo(newDependencyInfo)
-        
-    storeDependencyTask = self.engine.createTask(storeDependencyInfo)
-    storeDependencyTask.parent.completeAfter(storeDependencyTask)
-    storeDependencyTask.startAfter(compileTask, immediate=True)
-
+    except ValueError, e:
+      self.engine.raiseError("Failed to build '%s': %s\n" % (target, e), targets=[target])
+
+  def _usesRemoteCache(self):
+    return (
+      self.objectCachePath is not None and
+      self.objectCacheRemote is not None and
+      not self.engine.forceBuild
+      )
+  
+  def _createPrefetchTask(self, target):
+    """Create a task that prefetches an object from the remote cache.
+    
+    The task is started lazily so only objects that are built are
+    prefetched. Objects whose target already exists are probably up to
+    date so aren't prefetched.
+    """
+    def run():
+      if cake.filesys.isFile(self.configuration.abspath(target)):
+        return
+      try:
+        cache = cake.actioncache.ActionCache(
+          self.configuration,
+          self.objectCachePath,
+          codec=self.objectCacheCodec,
+          remote=self.objectCacheRemote,
+          workspaceRoot=self.objectCacheWorkspaceRoot,
+          )
+      except ValueError:
+        return # Reported when the object is built.
+      cache.prefetch(target)
+    task = self.engine.createTask(run)
+    task.lazyStart(threadPool=self.engine.scriptThreadPool)
+    return task
+  
   def buildObject(self, target, source, pch, shared):
     """Perform the actual build of an object.
     
@@ -2159,6 +2594,75 @@ class Compiler(Tool):
       shared
       )
 
+    if canBeCached and self.objectCachePreprocess:
+      preprocess = self.getObjectPreprocessCommand(target, source, pch, shared)
+    else:
+      preprocess = None
+
+    pchPath = getPath(pch)
+    self._buildCompiledTarget(
+      [target],
+      args,
+      compile,
+      canBeCached,
+      message=self.objectMessage(target, source, pch=pchPath, shared=shared, cached=False),
+      cachedMessage=self.objectMessage(target, source, pch=pchPath, shared=shared, cached=True),
+      preprocess=preprocess,
+      )
+
+  def buildUnityObject(self, target, source, sources, pch, shared):
+    """Write a unity source and compile it if it is out of date.
+    
+    The unity source is only written if its text has changed, so its
+    object is rebuilt when the sources in its group change, or when the
+    sources or the headers they include are edited.
+    
+    @param target: The path of the object.
+    @type target: string
+    @param source: The path of the unity source.
+    @type source: string
+    @param sources: The paths of the sources the unity source includes.
+    @type sources: list of string
+    """
+    abspath = self.configuration.abspath
+    absSource = abspath(source)
+    text = cake.unity.getUnitySource(
+      absSource,
+      [abspath(p) for p in sources],
+      )
+    try:
+      oldText = cake.filesys.readFile(absSource)
+    except EnvironmentError:
+      oldText = None
+    if text != oldText:
+      try:
+        cake.filesys.writeFile(absSource, text)
+      except EnvironmentError, e:
+        msg = "cake: failed to write unity source %s: %s\n" % (source, str(e))
+        self.engine.raiseError(msg, targets=[target])
+    
+    self.buildObject(target, source, pch, shared)
+  
+  def _buildCompiledTarget(self, targets, args, compile, canBeCached,
+                           message, cachedMessage, preprocess=None):
+    """Compile a precompiled header or object if it is out of date.
+    
+    The outputs are restored from the object cache instead if possible.
+    
+    @param targets: The outputs of the compile, the first of which is
+    the target being built.
+    @type targets: list of string
+    @param compile: A function that starts the compile and returns a task
+    that completes with the paths of the dependencies.
+    @type compile: callable
+    @param canBeCached: Whether the outputs can be cached.
+    @type canBeCached: bool
+    @param preprocess: A function that returns a key to look up the
+    outputs by if they aren't found by their dependencies, see
+    L{getObjectPreprocessCommand()}, or None.
+    @type preprocess: callable or None
+    """
+    target = targets[0]
     configuration = self.configuration
     
     # Check if the target needs building
@@ -2170,201 +2674,81 @@ class Compiler(Tool):
       "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
       )
 
-    useCacheForThisObject = canBeCached and self.objectCachePath is not None
-    cacheDepMagic = "CKCH" 
+    if canBeCached:
+      cache = self._getActionCache(target)
+    else:
+      cache = None
     
-    if useCacheForThisObject:
-      #######################
-      # USING OBJECT CACHE
-      #######################
-      
+    if cache is not None:
       # Prime the file digest cache from previous run so we don't have
       # to recalculate file digests for files that haven't changed.
       if oldDependencyInfo is not None:
         configuration.primeFileDigestCache(oldDependencyInfo)
       
-      # We either need to make all paths that form the cache digest relative
-      # to the workspace root or all of them absolute.
-      targetDigestPath = configuration.abspath(target)
-      if self.objectCacheWorkspaceRoot is not None:
-        workspaceRoot = configuration.abspath(self.objectCacheWorkspaceRoot)
-        workspaceRoot = os.path.normcase(workspaceRoot)
-        targetDigestPathNorm = os.path.normcase(targetDigestPath)
-        if cake.path.commonPath(targetDigestPathNorm, workspaceRoot) == workspaceRoot:
-          targetDigestPath = targetDigestPath[len(workspaceRoot)+1:]
-          
-      # Find the directory that will contain all cached dependency
-      # entries for this particular target object file.
-      targetDigest = cake.hash.sha1(targetDigestPath.encode("utf8")).digest()
-      targetDigestStr = cake.hash.hexlify(targetDigest)
-      targetCacheDir = cake.path.join(
-        self.objectCachePath,
-        targetDigestStr[0],
-        targetDigestStr[1],
-        targetDigestStr
-        )
-      targetCacheDir = configuration.abspath(targetCacheDir)
-      
-      # Find all entries in the directory
-      entries = set()
-      
-      # If doing a force build, pretend the cache is empty
-      if not self.engine.forceBuild:
-        try:
-          entries.update(os.listdir(targetCacheDir))
-        except EnvironmentError:
-          # Target cache dir doesn't exist, treat as if no entries
-          pass
-      
-      hexChars = "0123456789abcdefABCDEF"
-      
-      # Try to find the dependency files
-      for entry in entries:
-        # Skip any entry that's not a SHA-1 hash
-        if len(entry) != 40:
-          continue
-        skip = False
-        for c in entry:
-          if c not in hexChars:
-            skip = True
-            break
-        if skip:
-          continue
+      if cache.restore(target, args, cachedMessage):
+        return # Restored the outputs and saved new dependency info.
+
+      if preprocess is not None and not self.engine.forceBuild:
+        result = preprocess()
+        if result is not None:
+          key, dependencies = result
+          if cache.restorePreprocessed(
+            target,
+            args,
+            key,
+            cache.normalizePaths(dependencies),
+            cachedMessage,
+            ):
+            return
+        else:
+          key = None
+      else:
+        key = None
 
-        cacheDepPath = cake.path.join(targetCacheDir, entry)
-        
-        try:
-          cacheDepContents = cake.filesys.readFile(cacheDepPath)
-        except EnvironmentError:
-          continue
-        
-        # Check for the correct signature to make sure the file isn't corrupt
-        cacheDepMagicLen = len(cacheDepMagic)
-        cacheDepSignature = cacheDepContents[-cacheDepMagicLen:]
-        cacheDepContents = cacheDepContents[:-cacheDepMagicLen]
-        
-        if cacheDepSignature != cacheDepMagic:
-          # Invalid signature
-          continue
-        
-        try:
-          candidateDependencies = pickle.loads(cacheDepContents)
-        except Exception:
-          # Invalid dependency file for this entry
-          continue
-        
-        if not isinstance(candidateDependencies, list):
-          # Data format change
-          continue
-        
-        try:
-          newDependencyInfo = configuration.createDependencyInfo(
-            targets=[target],
-            args=args,
-            dependencies=candidateDependencies,
-            )
-        except EnvironmentError:
-          # One of the dependencies didn't exist
-          continue
-        
-        # Check if the state of our files matches that of a cached object file.
-        cachedObjectDigest = configuration.calculateDigest(newDependencyInfo)
-        cachedObjectDigestStr = cake.hash.hexlify(cachedObjectDigest)
-        cachedObjectPath = cake.path.join(
-          self.objectCachePath,
-          cachedObjectDigestStr[0],
-          cachedObjectDigestStr[1],
-          cachedObjectDigestStr
-          )
-        cachedObjectPath = configuration.abspath(cachedObjectPath)
-        if cake.filesys.isFile(cachedObjectPath):
-          message = self.objectMessage(target, source, pch=getPath(pch), shared=shared, cached=True)
-          self.engine.logger.outputInfo(message)
-          try:
-            cake.zipping.decompressFile(cachedObjectPath, configuration.abspath(target))
-          except EnvironmentError:
-            continue # Invalid cache file
-          configuration.storeDependencyInfo(newDependencyInfo)
-          # Successfully restored object file and saved new dependency info file.
-          return
-
-    # Else, if we get here we didn't find the object in the cache so we need
-    # to actually execute the build.
+      # The outputs may be hard linked to cached files, in which case
+      # compiling in place would also overwrite the cached files.
+      cache.releaseTargets(targets)
+
+    # Else, if we get here we didn't find the outputs in the cache so we
+    # need to actually execute the build.
     def command():
-      message = self.objectMessage(target, source, pch=getPath(pch), shared=shared, cached=False)
       self.engine.logger.outputInfo(message)
+      cake.actioncache.startTiming(compileTask)
       return compile()
     
     def storeDependencyInfoAndCache():
-      # Since we are sharing this object in the object cache we need to
-      # make any paths in this workspace relative to the current workspace.
-      abspath = configuration.abspath
-      normpath = os.path.normpath
-      dependencies = []
-      if self.objectCacheWorkspaceRoot is None:
+      # Since we may be sharing the outputs in the cache we need to make
+      # any paths in this workspace relative to the workspace root.
+      if cache is not None:
+        dependencies = cache.normalizePaths(compileTask.result)
+      else:
+        abspath = configuration.abspath
+        normpath = os.path.normpath
         dependencies = [
           normpath(abspath(p))
           for p in compileTask.result
           ]
-      else:
-        workspaceRoot = os.path.normcase(
-          configuration.abspath(self.objectCacheWorkspaceRoot)
-          ) + os.path.sep
-        workspaceRootLen = len(workspaceRoot)
-        for path in compileTask.result:
-          path = normpath(abspath(path))
-          pathNorm = os.path.normcase(path)
-          if pathNorm.startswith(workspaceRoot):
-            path = path[workspaceRootLen:]
-          dependencies.append(path)
       
       newDependencyInfo = configuration.createDependencyInfo(
-        targets=[target],
+        targets=targets,
         args=args,
         dependencies=dependencies,
-        calculateDigests=useCacheForThisObject,
+        calculateDigests=cache is not None,
         )
       configuration.storeDependencyInfo(newDependencyInfo)
 
       # Finally update the cache if necessary
-      if useCacheForThisObject:
-        try:
-          objectDigest = configuration.calculateDigest(newDependencyInfo)
-          objectDigestStr = cake.hash.hexlify(objectDigest)
-          
-          dependencyDigest = cake.hash.sha1()
-          for dep in dependencies:
-            dependencyDigest.update(dep.encode("utf8"))
-          dependencyDigest = dependencyDigest.digest()
-          dependencyDigestStr = cake.hash.hexlify(dependencyDigest)
-          
-          cacheDepPath = cake.path.join(
-            targetCacheDir,
-            dependencyDigestStr
-            )
-          cacheObjectPath = cake.path.join(
-            self.objectCachePath,
-            objectDigestStr[0],
-            objectDigestStr[1],
-            objectDigestStr,
-            )
-          cacheObjectPath = configuration.abspath(cacheObjectPath)
-
-          # Copy the object file first, then the dependency file
-          # so that other processes won't find the dependency until
-          # the object file is ready.
-          cake.zipping.compressFile(configuration.abspath(target), cacheObjectPath)
-          
-          if not cake.filesys.isFile(cacheDepPath):
-            dependencyString = pickle.dumps(dependencies, pickle.HIGHEST_PROTOCOL)       
-            cake.filesys.writeFile(cacheDepPath, dependencyString + cacheDepMagic)
-            
-        except EnvironmentError:
-          # Don't worry if we can't put the object in the cache
-          # The build shouldn't fail.
-          pass
+      if cache is not None:
+        cache.store(
+          newDependencyInfo,
+          cake.actioncache.getRecordedOutput(compileTask),
+          key,
+          cake.actioncache.getRecordedDuration(compileTask),
+          )
     
     compileTask = self.engine.createTask(command)
+    if cache is not None:
+      cake.actioncache.startRecording(compileTask)
     compileTask.parent.completeAfter(compileTask)
     compileTask.start(immediate=True)
 
@@ -2398,6 +2782,96 @@ class Compiler(Tool):
     """
     self.engine.raiseError("Don't know how to compile %s\n" % source, targets=[target])
   
+  def _getPrefixMap(self):
+    """Return the workspace root and the path it should be mapped to in
+    compiled objects, see L{objectCachePrefixMap}.
+    
+    @return: A tuple of (workspaceRoot, prefixMap) or None if paths
+    shouldn't be mapped.
+    @rtype: tuple of (string, string) or None
+    """
+    if (
+      self.objectCachePath is None or
+      self.objectCacheWorkspaceRoot is None or
+      self.objectCachePrefixMap is None
+      ):
+      return None
+    workspaceRoot = os.path.normpath(
+      self.configuration.abspath(self.objectCacheWorkspaceRoot)
+      )
+    return workspaceRoot, self.objectCachePrefixMap
+  
+  def _getCacheArgs(self, args):
+    """Return the arguments to cache an object by.
+    
+    If the workspace root is mapped, see L{objectCachePrefixMap}, then it
+    is replaced with a fixed token so every workspace caches objects by
+    the same arguments.
+    
+    @param args: The compiler's command-line.
+    @type args: list of string
+    
+    @rtype: list of string
+    """
+    prefixMap = self._getPrefixMap()
+    if prefixMap is None:
+      return args
+    # Only replace whole path components, eg. not '/ws' in '/ws2'.
+    workspaceRootRe = re.compile(re.escape(prefixMap[0]) + r'(?=[\\/=]|$)')
+    return [workspaceRootRe.sub("<workspace>", a) for a in args]
+  
+  def getObjectPreprocessCommand(self, target, source, pch, shared):
+    """Get the command for preprocessing a source to find its object in
+    the object cache, see L{objectCachePreprocess}.
+    
+    @return: None if objects can't be found by their preprocessed source.
+    Otherwise a function that takes no arguments and preprocesses the
+    source. It returns a (key, dependencies) tuple where 'key' is a digest
+    of the preprocessed source, the compiler and the arguments that affect
+    code generation, see L{_getPreprocessedKey()}, and 'dependencies' is
+    the list of paths of the compiler and the files the source includes.
+    It returns None if the source couldn't be preprocessed, in which case
+    it is compiled so the errors are reported.
+    """
+    return None
+  
+  def _getPreprocessedKey(self, executable, args, text, source):
+    """Return the key of an object built from preprocessed source.
+    
+    @param executable: The path of the compiler.
+    @type executable: string
+    @param args: The compiler arguments that affect code generation. They
+    shouldn't include any paths, eg. of the source or include directories.
+    @type args: list of string
+    @param text: The preprocessed source. The file names of line markers
+    are ignored as they refer to the paths of the included files, but
+    their line numbers are kept as they end up in debug information and
+    warnings.
+    @type text: string
+    @param source: The path of the source as passed to the compiler.
+    When debug symbols are enabled it is part of the key along with the
+    compiler's working directory, both mapped as L{_getCacheArgs()}
+    does, as they are embedded in the object's debug information.
+    @type source: string
+    
+    @rtype: string of 20 bytes
+    """
+    hasher = cake.hash.sha1()
+    hasher.update(self.engine.getFileDigest(self.configuration.abspath(executable)))
+    hasher.update(repr(args))
+    if self.debugSymbols:
+      hasher.update(repr(self._getCacheArgs([
+        self.configuration.baseDir,
+        source,
+        ])))
+    for line in text.splitlines(True):
+      m = _lineMarkerRe.match(line)
+      if m is None:
+        hasher.update(line)
+      else:
+        hasher.update("# %s%s\n" % (m.group(1), m.group(2).rstrip()))
+    return hasher.digest()
+  
   def buildLibrary(self, target, sources):
     """Perform the actual build of a library.
     
@@ -2415,8 +2889,31 @@ class Compiler(Tool):
     
     args = repr(archive)
     
+    self._buildLinkedTarget(
+      target,
+      args,
+      archive,
+      scan,
+      message=self.libraryMessage(target, sources, cached=False),
+      cachedMessage=self.libraryMessage(target, sources, cached=True),
+      )
+  
+  def _buildLinkedTarget(self, target, args, build, scan, message,
+                         cachedMessage):
+    """Archive or link a target if it is out of date.
+    
+    The outputs are restored from the object cache instead if possible.
+    
+    @param build: A function that archives or links the target.
+    @type build: callable
+    @param scan: A function that returns a tuple of the (targets,
+    dependencies) of the build once it has run.
+    @type scan: callable
+    """
+    configuration = self.configuration
+    
     # Check if the target needs building
-    _, reasonToBuild = self.configuration.checkDependencyInfo(target, args)
+    oldDependencyInfo, reasonToBuild = configuration.checkDependencyInfo(target, args)
     if not reasonToBuild:
       return # Target is up to date
     self.engine.logger.outputDebug(
@@ -2424,25 +2921,51 @@ class Compiler(Tool):
       "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
       )
 
+    cache = self._getActionCache(target)
+    if cache is not None:
+      if oldDependencyInfo is not None:
+        configuration.primeFileDigestCache(oldDependencyInfo)
+        
+      if cache.restore(target, args, cachedMessage):
+        return # Restored the outputs and saved new dependency info.
+      
+      # Outputs of the last build may be hard linked to cached files and
+      # some linkers update their outputs in place.
+      if oldDependencyInfo is not None:
+        cache.releaseTargets(oldDependencyInfo.targets)
+      cache.releaseTargets([target])
+
     def command():
-      message = self.libraryMessage(target, sources, cached=False)
       self.engine.logger.outputInfo(message)
+      cake.actioncache.startTiming(buildTask)
       
-      archive()
+      build()
       
       targets, dependencies = scan()
+      if cache is not None:
+        dependencies = cache.normalizePaths(dependencies)
       
-      newDependencyInfo = self.configuration.createDependencyInfo(
+      newDependencyInfo = configuration.createDependencyInfo(
         targets=targets,
         args=args,
         dependencies=dependencies,
+        calculateDigests=cache is not None,
         )
       
-      self.configuration.storeDependencyInfo(newDependencyInfo)
+      configuration.storeDependencyInfo(newDependencyInfo)
+      
+      if cache is not None:
+        cache.store(
+          newDependencyInfo,
+          cake.actioncache.getRecordedOutput(buildTask),
+          duration=cake.actioncache.getRecordedDuration(buildTask),
+          )
 
-    archiveTask = self.engine.createTask(command)
-    archiveTask.parent.completeAfter(archiveTask)
-    archiveTask.start(immediate=True)
+    buildTask = self.engine.createTask(command)
+    if cache is not None:
+      cake.actioncache.startRecording(buildTask)
+    buildTask.parent.completeAfter(buildTask)
+    buildTask.start(immediate=True)
   
   def getLibraryCommand(self, target, sources):
     """Get the command for constructing a library.
@@ -2460,34 +2983,14 @@ class Compiler(Tool):
 
     args = [repr(link), repr(scan)]
     
-    # Check if the target needs building
-    _, reasonToBuild = self.configuration.checkDependencyInfo(target, args)
-    if not reasonToBuild:
-      return # Target is up to date
-    self.engine.logger.outputDebug(
-      "reason",
-      "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
+    self._buildLinkedTarget(
+      target,
+      args,
+      link,
+      scan,
+      message=self.moduleMessage(target, sources, cached=False),
+      cachedMessage=self.moduleMessage(target, sources, cached=True),
       )
-
-    def command():
-      message = self.moduleMessage(target, sources, cached=False)
-      self.engine.logger.outputInfo(message)
-      
-      link()
-    
-      targets, dependencies = scan()
-      
-      newDependencyInfo = self.configuration.createDependencyInfo(
-        targets=targets,
-        args=args,
-        dependencies=dependencies,
-        )
-      
-      self.configuration.storeDependencyInfo(newDependencyInfo)
-  
-    moduleTask = self.engine.createTask(command)
-    moduleTask.parent.completeAfter(moduleTask)
-    moduleTask.start(immediate=True)
   
   def getModuleCommands(self, target, sources, importLibrary, installName):
     """Get the commands for linking a module.
@@ -2516,35 +3019,15 @@ class Compiler(Tool):
 
     args = [repr(link), repr(scan)]
     
-    # Check if the target needs building
-    _, reasonToBuild = self.configuration.checkDependencyInfo(target, args)
-    if not reasonToBuild:
-      return # Target is up to date
-    self.engine.logger.outputDebug(
-      "reason",
-      "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
+    self._buildLinkedTarget(
+      target,
+      args,
+      link,
+      scan,
+      message=self.programMessage(target, sources, cached=False),
+      cachedMessage=self.programMessage(target, sources, cached=True),
       )
 
-    def command():
-      message = self.programMessage(target, sources, cached=False)
-      self.engine.logger.outputInfo(message)
-          
-      link()
-    
-      targets, dependencies = scan()
-      
-      newDependencyInfo = self.configuration.createDependencyInfo(
-        targets=targets,
-        args=args,
-        dependencies=dependencies,
-        )
-      
-      self.configuration.storeDependencyInfo(newDependencyInfo)
-
-    programTask = self.engine.createTask(command)
-    programTask.parent.completeAfter(programTask)
-    programTask.start(immediate=True)
-
   def getProgramCommands(self, target, sources):
     """Get the commands for linking a program.
     
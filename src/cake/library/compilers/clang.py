@@ -75,7 +75,11 @@ class ClangCompiler(Compiler):
     Compiler.__init__(self, configuration=configuration, binPaths=binPaths)
     self._clangExe = clangExe
     self._llvmArExe = llvmArExe
-    self.version = _getClangVersion(clangExe)
+    self.version = configuration.engine.probeCache.probe(
+      "clang-version",
+      getPath(clangExe),
+      _getClangVersion,
+      )
     self.versionTuple = _makeVersionTuple(self.version)
 
   def _getLanguage(self, suffix, pch=False):
@@ -99,6 +103,14 @@ class ClangCompiler(Compiler):
     if self.debugSymbols:
       args.append('-g')
 
+    prefixMap = self._getPrefixMap()
+    if prefixMap is not None:
+      if self.versionTuple >= (10,):
+        # Also maps __FILE__.
+        args.append('-ffile-prefix-map=%s=%s' % prefixMap)
+      elif self.versionTuple >= (3, 8):
+        args.append('-fdebug-prefix-map=%s=%s' % prefixMap)
+
     if language == 'c++':
       args.extend(self.cppFlags)
     elif language == 'c':
@@ -122,14 +134,15 @@ class ClangCompiler(Compiler):
 
     # TODO: Add support for pch
 
-    def compile():
-      dependencies = self._runProcess(args + ['-MF', depPath], target)
+    def scan(dependencies):
       dependencies.extend(self._scanDependencyFile(depPath, target))
-
       return dependencies
 
+    def compile():
+      return self._runCompileProcess(args + ['-MF', depPath], target, scan)
+
     canBeCached = True
-    return compile, args, canBeCached
+    return compile, self._getCacheArgs(args), canBeCached
 
   @memoise
   def _getCommonLibraryArgs(self):
@@ -74,6 +74,38 @@ def _getGccVersion(gccExe):
   return [
     int(n) for n in stdoutText.strip().split(".")
     ]
+
+def _probeGccVersion(configuration, gccExe):
+  """Returns the Gcc version number, cached until the executable changes.
+  """
+  return configuration.engine.probeCache.probe(
+    "gcc-version",
+    gccExe,
+    _getGccVersion,
+    )
+
+def prefetchMinGWCompiler(configuration):
+  """Start probing for a MinGW compiler in the background.
+  
+  The result is collected by a later call to L{findMinGWCompiler()}.
+  """
+  try:
+    gccExe = cake.path.join(_getMinGWInstallDir(), "bin", "gcc.exe")
+  except WindowsError:
+    return
+  configuration.engine.probeCache.prefetch("gcc-version", gccExe, _getGccVersion)
+
+def prefetchGccCompiler(configuration):
+  """Start probing for a GCC compiler in the background.
+  
+  The result is collected by a later call to L{findGccCompiler()}.
+  """
+  paths = os.environ.get('PATH', '').split(os.path.pathsep)
+  try:
+    gccExe = cake.system.findExecutable("gcc", paths)
+  except EnvironmentError:
+    return
+  configuration.engine.probeCache.prefetch("gcc-version", gccExe, _getGccVersion)
   
 def findMinGWCompiler(configuration):
   """Returns a MinGW compiler if found.
@@ -96,7 +128,7 @@ def findMinGWCompiler(configuration):
     checkFile(rcExe)
     
     try:
-      version = _getGccVersion(gccExe)
+      version = _probeGccVersion(configuration, gccExe)
     except EnvironmentError:
       raise CompilerNotFoundError("Could not find MinGW version.")
 
@@ -150,7 +182,7 @@ def findGccCompiler(configuration, platform=None):
     binPaths = list(set(binPaths)) # Only want unique paths
     
     try:
-      version = _getGccVersion(gccExe)
+      version = _probeGccVersion(configuration, gccExe)
     except EnvironmentError:
       raise CompilerNotFoundError("Could not find GCC version.")
     
@@ -189,6 +221,11 @@ def findGccCompiler(configuration, platform=None):
   except EnvironmentError:
     raise CompilerNotFoundError("Could not find GCC compiler, AR archiver or libtool.")
 
+_preprocessorPathOptions = frozenset([
+  '-I', '-include', '-imacros', '-isystem', '-iquote', '-idirafter',
+  ])
+_preprocessorOptionPrefixes = ('-I', '-D', '-U')
+
 class GccCompiler(Compiler):
   
   _name = 'gcc'
@@ -269,6 +306,14 @@ class GccCompiler(Compiler):
     if self.debugSymbols:
       args.append('-g')
 
+    prefixMap = self._getPrefixMap()
+    if prefixMap is not None:
+      if self.__version >= [8]:
+        # Also maps __FILE__.
+        args.append('-ffile-prefix-map=%s=%s' % prefixMap)
+      elif self.__version >= [4, 3]:
+        args.append('-fdebug-prefix-map=%s=%s' % prefixMap)
+
     if language in ['c++', 'c++-header', 'c++-cpp-output']:
       args.extend(self.cppFlags)
     elif language in ['c', 'c-header', 'cpp-output']:
@@ -347,13 +392,15 @@ class GccCompiler(Compiler):
     args = list(self._getCompileArgs(cake.path.extension(source), shared=False, pch=True))
     args.extend([source, '-o', target])
 
-    def compile():   
-      dependencies = self._runProcess(args + ['-MF', depPath], target)
+    def scan(dependencies):
       dependencies.extend(self._scanDependencyFile(depPath, target))
       return dependencies
+
+    def compile():   
+      return self._runCompileProcess(args + ['-MF', depPath], target, scan)
     
     canBeCached = True
-    return compile, args, canBeCached
+    return compile, self._getCacheArgs(args), canBeCached
   
   def getObjectCommands(self, target, source, pch, shared):
     depPath = self._generateDependencyFile(target)
@@ -366,17 +413,69 @@ class GccCompiler(Compiler):
         '-include', cake.path.stripExtension(pch.path),
         ])
         
-    def compile():
-      dependencies = self._runProcess(args + ['-MF', depPath], target)
+    def scan(dependencies):
       dependencies.extend(self._scanDependencyFile(depPath, target))
               
       if pch is not None:
         dependencies.append(pch.path)
         
       return dependencies
+
+    def compile():
+      return self._runCompileProcess(args + ['-MF', depPath], target, scan)
     
     canBeCached = True
-    return compile, args, canBeCached
+    return compile, self._getCacheArgs(args), canBeCached
+
+  def getObjectPreprocessCommand(self, target, source, pch, shared):
+    if pch is not None:
+      return None # Preprocessing doesn't use the pch.
+
+    compileArgs = self._getCompileArgs(cake.path.extension(source), shared)
+    args = list(compileArgs)
+    args.extend(['-E', source, '-MT', target])
+
+    # Options that only affect the preprocessed source aren't needed in
+    # the key, and have paths that may differ between machines.
+    keyArgs = []
+    skipNext = False
+    for arg in self._getCacheArgs(compileArgs[1:]):
+      if skipNext:
+        skipNext = False
+      elif arg in _preprocessorPathOptions:
+        skipNext = True
+      elif arg != '-MD' and not arg.startswith(_preprocessorOptionPrefixes):
+        keyArgs.append(arg)
+
+    def preprocess():
+      depPath = self._generateDependencyFile(target)
+      output = []
+      exitCodes = []
+      self._runProcess(
+        args + ['-MF', depPath],
+        target,
+        processStdout=output.append,
+        processStderr=lambda text: None,
+        processExitCode=exitCodes.append,
+        )
+      if exitCodes != [0]:
+        if not self.keepDependencyFile:
+          try:
+            os.remove(depPath)
+          except EnvironmentError:
+            pass
+        return None # Errors are reported when the source is compiled.
+      dependencies = [args[0]]
+      dependencies.extend(self._scanDependencyFile(depPath, target))
+      key = self._getPreprocessedKey(
+        args[0],
+        keyArgs,
+        "".join(output),
+        source,
+        )
+      return key, dependencies
+
+    return preprocess
 
   @memoise
   def _getCommonLibraryArgs(self):
@@ -443,7 +542,8 @@ class GccCompiler(Compiler):
     args.extend(['-o', target])
 
     if self.outputMapFile:
-      args.append('-Wl,-Map=' + cake.path.stripExtension(target) + '.map')
+      mapFile = cake.path.stripExtension(target) + '.map'
+      args.append('-Wl,-Map=' + mapFile)
     
     @makeCommand(args)
     def link():
@@ -463,6 +563,8 @@ class GccCompiler(Compiler):
       targets = [target]
       if dll and importLibrary:
         targets.append(importLibrary)
+      if self.outputMapFile:
+        targets.append(mapFile)
       dependencies = [args[0]]
       dependencies += sources
       dependencies += objects
@@ -310,7 +310,7 @@ def findUniversalCRuntimes(windowsKits10Dir=None, targetArchitecture=None):
   return results
 
 
-def findMsvcInstallDir(targetArchitecture, allowPreRelease=False, versionRange=None):
+def findMsvcInstallDir(targetArchitecture, allowPreRelease=False, versionRange=None, probeCache=None):
   """Find the location of the MSVC install directory.
 
   Returns path of the latest VC install directory that contains a compiler
@@ -318,13 +318,16 @@ def findMsvcInstallDir(targetArchitecture, allowPreRelease=False, versionRange=N
   couldn't find any MSVC version.
 
   Works for finding Visual Studio 2017 and later.
+
+  If probeCache is not None the list of installations is cached in it,
+  see L{cake.msvs.vswhere()}.
   """
   vswhereArgs = []
   if versionRange:
     vswhereArgs.extend(["-version", versionRange])
   if allowPreRelease:
     vswhereArgs.append("-prerelease")
-  infos = vswhere(vswhereArgs)
+  infos = vswhere(vswhereArgs, probeCache=probeCache)
   infos.sort(key=lambda info: _toVersionTuple(info.get("installationVersion", "0")), reverse=True)
 
   for info in infos:
@@ -344,14 +347,19 @@ def findMsvcInstallDir(targetArchitecture, allowPreRelease=False, versionRange=N
   else:
     raise CompilerNotFoundError()
 
-def findMsvc2017InstallDir(targetArchitecture, allowPreRelease=False):
+def findMsvc2017InstallDir(targetArchitecture, allowPreRelease=False, probeCache=None):
   """Find the location of the MSVC 2017 install directory.
 
   Returns path of the latest VC install directory that contains a compiler
   for the specified target architecture. Throws CompilerNotFoundError if
   couldn't find any MSVC 2017 version.
   """
-  return findMsvcInstallDir(targetArchitecture, allowPreRelease=allowPreRelease, versionRange="[15.0,16.0)")
+  return findMsvcInstallDir(
+    targetArchitecture,
+    allowPreRelease=allowPreRelease,
+    versionRange="[15.0,16.0)",
+    probeCache=probeCache,
+    )
 
 def getVisualStudio2015Compiler(configuration, targetArchitecture, ucrtInfo=None, windowsSdkInfo=None, vcInstallDir=None):
 
@@ -416,7 +424,10 @@ def getVisualStudio2017Compiler(configuration, targetArchitecture=None, ucrtInfo
       targetArchitecture = "x86"
 
   if vcInstallDir is None:
-    vcInstallDir = str(findMsvc2017InstallDir(targetArchitecture))
+    vcInstallDir = str(findMsvc2017InstallDir(
+      targetArchitecture,
+      probeCache=configuration.engine.probeCache,
+      ))
 
   return getVisualStudioCompiler(configuration, targetArchitecture, ucrtInfo, windowsSdkInfo, vcInstallDir)
 
@@ -429,7 +440,10 @@ def getVisualStudioCompiler(configuration, targetArchitecture=None, ucrtInfo=Non
       targetArchitecture = "x86"
 
   if vcInstallDir is None:
-    vcInstallDir = str(findMsvcInstallDir(targetArchitecture))
+    vcInstallDir = str(findMsvcInstallDir(
+      targetArchitecture,
+      probeCache=configuration.engine.probeCache,
+      ))
 
   if windowsSdkInfo is None:
     windowsSdks = findWindows10Sdks(targetArchitecture=targetArchitecture)
@@ -759,7 +773,7 @@ class MsvcCompiler(Compiler):
     in a path or FileTarget.
     """
     self.forcedUsings.append(self.configuration.basePath(assembly))
-    self._clearCache()
+    self._clearCache("forcedUsings")
     
   def _formatMessage(self, inputText):
     """Format errors to be clickable in MS Visual Studio.
@@ -6,8 +6,10 @@
 """
 
 import glob
+import os.path
 import cake.path
 import cake.filesys
+import cake.graph
 
 from cake.async import flatten, waitForAsyncResult
 from cake.target import DirectoryTarget, FileTarget, getPath, getTask
@@ -40,11 +42,25 @@ class FileSystemTool(Tool):
     basePath = configuration.basePath(path)
     absPath = configuration.abspath(basePath)
     
-    return cake.filesys.walkTree(
+    paths = cake.filesys.walkTree(
       path=absPath,
       recursive=recursive,
       includeMatch=includeMatch,
       )
+    
+    if not cake.graph.isRecording():
+      return paths
+
+    # Record each directory walked so the graph cache can tell if the
+    # results would be different.
+    paths = list(paths)
+    cake.graph.recordListing(absPath)
+    if recursive:
+      for p in paths:
+        dirPath = os.path.join(absPath, p)
+        if os.path.isdir(dirPath):
+          cake.graph.recordListing(dirPath)
+    return paths
 
   def glob(self, pathname):
     """Find files matching a particular pattern.
@@ -58,7 +74,10 @@ class FileSystemTool(Tool):
     absPath = configuration.abspath(basePath)
     offset = len(absPath) - len(pathname)
     
-    return [p[offset:] for p in glob.iglob(absPath)]
+    paths = glob.glob(absPath)
+    cake.graph.recordGlob(absPath, paths)
+    
+    return [p[offset:] for p in paths]
       
   def copyFile(self, source, target, onlyNewer=True):
     """Copy a file from one location to another.
@@ -89,6 +108,9 @@ class FileSystemTool(Tool):
   
   def _copyFile(self, source, target, onlyNewer=True):
     
+    # Copies are checked by timestamp rather than dependency info.
+    cake.graph.markNotReplayable([self.configuration.abspath(target)])
+    
     def doCopy():
       
       sourcePath = getPath(source)
@@ -224,6 +246,8 @@ class FileSystemTool(Tool):
     sourceDir = basePath(sourceDir)
     targetDir = basePath(targetDir)
     
+    cake.graph.markNotReplayable([abspath(targetDir)])
+    
     def doMakeDir(path):
       targetAbsPath = abspath(path)
       if cake.path.isDir(targetAbsPath):
@@ -24,15 +24,15 @@ from cake.async import getResult, waitForAsyncResult, flatten
 from cake.library import Tool
 from cake.script import Script
 
-try:
-  from cake.library.compilers.msvc import MsvcCompiler
-except ImportError:
-  # This import will fail on platforms without the Windows registry.
-  #
-  # Given the tool can't be imported it can't be in use so the checking
-  # performed below would never succeed.
-  class MsvcCompiler(object):
-    pass
+def _isMsvcCompiler(compiler):
+  """Return True if the compiler is an MsvcCompiler.
+
+  Doesn't import the msvc module, which is slow to import and fails to
+  import on platforms without the Windows registry. If it hasn't been
+  imported then the compiler can't be an MsvcCompiler.
+  """
+  msvc = sys.modules.get("cake.library.compilers.msvc", None)
+  return msvc is not None and isinstance(compiler, msvc.MsvcCompiler)
 
 class _Project(object):
 
@@ -538,7 +538,7 @@ class ProjectTool(Tool):
         forcedIncludes = []
         forcedUsings = []
 
-      if isinstance(compiler, MsvcCompiler):
+      if _isMsvcCompiler(compiler):
         additionalOptions = list(compiler.cppFlags)
       else:
         additionalOptions = []
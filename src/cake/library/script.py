@@ -6,6 +6,10 @@
 """
 
 import os.path
+import time
+
+import cake.actioncache
+import cake.graph
 
 from cake.target import Target, FileTarget, getPaths, getTask
 from cake.library import Tool
@@ -15,6 +19,34 @@ class ScriptTool(Tool):
   """Tool that provides utilities for performing Script operations.
   """
   
+  cachePath = None
+  """Set the path of a cache for the targets of functions run by L{run()}.
+  
+  If set then the targets of a function are copied from the cache
+  instead of running the function when it has been run with the same
+  args and sources before. Only functions with targets are cached, and
+  their targets must depend only on the args and sources.
+  
+  The cache can be shared with a compiler's object cache, see
+  L{cake.library.compilers.Compiler.objectCachePath}.
+  
+  If the value is None then functions aren't cached.
+  @type: string or None
+  """
+  cacheCodec = "zlib"
+  """Set how targets are stored in the cache, see L{cake.cachecodec}.
+  @type: string
+  """
+  cacheRemote = None
+  """Set the location of a second level cache shared by a team, see
+  L{cake.remotecache}.
+  @type: string or None
+  """
+  cacheMaximumSize = None
+  """Set the maximum size of the cache in bytes, or None for no limit.
+  @type: int or None
+  """
+
   def __init__(self, *args, **kwargs):
     Tool.__init__(self, *args, **kwargs)
     self._included = {}
@@ -215,7 +247,8 @@ class ScriptTool(Tool):
     
     normalisedPath = os.path.normcase(self.configuration.abspath(path))
 
-    if normalisedPath in self._included:
+    included = self._included
+    if normalisedPath in included:
       return
       
     currentScript = Script.getCurrent()
@@ -228,7 +261,11 @@ class ScriptTool(Tool):
       tools=currentScript.tools,
       parent=currentScript,
       )
-    self._included[normalisedPath] = includedScript
+    # Scripts on other threads use their own clone of this tool so there
+    # is no need to lock. Record the include before executing it so a script
+    # that includes itself doesn't recurse forever.
+    if included.setdefault(normalisedPath, includedScript) is not includedScript:
+      return
     
     try:
       includedScript.execute()
@@ -277,7 +314,8 @@ class ScriptTool(Tool):
 
     Only executes the function after the sources have been built and only
     if the target exists, args is the same as last run and the sources
-    haven't changed.
+    haven't changed. If L{cachePath} is set then the targets may be copied
+    from the cache instead of executing the function.
 
     @note: I couldn't think of a better class to put this function in so
     for now it's here although it doesn't really belong.
@@ -289,13 +327,19 @@ class ScriptTool(Tool):
     
     targets = basePath(targets)
     sources = basePath(sources)
+    cachePath = self.cachePath
+    cacheCodec = self.cacheCodec
+    cacheRemote = self.cacheRemote
+    cacheMaximumSize = self.cacheMaximumSize
 
     def _run():
       sourcePaths = getPaths(sources)
+      cache = None
       if targets:
         buildArgs = (args, sourcePaths)
+        oldDependencyInfo = None
         try:
-          _, reason = configuration.checkDependencyInfo(
+          oldDependencyInfo, reason = configuration.checkDependencyInfo(
             targets[0],
             buildArgs,
             )
@@ -310,6 +354,29 @@ class ScriptTool(Tool):
         except EnvironmentError:
           pass
 
+        if cachePath is not None:
+          try:
+            cache = cake.actioncache.ActionCache(
+              configuration,
+              cachePath,
+              codec=cacheCodec,
+              remote=cacheRemote,
+              maximumSize=cacheMaximumSize,
+              )
+          except ValueError, e:
+            engine.raiseError(
+              "cake: invalid cache for %s: %s\n" % (targets[0], str(e)),
+              targets=targets,
+              )
+
+          if oldDependencyInfo is not None:
+            configuration.primeFileDigestCache(oldDependencyInfo)
+          if cache.restore(targets[0], buildArgs, "Cached %s\n" % targets[0]):
+            # Like an up to date target there's no result.
+            return
+          cache.releaseTargets(targets)
+
+      startTime = time.time()
       try:
         result = func()
       except Exception:
@@ -320,12 +387,17 @@ class ScriptTool(Tool):
         raise
       
       if targets:
+        if cache is not None:
+          sourcePaths = cache.normalizePaths(sourcePaths)
         newDependencyInfo = configuration.createDependencyInfo(
           targets=targets,
           args=buildArgs,
           dependencies=sourcePaths,
+          calculateDigests=cache is not None,
           )
         configuration.storeDependencyInfo(newDependencyInfo)
+        if cache is not None:
+          cache.store(newDependencyInfo, duration=time.time() - startTime)
         
       return result
 
@@ -338,10 +410,13 @@ class ScriptTool(Tool):
     currentScript = Script.getCurrent()
 
     if targets is not None:
-      targets = [FileTarget(path=t, task=task) for t in targets]
-      currentScript.getDefaultTarget().addTargets(targets)
-      return targets
+      # Don't rebind 'targets', _run() needs the paths.
+      fileTargets = [FileTarget(path=t, task=task) for t in targets]
+      currentScript.getDefaultTarget().addTargets(fileTargets)
+      return fileTargets
     else:
+      # We can't tell what a function without targets writes to.
+      cake.graph.markNotReplayable()
       target = Target(task)
       currentScript.getDefaultTarget().addTarget(target)
       return target
@@ -7,17 +7,52 @@
 
 import os
 import subprocess
+import tempfile
+import time
+import cake.actioncache
 import cake.filesys
+import cake.graph
 import cake.path
 from cake.async import waitForAsyncResult, flatten
 from cake.target import Target, FileTarget, getPaths, getTasks
 from cake.library import Tool
 from cake.script import Script
+from cake.engine import BuildError
 
 _undefined = object()
 
 class ShellTool(Tool):
 
+  cachePath = None
+  """Set the path of a cache for the targets of commands.
+  
+  If set then the targets of a command are copied from the cache instead
+  of running the command when it has been run with the same arguments
+  and sources before. Only commands with targets are cached, and their
+  targets must depend only on the arguments and sources. The output of a
+  cached command is captured and output again when its targets are
+  copied from the cache.
+  
+  The cache can be shared with a compiler's object cache, see
+  L{cake.library.compilers.Compiler.objectCachePath}.
+  
+  If the value is None then commands aren't cached.
+  @type: string or None
+  """
+  cacheCodec = "zlib"
+  """Set how targets are stored in the cache, see L{cake.cachecodec}.
+  @type: string
+  """
+  cacheRemote = None
+  """Set the location of a second level cache shared by a team, see
+  L{cake.remotecache}.
+  @type: string or None
+  """
+  cacheMaximumSize = None
+  """Set the maximum size of the cache in bytes, or None for no limit.
+  @type: int or None
+  """
+
   def __init__(self, configuration, env=None):
     Tool.__init__(self, configuration)
     if env is None:
@@ -47,6 +82,9 @@ class ShellTool(Tool):
 
     @param removeTargets: If specified then the target files will be removed
     before running the command if they already exist.
+
+    If L{cachePath} is set then the targets may be copied from the cache
+    instead of running the command.
     """
     tool = self.clone()
     
@@ -73,11 +111,13 @@ class ShellTool(Tool):
         argsList = args
         executable = abspath(args[0])
         
+      cache = None
       if targets:
         # Check dependencies to see if they've changed
         buildArgs = argsList + sourcePaths + targets
+        oldDependencyInfo = None
         try:
-          _, reasonToBuild = configuration.checkDependencyInfo(
+          oldDependencyInfo, reasonToBuild = configuration.checkDependencyInfo(
             targets[0],
             buildArgs,
             )
@@ -91,6 +131,25 @@ class ShellTool(Tool):
           "reason",
           "Rebuilding '%s' because %s.\n" % (targets[0], reasonToBuild),
           )
+
+        if self.cachePath is not None:
+          try:
+            cache = cake.actioncache.ActionCache(
+              configuration,
+              self.cachePath,
+              codec=self.cacheCodec,
+              remote=self.cacheRemote,
+              maximumSize=self.cacheMaximumSize,
+              )
+          except ValueError, e:
+            msg = "cake: invalid cache for %s: %s\n" % (targets[0], str(e))
+            engine.raiseError(msg, targets=targets)
+
+          if oldDependencyInfo is not None:
+            configuration.primeFileDigestCache(oldDependencyInfo)
+          if cache.restore(targets[0], buildArgs, "Cached %s\n" % argsList[0]):
+            return
+          cache.releaseTargets(targets)
       
       # Create target directories first
       if targets:
@@ -125,33 +184,71 @@ class ShellTool(Tool):
         "run: %s\n" % argsString,
         )
 
+      if cache is not None:
+        # Capture the output so it can be output again on a cache hit.
+        startTime = time.time()
+        outputFile = tempfile.TemporaryFile()
+        stderr = subprocess.STDOUT
+      else:
+        outputFile = None
+        stderr = None
+
       try:
-        p = subprocess.Popen(
-          args=args,
-          executable=executable,
-          env=self._env,
-          stdin=subprocess.PIPE,
-          shell=shell,
-          cwd=cwd,
-          )
-      except EnvironmentError, e:
-        msg = "cake: failed to launch %s: %s\n" % (argsList[0], str(e))
-        engine.raiseError(msg, targets=targets)
+        try:
+          p = subprocess.Popen(
+            args=args,
+            executable=executable,
+            env=self._env,
+            stdin=subprocess.PIPE,
+            stdout=outputFile,
+            stderr=stderr,
+            shell=shell,
+            cwd=cwd,
+            )
+        except EnvironmentError, e:
+          msg = "cake: failed to launch %s: %s\n" % (argsList[0], str(e))
+          engine.raiseError(msg, targets=targets)
+
+        p.stdin.close()
+
+        engine.registerProcess(p)
+        try:
+          exitCode = p.wait()
+        finally:
+          engine.unregisterProcess(p)
+
+        if outputFile is not None:
+          outputFile.seek(0)
+          output = outputFile.read().replace("\r\n", "\n")
+          if output:
+            engine.logger.outputError(output)
+      finally:
+        if outputFile is not None:
+          outputFile.close()
+
+      if engine.aborted:
+        raise BuildError()
 
-      p.stdin.close()
-      exitCode = p.wait()
-      
       if exitCode != 0:
         msg = "%s exited with code %i\n" % (argsList[0], exitCode)
         engine.raiseError(msg, targets=targets)
 
       if targets:
+        if cache is not None:
+          sourcePaths = cache.normalizePaths(sourcePaths)
         newDependencyInfo = configuration.createDependencyInfo(
           targets=targets,
           args=buildArgs,
           dependencies=sourcePaths,
+          calculateDigests=cache is not None,
           )
         configuration.storeDependencyInfo(newDependencyInfo)
+        if cache is not None:
+          cache.store(
+            newDependencyInfo,
+            output,
+            duration=time.time() - startTime,
+            )
 
     @waitForAsyncResult
     def _run(targets, sources, cwd):
@@ -166,6 +263,8 @@ class ShellTool(Tool):
         Script.getCurrent().getDefaultTarget().addTargets(targets)
         return targets
       else:
+        # We can't tell what a command without targets writes to.
+        cake.graph.markNotReplayable()
         target = Target(task)
         Script.getCurrent().getDefaultTarget().addTarget(target)
         return target
@@ -182,7 +281,7 @@ class ShellTool(Tool):
     return self._env.items()
 
   def update(self, value):
-    return self._env.update(value)
+    return self._mutable("_env").update(value)
 
   def get(self, key, default=_undefined):
     if default is _undefined:
@@ -194,10 +293,10 @@ class ShellTool(Tool):
     return self._env[key]
 
   def __setitem__(self, key, value):
-    self._env[key] = value
+    self._mutable("_env")[key] = value
 
   def __delitem__(self, key):
-    del self._env[key]
+    del self._mutable("_env")[key]
 
   def appendPath(self, path):
     basePath = self.configuration.basePath
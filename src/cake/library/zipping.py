@@ -389,6 +389,6 @@ class ZipTool(Tool):
 
     currentScript = Script.getCurrent()
     currentScript.getDefaultTarget().addTarget(fileTarget)
-    currentScript.getTarget(cake.path.baseName(target)).addTarget(fileTarget)
+    currentScript.registerTarget(fileTarget, (cake.path.baseName(target),))
 
     return fileTarget
@@ -0,0 +1,152 @@
+"""Memory Usage Utilities.
+
+Provides functions to query the memory used by the current process and
+a monitor that periodically reports memory usage and live task counts.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import gc
+import os
+import sys
+import time
+import threading
+
+from cake.task import Task
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+def getPeakRss():
+  """Get the peak resident set size of the current process.
+
+  @return: The peak resident set size in bytes or None if it can't be
+  determined on this platform.
+  @rtype: int or None
+  """
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == "darwin":
+    return peak # Already in bytes
+  else:
+    return peak * 1024
+
+def getCurrentRss():
+  """Get the current resident set size of the current process.
+
+  @return: The resident set size in bytes or None if it can't be
+  determined on this platform.
+  @rtype: int or None
+  """
+  try:
+    f = open("/proc/self/statm", "r")
+    try:
+      pages = int(f.read().split()[1])
+    finally:
+      f.close()
+    return pages * os.sysconf("SC_PAGE_SIZE")
+  except (EnvironmentError, ValueError, IndexError, AttributeError):
+    return None
+
+def countLiveTasks():
+  """Count the L{Task} objects that are still alive.
+
+  This walks every object tracked by the garbage collector so it is
+  relatively expensive and should not be called frequently.
+
+  @return: A dictionary mapping each L{Task.State} value to the number of
+  live tasks in that state.
+  @rtype: dict of (string, int)
+  """
+  counts = {}
+  for obj in gc.get_objects():
+    if isinstance(obj, Task):
+      state = obj.state
+      counts[state] = counts.get(state, 0) + 1
+  return counts
+
+def _formatBytes(size):
+  if size is None:
+    return "?"
+  return "%.1fMB" % (size / (1024.0 * 1024.0))
+
+class MemoryMonitor(object):
+  """Periodically outputs memory usage as 'memory' debug messages.
+
+  Usage::
+    monitor = MemoryMonitor(logger, interval=5.0)
+    monitor.start()
+    ...
+    monitor.stop()
+  """
+
+  def __init__(self, logger, interval=5.0):
+    """Construct a memory monitor.
+
+    @param logger: The logger to output reports to.
+    @type logger: L{cake.logging.Logger}
+    @param interval: The number of seconds between reports.
+    @type interval: float
+    """
+    self.logger = logger
+    self.interval = interval
+    self._startTime = None
+    self._stopEvent = threading.Event()
+    self._thread = None
+
+  def report(self):
+    """Output a single memory usage report.
+    """
+    counts = countLiveTasks()
+    completed = counts.get(Task.State.SUCCEEDED, 0) + counts.get(Task.State.FAILED, 0)
+    running = counts.get(Task.State.RUNNING, 0) + counts.get(Task.State.WAITING_FOR_COMPLETE, 0)
+    waiting = counts.get(Task.State.WAITING_FOR_START, 0)
+    new = counts.get(Task.State.NEW, 0)
+
+    if self._startTime is None:
+      elapsed = 0.0
+    else:
+      elapsed = time.time() - self._startTime
+
+    self.logger.outputDebug(
+      "memory",
+      "memory: %.1fs rss=%s peak=%s tasks=%i (new=%i, waiting=%i, running=%i, completed=%i)\n" % (
+        elapsed,
+        _formatBytes(getCurrentRss()),
+        _formatBytes(getPeakRss()),
+        new + waiting + running + completed,
+        new,
+        waiting,
+        running,
+        completed,
+        ),
+      )
+
+  def start(self):
+    """Start reporting on a background thread.
+    """
+    self._startTime = time.time()
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop reporting and output a final report.
+    """
+    self._stopEvent.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+    self.report()
+
+  def _run(self):
+    while True:
+      self._stopEvent.wait(self.interval)
+      if self._stopEvent.isSet():
+        break
+      self.report()
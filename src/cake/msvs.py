@@ -213,12 +213,16 @@ except Exception:
   def _getCodecFromCodepage():
     return None
 
-def vswhere(args=[]):
+def vswhere(args=[], probeCache=None):
   """Helper function for running vswhere helper utility and parsing the output.
 
   The vswhere utility can be used to find the installation locations of Visual Studio 2017 or later.
   It can also be used to find older install locations by passing "-legacy" as an argument.
 
+  @param probeCache: If not None the output is cached in this cache
+  until vswhere or the list of installed instances changes.
+  @type probeCache: L{cake.probe.ProbeCache} or None
+
   @return: An array of dictionaries containing information about each installation.
 
   @raise EnvironmentError:
@@ -232,9 +236,26 @@ def vswhere(args=[]):
   vsWherePath = cake.path.join(vsInstaller, 'vswhere.exe')
   if not os.path.isfile(vsWherePath):
     raise EnvironmentError("vswhere not found at " + vsWherePath)
+
+  if probeCache is None:
+    return _runVswhere(vsWherePath, args)
+
+  # A directory is added here for each installed instance.
+  programData = os.environ.get('ProgramData', r'C:\ProgramData')
+  instancesDir = cake.path.join(programData, 'Microsoft', 'VisualStudio', 'Packages', '_Instances')
+  return probeCache.probe(
+    "vswhere",
+    vsWherePath,
+    _runVswhere,
+    args=(tuple(args),),
+    dependencies=[instancesDir],
+    )
+
+def _runVswhere(vsWherePath, args):
+  vsInstaller = cake.path.dirName(vsWherePath)
 
   p = subprocess.Popen(
-    args=["vswhere", "-format", "json", "-utf8"] + args,
+    args=["vswhere", "-format", "json", "-utf8"] + list(args),
     executable=vsWherePath,
     cwd=vsInstaller,
     stdout=subprocess.PIPE,
@@ -249,7 +270,7 @@ def vswhere(args=[]):
     # -utf8 flag. Let's try using it without -utf8 and then use whatever the current
     # Windows codepage is to decode it.
     p = subprocess.Popen(
-      args=["vswhere", "-format", "json"] + args,
+      args=["vswhere", "-format", "json"] + list(args),
       executable=vsWherePath,
       cwd=vsInstaller,
       stdout=subprocess.PIPE,
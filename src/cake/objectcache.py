@@ -0,0 +1,606 @@
+"""Object Cache.
+
+The object cache stores object files named after the digest of
+everything used to build them: the target path, the compiler
+arguments and the paths and contents of the object's dependencies. The
+dependencies are only known once an object has been compiled, so each
+target also has a manifest that records the dependency sets it has been
+built with.
+
+A manifest is one small file per target. Each entry holds the digest of
+the compiler arguments, the dependency paths, the digest of each
+dependency's contents and the digest of the resulting cached object.
+Actions with more than one output or with output text to replay, see
+L{cake.actioncache}, also record their other outputs and the text.
+Entries are kept in most recently used order so a lookup usually stops
+at the first entry, and the comparison of an entry stops at the first
+dependency whose contents have changed.
+
+Manifests are stored with marshal rather than pickle, and every entry
+read is checked to be plain data, as manifests may come from a remote
+cache that other people can write to, see L{cake.remotecache}.
+
+Manifests and cached objects are replaced by renaming a temporary file
+over them so concurrent readers and writers never see a partially
+written file. When two builds update the same manifest at once one of
+the updates may be lost, which only costs a cache miss later.
+
+Objects are stored by a codec, see L{cake.cachecodec}, which decides
+whether they are compressed and how cache hits are written to their
+targets. Each codec adds its own suffix to the names of the objects it
+stores so caches can be shared by builds using different codecs.
+
+The cache is kept to a maximum size by L{trimCache()}, which removes the
+least recently used objects. Restoring an object updates its access
+time to record when it was last used. The modification time is left
+alone as hard linked objects share it with their targets. Builds that add
+objects to a cache with a maximum size start a trim in a background
+process with L{startTrim()} at most once every L{trimInterval} seconds.
+A trim can also be run with 'cake --cache-trim'.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import marshal
+import os
+import os.path
+import subprocess
+import sys
+import thread
+import time
+
+import cake.cachecodec
+import cake.filesys
+import cake.hash
+import cake.path
+
+_MAGIC = "CKMF"
+_VERSION = 2
+
+maximumEntries = 32
+"""The maximum number of entries kept in a manifest.
+
+Once a manifest is full adding an entry drops the least recently used
+one.
+@type: int
+"""
+
+trimInterval = 60 * 60
+"""The minimum time in seconds between background trims of a cache.
+@type: int
+"""
+
+_LOCK_NAME = "trim.lock"
+_STAMP_NAME = "trim.stamp"
+_HEX_CHARS = frozenset("0123456789abcdef")
+
+# Trim to a little under the maximum size so the next few builds don't
+# need to trim again.
+_lowWaterMark = 0.9
+
+# Temporary files and trim locks older than this were left behind by
+# processes that died.
+_staleTime = 24 * 60 * 60
+
+def _getTmpPath(path):
+  return "%s.%i.%i.tmp" % (path, os.getpid(), thread.get_ident())
+
+def _replaceFile(tmpPath, path):
+  try:
+    cake.filesys.renameFile(tmpPath, path)
+  except EnvironmentError:
+    try:
+      cake.filesys.remove(tmpPath)
+    except EnvironmentError:
+      pass
+    raise
+
+def getCacheName(digest):
+  """Return the name of a file in the cache named after a digest.
+
+  @param digest: The digest of the file.
+  @type digest: string of 20 bytes
+
+  @return: The path of the file relative to the cache directory, within
+  two levels of sub-directories named after the first two characters of
+  the digest. The path is always separated by '/'.
+  @rtype: string
+  """
+  digestStr = cake.hash.hexlify(digest)
+  return "/".join((digestStr[0], digestStr[1], digestStr))
+
+def getManifestName(targetDigest):
+  """Return the name of a target's manifest relative to the cache.
+
+  @param targetDigest: The digest of the target's path.
+  @type targetDigest: string of 20 bytes
+  """
+  return getCacheName(targetDigest) + ".manifest"
+
+def getCachePath(cachePath, digest):
+  """Return the path of a file in the cache named after a digest.
+
+  @param cachePath: The path of the cache directory.
+  @type cachePath: string
+  @param digest: The digest of the file.
+  @type digest: string of 20 bytes
+
+  @return: The path of the file, see L{getCacheName()}.
+  @rtype: string
+  """
+  return cake.path.join(cachePath, getCacheName(digest))
+
+def getManifestPath(cachePath, targetDigest):
+  """Return the path of a target's manifest.
+
+  @param cachePath: The path of the cache directory.
+  @type cachePath: string
+  @param targetDigest: The digest of the target's path.
+  @type targetDigest: string of 20 bytes
+  """
+  return cake.path.join(cachePath, getManifestName(targetDigest))
+
+def readManifest(path):
+  """Read the entries of a manifest.
+
+  @param path: The path of the manifest.
+  @type path: string
+
+  @return: The entries of the manifest, most recently used first. The
+  list is empty if the manifest doesn't exist or is invalid. Each entry
+  is a tuple of (argsDigest, dependencies, dependencyDigests,
+  objectDigest) optionally followed by a tuple of (outputs, outputText,
+  modes, duration), see L{getEntryOutputs()} and L{getEntryDuration()}.
+  @rtype: list of tuple
+  """
+  try:
+    data = cake.filesys.readFile(path)
+  except EnvironmentError:
+    return []
+
+  if not data.startswith(_MAGIC):
+    return []
+
+  try:
+    version, entries = marshal.loads(data[len(_MAGIC):])
+  except Exception:
+    return []
+
+  if version != _VERSION or not isinstance(entries, list):
+    return []
+
+  return [e for e in entries if _isValidEntry(e)]
+
+def _isStrings(values, types=basestring):
+  return (
+    isinstance(values, (list, tuple)) and
+    all(isinstance(v, types) for v in values)
+    )
+
+def _isValidEntry(entry):
+  """Check that a manifest entry read from a file has the expected types.
+  """
+  if not isinstance(entry, tuple) or len(entry) not in (4, 5):
+    return False
+  argsDigest, depPaths, depDigests, objectDigest = entry[:4]
+  if not (
+    isinstance(argsDigest, str) and
+    isinstance(objectDigest, str) and
+    _isStrings(depPaths) and
+    _isStrings(depDigests, str) and
+    len(depPaths) == len(depDigests)
+    ):
+    return False
+  if len(entry) == 5:
+    extra = entry[4]
+    if not isinstance(extra, tuple) or len(extra) not in (3, 4):
+      return False
+    outputs, output, modes = extra[:3]
+    if not (
+      _isStrings(outputs) and
+      isinstance(output, basestring) and
+      _isStrings(modes, (int, long))
+      ):
+      return False
+    if len(extra) == 4 and not isinstance(extra[3], (int, long, float)):
+      return False
+  return True
+
+def writeManifest(path, entries):
+  """Replace a manifest with new entries.
+
+  @param path: The path of the manifest.
+  @type path: string
+  @param entries: The entries, most recently used first.
+  @type entries: list of tuple
+
+  @raise EnvironmentError: If the manifest couldn't be written.
+  """
+  data = _MAGIC + marshal.dumps((_VERSION, entries))
+  tmpPath = _getTmpPath(path)
+  cake.filesys.writeFile(tmpPath, data)
+  _replaceFile(tmpPath, path)
+
+def findEntry(entries, argsDigest, getFileDigest):
+  """Find the first entry that matches the current dependencies.
+
+  @param entries: The entries of a manifest.
+  @type entries: list of tuple
+  @param argsDigest: The digest of the current compiler arguments.
+  @type argsDigest: string of 20 bytes
+  @param getFileDigest: A function that returns the current digest of
+  a dependency's contents given its path. It should raise an
+  EnvironmentError if the dependency doesn't exist.
+  @type getFileDigest: callable
+
+  @return: The index of the matching entry or -1 if no entry matches.
+  @rtype: int
+  """
+  for index, entry in enumerate(entries):
+    if entry[0] != argsDigest:
+      continue
+    try:
+      for path, digest in zip(entry[1], entry[2]):
+        if getFileDigest(path) != digest:
+          break
+      else:
+        return index
+    except EnvironmentError:
+      continue # One of the dependencies no longer exists
+  return -1
+
+def getEntryOutputs(entry):
+  """Return the outputs of an entry other than its object.
+
+  @param entry: A manifest entry.
+  @type entry: tuple
+
+  @return: A tuple of the paths of the other outputs, the output text of
+  the action that created them and the permission bits of the object
+  followed by each other output. The permission bits are empty if the
+  outputs aren't executable.
+  @rtype: tuple of (tuple of string, string, tuple of int)
+  """
+  if len(entry) > 4:
+    return entry[4][:3]
+  return (), "", ()
+
+def getEntryDuration(entry):
+  """Return how long the action that created an entry's outputs took.
+
+  @param entry: A manifest entry.
+  @type entry: tuple
+
+  @return: The duration in seconds or None if it wasn't recorded.
+  @rtype: float or None
+  """
+  if len(entry) > 4 and len(entry[4]) > 3:
+    return entry[4][3]
+  return None
+
+def getEntryDigests(entry):
+  """Return the digests of the cached files an entry refers to.
+
+  @param entry: A manifest entry.
+  @type entry: tuple
+
+  @return: The digest of the object followed by a digest for each of
+  the entry's other outputs, see L{getEntryOutputs()}.
+  @rtype: list of string of 20 bytes
+  """
+  objectDigest = entry[3]
+  digests = [objectDigest]
+  outputs = getEntryOutputs(entry)[0]
+  for i in xrange(len(outputs)):
+    digests.append(cake.hash.sha1("%s%i" % (objectDigest, i + 1)).digest())
+  return digests
+
+def addEntry(entries, entry):
+  """Return the entries with an entry moved or added to the front.
+
+  @param entries: The entries of a manifest.
+  @type entries: list of tuple
+  @param entry: The entry that was most recently used.
+  @type entry: tuple
+
+  @return: A new list of entries, no longer than L{maximumEntries}.
+  @rtype: list of tuple
+  """
+  objectDigest = entry[3]
+  newEntries = [entry]
+  for e in entries:
+    if e[3] != objectDigest:
+      newEntries.append(e)
+  del newEntries[maximumEntries:]
+  return newEntries
+
+def storeObject(sourcePath, objectPath, codec):
+  """Store a file in the cache.
+
+  @param sourcePath: The path of the file to store.
+  @type sourcePath: string
+  @param objectPath: The path of the cached object, see L{getCachePath()}
+  plus the codec's suffix.
+  @type objectPath: string
+  @param codec: The codec to store the object with.
+  @type codec: L{cake.cachecodec.Codec}
+
+  @raise EnvironmentError: If the object couldn't be stored.
+  """
+  cake.filesys.makeDirs(os.path.dirname(objectPath))
+  tmpPath = _getTmpPath(objectPath)
+  try:
+    codec.store(sourcePath, tmpPath)
+  except EnvironmentError:
+    try:
+      cake.filesys.remove(tmpPath)
+    except EnvironmentError:
+      pass
+    raise
+  _replaceFile(tmpPath, objectPath)
+
+def restoreObject(objectPath, targetPath, codec):
+  """Restore a cached object and record that it was used.
+
+  @param objectPath: The path of the cached object.
+  @type objectPath: string
+  @param targetPath: The path to write the object to.
+  @type targetPath: string
+  @param codec: The codec the object was stored with.
+  @type codec: L{cake.cachecodec.Codec}
+
+  @raise EnvironmentError: If the object couldn't be restored.
+  """
+  releaseTarget(targetPath)
+  cake.filesys.makeDirs(os.path.dirname(targetPath))
+  codec.restore(objectPath, targetPath)
+  try:
+    os.utime(objectPath, (time.time(), os.stat(objectPath).st_mtime))
+  except EnvironmentError:
+    pass # Eg. a read-only cache.
+
+def releaseTarget(targetPath):
+  """Unlink a target that may be hard linked to a cached object.
+
+  Should be called before a target is written to in place so the cached
+  object isn't modified too.
+
+  @param targetPath: The path of the target.
+  @type targetPath: string
+  """
+  try:
+    if os.stat(targetPath).st_nlink > 1:
+      os.remove(targetPath)
+  except EnvironmentError:
+    pass # Doesn't exist or will fail when written to.
+
+def _isDigest(name):
+  return len(name) == 40 and _HEX_CHARS.issuperset(name.lower())
+
+def _splitObjectName(name, suffixes):
+  digestStr, ext = name[:40], name[40:]
+  if ext in suffixes and _isDigest(digestStr):
+    return digestStr.lower()
+  return None
+
+def _listDir(path):
+  try:
+    return os.listdir(path)
+  except EnvironmentError:
+    return []
+
+def _acquireLock(lockPath):
+  for _ in xrange(2):
+    try:
+      fd = os.open(lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except EnvironmentError:
+      # Break the lock if the process holding it has probably died.
+      try:
+        if time.time() - os.stat(lockPath).st_mtime < _staleTime:
+          return False
+        os.remove(lockPath)
+      except EnvironmentError:
+        pass
+    else:
+      os.close(fd)
+      return True
+  return False
+
+def trimCache(cachePath, maximumSize=None):
+  """Remove the least recently used objects from a cache.
+
+  Objects are removed until the total size of the cache is a little
+  under the maximum size, and their entries are removed from the
+  manifests. Temporary files left behind by builds that died and the
+  per-target dependency lists written by older versions of Cake are
+  always removed.
+
+  It is safe to trim a cache while other builds are using it. Builds
+  that find an object has been removed will compile it instead.
+
+  @param cachePath: The path of the cache directory.
+  @type cachePath: string
+  @param maximumSize: The maximum size of the cache in bytes or None to
+  only remove temporary files and old dependency lists.
+  @type maximumSize: int or None
+
+  @return: A tuple of the number of files removed, the number of bytes
+  removed and the number of bytes remaining. None if the cache is
+  already being trimmed by another process.
+  @rtype: tuple of (int, int, int) or None
+  """
+  lockPath = os.path.join(cachePath, _LOCK_NAME)
+  if not _acquireLock(lockPath):
+    return None
+  try:
+    result = _trimCache(cachePath, maximumSize)
+    try:
+      cake.filesys.writeFile(os.path.join(cachePath, _STAMP_NAME), "")
+    except EnvironmentError:
+      pass
+    return result
+  finally:
+    try:
+      os.remove(lockPath)
+    except EnvironmentError:
+      pass
+
+def _trimCache(cachePath, maximumSize):
+  startTime = time.time()
+  objects = []
+  manifests = []
+  totalSize = 0
+  removedCount = 0
+  removedSize = 0
+
+  suffixes = cake.cachecodec.getSuffixes()
+
+  for dirName1 in _listDir(cachePath):
+    if len(dirName1) != 1:
+      continue
+    dirPath1 = os.path.join(cachePath, dirName1)
+    for dirName2 in _listDir(dirPath1):
+      dirPath2 = os.path.join(dirPath1, dirName2)
+      for name in _listDir(dirPath2):
+        path = os.path.join(dirPath2, name)
+        try:
+          s = os.stat(path)
+        except EnvironmentError:
+          continue # Removed by another process
+
+        if name.endswith(".tmp"):
+          if startTime - s.st_mtime > _staleTime:
+            try:
+              os.remove(path)
+            except EnvironmentError:
+              continue
+            removedCount += 1
+            removedSize += s.st_size
+          else:
+            totalSize += s.st_size
+        elif name.endswith(".manifest"):
+          manifests.append((path, s.st_mtime))
+          totalSize += s.st_size
+        elif _isDigest(name) and os.path.isdir(path):
+          # Dependency lists from before manifests were used.
+          try:
+            cake.filesys.removeTree(path)
+          except EnvironmentError:
+            continue
+          removedCount += 1
+        else:
+          digestStr = _splitObjectName(name, suffixes)
+          if digestStr is not None:
+            lastUsed = max(s.st_atime, s.st_mtime)
+            objects.append((lastUsed, s.st_size, path, digestStr))
+            totalSize += s.st_size
+
+  if maximumSize is None or totalSize <= maximumSize:
+    return removedCount, removedSize, totalSize
+
+  targetSize = int(maximumSize * _lowWaterMark)
+  objects.sort()
+  evicted = set()
+  for _, size, path, digestStr in objects:
+    if totalSize <= targetSize:
+      break
+    try:
+      os.remove(path)
+    except EnvironmentError:
+      continue # Eg. open by another process on Windows
+    evicted.add(digestStr)
+    totalSize -= size
+    removedCount += 1
+    removedSize += size
+
+  # An object may also be stored by other codecs.
+  for _, _, path, digestStr in objects:
+    if digestStr in evicted and os.path.exists(path):
+      evicted.discard(digestStr)
+
+  if evicted:
+    # Manifests changed since we started may refer to objects added since.
+    for path, mtime in manifests:
+      if mtime >= startTime:
+        continue
+      entries = readManifest(path)
+      newEntries = []
+      for e in entries:
+        for digest in getEntryDigests(e):
+          if cake.hash.hexlify(digest) in evicted:
+            break
+        else:
+          newEntries.append(e)
+      if len(newEntries) == len(entries):
+        continue
+      try:
+        size = os.stat(path).st_size
+        if newEntries:
+          writeManifest(path, newEntries)
+          newSize = os.stat(path).st_size
+        else:
+          os.remove(path)
+          newSize = 0
+          removedCount += 1
+      except EnvironmentError:
+        continue
+      totalSize -= size - newSize
+      removedSize += size - newSize
+
+  return removedCount, removedSize, totalSize
+
+def startTrim(cachePath, maximumSize):
+  """Trim a cache in a background process if it hasn't been recently.
+
+  The process keeps running after the build has finished.
+
+  @param cachePath: The path of the cache directory.
+  @type cachePath: string
+  @param maximumSize: The maximum size of the cache in bytes.
+  @type maximumSize: int
+
+  @return: True if a trim was started.
+  @rtype: bool
+  """
+  stampPath = os.path.join(cachePath, _STAMP_NAME)
+  try:
+    if time.time() - os.stat(stampPath).st_mtime < trimInterval:
+      return False
+  except EnvironmentError:
+    pass # Never been trimmed
+
+  # Update the stamp now so builds finishing at the same time don't also
+  # start a trim.
+  try:
+    cake.filesys.writeFile(stampPath, "")
+  except EnvironmentError:
+    return False
+
+  env = dict(os.environ)
+  srcDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  pythonPath = env.get("PYTHONPATH")
+  if pythonPath:
+    env["PYTHONPATH"] = srcDir + os.pathsep + pythonPath
+  else:
+    env["PYTHONPATH"] = srcDir
+
+  devNull = open(os.devnull, "r+b")
+  try:
+    subprocess.Popen(
+      [sys.executable, "-m", "cake.objectcache", cachePath, str(maximumSize)],
+      env=env,
+      stdin=devNull,
+      stdout=devNull,
+      stderr=devNull,
+      close_fds=os.name != "nt",
+      )
+  except EnvironmentError:
+    return False
+  finally:
+    devNull.close()
+  return True
+
+if __name__ == "__main__":
+  trimCache(sys.argv[1], int(sys.argv[2]))
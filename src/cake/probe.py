@@ -0,0 +1,268 @@
+"""Toolchain Probe Cache.
+
+Finding a toolchain usually means running some of its executables, eg.
+'gcc -dumpversion', which is slow compared with the rest of a config
+script. The probe cache stores the results of these probes on disk,
+keyed by the path, modification time and size of the executable that
+was probed, so they only need to be run again once the toolchain
+changes.
+
+Probes that aren't cached can be started in the background with
+L{ProbeCache.prefetch()} so that several probes run in parallel. Their
+results are then collected with L{ProbeCache.probe()}.
+
+Config scripts can cache their own probes, eg::
+
+  def getPythonVersion(pythonExe):
+    ...
+    return version
+
+  version = engine.probeCache.probe("python-version", pythonExe, getPythonVersion)
+
+Set L{Engine.probeCachePath} to store the results on disk, otherwise
+they are only cached for the duration of the build.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+import sys
+import threading
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+import cake.filesys
+
+_MAGIC = "CKPC"
+_VERSION = 1
+
+def _getStamp(path):
+  """Return the (mtime, size) of a path or None if it doesn't exist.
+  """
+  try:
+    s = os.stat(path)
+  except EnvironmentError:
+    return None
+  return (s.st_mtime, s.st_size)
+
+class _PendingProbe(object):
+  """A probe running on a background thread.
+  """
+
+  def __init__(self, func, path, args):
+    self._func = func
+    self._path = path
+    self._args = args
+    self._event = threading.Event()
+    self._result = None
+    self._excInfo = None
+    thread = threading.Thread(target=self._run)
+    thread.daemon = True
+    thread.start()
+
+  def _run(self):
+    try:
+      self._result = self._func(self._path, *self._args)
+    except Exception:
+      self._excInfo = sys.exc_info()
+    self._event.set()
+
+  def wait(self):
+    """Wait for the probe to finish and return its result.
+
+    @raise Exception: Re-raises any exception raised by the probe.
+    """
+    self._event.wait()
+    if self._excInfo is not None:
+      raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+    return self._result
+
+class ProbeCache(object):
+  """A cache of toolchain probe results.
+
+  @ivar path: The path of the file the results are stored in or None if
+  they aren't stored on disk.
+  @type path: string or None
+  """
+
+  def __init__(self, path=None):
+    """Construct a probe cache.
+
+    @param path: The path of the file to store the results in. If None
+    the results are only cached in memory.
+    @type path: string or None
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._saveLock = threading.Lock()
+    self._results = None
+    self._pending = {}
+
+  def _load(self):
+    if self.path is None:
+      return {}
+
+    try:
+      data = cake.filesys.readFile(self.path)
+    except EnvironmentError:
+      return {}
+
+    if not data.startswith(_MAGIC):
+      return {}
+
+    try:
+      version, results = pickle.loads(data[len(_MAGIC):])
+    except Exception:
+      return {}
+
+    if version != _VERSION:
+      return {}
+
+    return results
+
+  def _save(self):
+    self._saveLock.acquire()
+    try:
+      # Save the latest results in case another thread saved while we
+      # were waiting for the lock.
+      data = _MAGIC + pickle.dumps((_VERSION, self._results), 2)
+      # Another build may be saving the cache at the same time.
+      tmpPath = "%s.%i.tmp" % (self.path, os.getpid())
+      try:
+        cake.filesys.writeFile(tmpPath, data)
+        cake.filesys.renameFile(tmpPath, self.path)
+      except EnvironmentError:
+        # The results will be probed again next time.
+        pass
+    finally:
+      self._saveLock.release()
+
+  def _getStamp(self, path, dependencies):
+    stamps = [_getStamp(p) for p in [path] + list(dependencies)]
+    if stamps[0] is None:
+      return None
+    return tuple(stamps)
+
+  def _lookup(self, key, stamp):
+    """Return the cached result or pending probe, or None if not found.
+
+    Must be called with the lock held.
+    """
+    if self._results is None:
+      self._results = self._load()
+
+    entry = self._results.get(key, None)
+    if entry is not None and entry[0] == stamp:
+      return entry
+
+    return self._pending.get(key, None)
+
+  def prefetch(self, name, path, func, args=(), dependencies=()):
+    """Start a probe in the background if its result isn't cached.
+
+    Call L{probe()} with the same arguments to get the result.
+
+    @param name: The name of the probe. Identifies the probe along with
+    the path and arguments.
+    @type name: string
+
+    @param path: The path of the executable to probe.
+    @type path: string
+
+    @param func: The function that performs the probe. It is called
+    with the path and arguments. Its result must be picklable.
+    @type func: callable
+
+    @param args: Extra arguments to pass to the function.
+    @type args: tuple
+
+    @param dependencies: The paths of other files or directories that
+    the result depends on. The result is probed again if any of their
+    modification times or sizes change.
+    @type dependencies: sequence of string
+    """
+    path = os.path.abspath(path)
+    key = (name, os.path.normcase(path), tuple(args))
+    stamp = self._getStamp(path, dependencies)
+    if stamp is None:
+      return # probe() will run it and fail.
+
+    self._lock.acquire()
+    try:
+      if self._lookup(key, stamp) is None:
+        self._pending[key] = _PendingProbe(func, path, tuple(args))
+    finally:
+      self._lock.release()
+
+  def probe(self, name, path, func, args=(), dependencies=()):
+    """Return the result of a probe.
+
+    The result is taken from the cache if the executable and any other
+    dependencies haven't changed. Otherwise the probe is run, or the
+    result of a probe started by L{prefetch()} is collected, and the
+    result is stored in the cache. Exceptions raised by the probe aren't
+    cached.
+
+    See L{prefetch()} for a description of the parameters.
+
+    @return: The result of calling func(path, *args).
+
+    @raise Exception: Any exception raised by the probe.
+    """
+    path = os.path.abspath(path)
+    args = tuple(args)
+    key = (name, os.path.normcase(path), args)
+    stamp = self._getStamp(path, dependencies)
+    if stamp is None:
+      # Nothing to key the result on.
+      return func(path, *args)
+
+    self._lock.acquire()
+    try:
+      entry = self._lookup(key, stamp)
+      if entry is None:
+        # Run it in the background too so that other threads wanting the
+        # same result wait for this probe rather than running their own.
+        entry = self._pending[key] = _PendingProbe(func, path, args)
+    finally:
+      self._lock.release()
+
+    if isinstance(entry, tuple):
+      return entry[1]
+
+    try:
+      result = entry.wait()
+    except Exception:
+      self._lock.acquire()
+      try:
+        if self._pending.get(key, None) is entry:
+          del self._pending[key]
+      finally:
+        self._lock.release()
+      raise
+
+    self._lock.acquire()
+    try:
+      if self._pending.get(key, None) is entry:
+        del self._pending[key]
+        # Replace rather than modify the results so they can be saved
+        # without holding the lock.
+        results = dict(self._results)
+        results[key] = (stamp, result)
+        self._results = results
+        save = self.path is not None
+      else:
+        save = False # Another thread collected the result.
+    finally:
+      self._lock.release()
+
+    if save:
+      self._save()
+
+    return result
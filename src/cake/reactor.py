@@ -0,0 +1,433 @@
+"""Process Reactor.
+
+Provides a reactor that launches external processes and waits for them
+to complete from a single event thread. A running process does not tie up
+a worker thread, so the number of processes running at once is no longer
+limited by the number of worker threads.
+
+The reactor is only supported on POSIX platforms. Use L{isSupported()} to
+check whether it can be used on the current platform.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import errno
+import select
+import signal
+import threading
+import collections
+import subprocess
+
+import cake.system
+
+from cake.task import Task
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+def isSupported():
+  """Returns True if the process reactor can be used on this platform.
+  """
+  return not cake.system.isWindows() and fcntl is not None
+
+class ProcessResult(object):
+  """The outcome of running a process with a L{ProcessReactor}.
+
+  @ivar exitCode: The exit code of the process or None if the process
+  could not be launched.
+  @type exitCode: int or None
+  @ivar stdout: The text the process wrote to stdout.
+  @type stdout: string
+  @ivar stderr: The text the process wrote to stderr.
+  @type stderr: string
+  @ivar error: The exception raised while launching the process, or None
+  if the process was launched.
+  @type error: EnvironmentError or None
+  """
+
+  __slots__ = ['exitCode', 'stdout', 'stderr', 'error']
+
+  def __init__(self, exitCode=None, stdout="", stderr="", error=None):
+    self.exitCode = exitCode
+    self.stdout = stdout
+    self.stderr = stderr
+    self.error = error
+
+class _Process(object):
+  """Book-keeping for a single process owned by the reactor.
+  """
+
+  def __init__(self, task, kwargs):
+    self.task = task
+    self.kwargs = kwargs
+    self.popen = None
+    self.chunks = {}
+    self.openCount = 0
+    self.result = None
+
+class _Poller(object):
+  """Wraps epoll, poll or select with a common interface.
+  """
+
+  def __init__(self):
+    if hasattr(select, "epoll"):
+      self._epoll = select.epoll()
+      self._poll = None
+    elif hasattr(select, "poll"):
+      self._epoll = None
+      self._poll = select.poll()
+    else:
+      self._epoll = None
+      self._poll = None
+    self._fds = set()
+    self._writeFds = set()
+
+  def register(self, fd, write=False):
+    """Register an fd to wait on.
+
+    @param write: If True wait for the fd to become writable rather than
+    readable.
+    """
+    if self._epoll is not None:
+      if write:
+        self._epoll.register(fd, select.EPOLLOUT)
+      else:
+        self._epoll.register(fd, select.EPOLLIN)
+    elif self._poll is not None:
+      if write:
+        self._poll.register(fd, select.POLLOUT)
+      else:
+        self._poll.register(fd, select.POLLIN)
+    if write:
+      self._writeFds.add(fd)
+    else:
+      self._fds.add(fd)
+
+  def unregister(self, fd):
+    if self._epoll is not None:
+      self._epoll.unregister(fd)
+    elif self._poll is not None:
+      self._poll.unregister(fd)
+    self._fds.discard(fd)
+    self._writeFds.discard(fd)
+
+  def poll(self, timeout):
+    """Return a list of the registered fds that are ready.
+
+    @param timeout: Seconds to wait or None to wait indefinitely.
+    """
+    try:
+      if self._epoll is not None:
+        if timeout is None:
+          timeout = -1
+        return [fd for fd, _ in self._epoll.poll(timeout)]
+      elif self._poll is not None:
+        if timeout is not None:
+          timeout = int(timeout * 1000)
+        return [fd for fd, _ in self._poll.poll(timeout)]
+      else:
+        readable, writable, _ = select.select(
+          list(self._fds), list(self._writeFds), [], timeout,
+          )
+        return readable + writable
+    except (select.error, IOError, OSError), e:
+      if e.args[0] == errno.EINTR:
+        return []
+      raise
+
+def _setCloseOnExec(fd):
+  flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+  fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+class ProcessReactor(object):
+  """Launches processes and completes their tasks from one event thread.
+
+  Usage::
+    reactor = ProcessReactor(maxProcesses=32)
+    task = reactor.spawn("gcc -c foo.c", shell=True)
+    task.addCallback(lambda: sys.stdout.write(task.result.stdout))
+
+  The reactor reads the stdout/stderr pipes of every running process
+  using epoll (or poll/select where epoll is unavailable). Once both
+  pipes of a process are closed the process is reaped and the task
+  returned by L{spawn()} is started on a thread pool with a
+  L{ProcessResult} as its result.
+  """
+
+  # How long to wait before checking again on a process that has closed
+  # its pipes but not yet exited.
+  _reapInterval = 0.01
+
+  def __init__(self, maxProcesses, threadPool=None):
+    """Construct and start a new reactor.
+
+    @param maxProcesses: The maximum number of processes that may run at
+    once. Processes spawned beyond this limit are queued until a running
+    process exits.
+    @type maxProcesses: int
+
+    @param threadPool: The thread pool used to complete process tasks. If
+    None then the default thread pool is used.
+    @type threadPool: L{ThreadPool} or None
+    """
+    if not isSupported():
+      raise EnvironmentError("The process reactor is not supported on this platform.")
+
+    self.maxProcesses = max(1, maxProcesses)
+    self._threadPool = threadPool
+    self._lock = threading.Lock()
+    self._pending = collections.deque()
+    self._running = set()
+    self._exiting = []
+    self._fdMap = {}
+    self._finished = False
+    self._poller = _Poller()
+    self._wakeRead, self._wakeWrite = os.pipe()
+    _setCloseOnExec(self._wakeRead)
+    _setCloseOnExec(self._wakeWrite)
+    self._poller.register(self._wakeRead)
+
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  @property
+  def runningCount(self):
+    """The number of processes currently running.
+    """
+    return len(self._running)
+
+  @property
+  def pendingCount(self):
+    """The number of spawned processes waiting for a free slot.
+    """
+    return len(self._pending)
+
+  def spawn(self, args, executable=None, shell=False, cwd=None, env=None):
+    """Queue a process to be launched by the reactor.
+
+    The arguments have the same meaning as those of subprocess.Popen().
+
+    @return: A task that completes when the process has exited. The
+    task's result is a L{ProcessResult}. The task does not fail if the
+    process could not be launched or exits with a non-zero exit code,
+    check the L{ProcessResult} instead.
+    @rtype: L{Task}
+    """
+    process = _Process(
+      task=None,
+      kwargs=dict(
+        args=args,
+        executable=executable,
+        shell=shell,
+        cwd=cwd,
+        env=env,
+        ),
+      )
+    process.task = Task(lambda p=process: p.result)
+
+    self._lock.acquire()
+    try:
+      finished = self._finished
+      if not finished:
+        self._pending.append(process)
+    finally:
+      self._lock.release()
+
+    if finished:
+      process.result = ProcessResult(
+        error=EnvironmentError("Process reactor has been shut down."),
+        )
+      self._complete(process)
+    else:
+      self._wake()
+
+    return process.task
+
+  def terminateAll(self):
+    """Terminate all running processes and fail any queued processes.
+
+    Each process is started in its own process group, so the whole group
+    is terminated, including any processes it started, eg. the compiler
+    run by a shell.
+
+    The tasks of terminated processes complete with the exit code
+    reported by the operating system.
+
+    @return: The number of processes that were running or queued.
+    @rtype: int
+    """
+    self._lock.acquire()
+    try:
+      pending = list(self._pending)
+      self._pending.clear()
+      running = list(self._running)
+    finally:
+      self._lock.release()
+
+    for process in pending:
+      process.result = ProcessResult(
+        error=EnvironmentError("Process was cancelled."),
+        )
+      self._complete(process)
+
+    for process in running:
+      p = process.popen
+      if p is None:
+        continue # Already reaped
+      try:
+        os.killpg(p.pid, signal.SIGTERM)
+      except EnvironmentError:
+        pass # Already exited
+
+    return len(pending) + len(running)
+
+  def shutdown(self):
+    """Stop accepting new processes and terminate running ones.
+
+    Call L{join()} to wait for the reactor's thread to exit.
+    """
+    self._lock.acquire()
+    try:
+      self._finished = True
+    finally:
+      self._lock.release()
+    self.terminateAll()
+    self._wake()
+
+  def join(self, timeout=None):
+    """Wait for the reactor's thread to exit after L{shutdown()}.
+
+    @param timeout: Seconds to wait or None to wait until it exits.
+    @type timeout: float or None
+    """
+    self._thread.join(timeout)
+
+  def _wake(self):
+    try:
+      os.write(self._wakeWrite, "x")
+    except EnvironmentError:
+      pass
+
+  def _complete(self, process):
+    process.task.start(immediate=True, threadPool=self._threadPool)
+
+  def _launchPending(self):
+    while len(self._running) < self.maxProcesses:
+      self._lock.acquire()
+      try:
+        try:
+          process = self._pending.popleft()
+        except IndexError:
+          return
+      finally:
+        self._lock.release()
+
+      try:
+        p = subprocess.Popen(
+          stdin=subprocess.PIPE,
+          stdout=subprocess.PIPE,
+          stderr=subprocess.PIPE,
+          close_fds=True,
+          # A process group of its own lets terminateAll() kill the
+          # processes it starts too.
+          preexec_fn=os.setpgrp,
+          **process.kwargs
+          )
+      except EnvironmentError, e:
+        process.result = ProcessResult(error=e)
+        self._complete(process)
+        continue
+
+      p.stdin.close()
+      process.popen = p
+      for f in (p.stdout, p.stderr):
+        fd = f.fileno()
+        # Stop processes launched by other threads from inheriting our pipes
+        # and holding them open.
+        _setCloseOnExec(fd)
+        process.chunks[fd] = []
+        self._fdMap[fd] = process
+        self._poller.register(fd)
+        process.openCount += 1
+
+      self._lock.acquire()
+      try:
+        self._running.add(process)
+      finally:
+        self._lock.release()
+
+  def _reap(self):
+    stillExiting = []
+    for process in self._exiting:
+      p = process.popen
+      exitCode = p.poll()
+      if exitCode is None:
+        stillExiting.append(process)
+        continue
+
+      stdoutText = "".join(process.chunks.pop(p.stdout.fileno()))
+      stderrText = "".join(process.chunks.pop(p.stderr.fileno()))
+      p.stdout.close()
+      p.stderr.close()
+      process.result = ProcessResult(
+        exitCode=exitCode,
+        stdout=stdoutText,
+        stderr=stderrText,
+        )
+      process.popen = None
+
+      self._lock.acquire()
+      try:
+        self._running.discard(process)
+      finally:
+        self._lock.release()
+
+      self._complete(process)
+    self._exiting = stillExiting
+
+  def _run(self):
+    """Run the event loop until shut down.
+    """
+    poller = self._poller
+    fdMap = self._fdMap
+    while not (self._finished and not self._running):
+      self._launchPending()
+
+      if self._exiting:
+        timeout = self._reapInterval
+      else:
+        timeout = None
+
+      for fd in poller.poll(timeout):
+        if fd == self._wakeRead:
+          os.read(fd, 4096)
+          continue
+
+        process = fdMap.get(fd, None)
+        if process is None:
+          continue
+
+        try:
+          data = os.read(fd, 65536)
+        except EnvironmentError, e:
+          if e.errno in (errno.EINTR, errno.EAGAIN):
+            continue
+          data = ""
+
+        if data:
+          process.chunks[fd].append(data)
+        else:
+          poller.unregister(fd)
+          del fdMap[fd]
+          process.openCount -= 1
+          if process.openCount == 0:
+            self._exiting.append(process)
+
+      if self._exiting:
+        self._reap()
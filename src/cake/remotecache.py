@@ -0,0 +1,498 @@
+"""Remote Object Cache.
+
+An object cache can have a second level shared by a team, see
+L{cake.library.compilers.Compiler.objectCacheRemote}. The local object
+cache is searched first. When it misses, the target's manifest is
+fetched from the remote cache. A remote hit downloads the object into the
+local cache and adds its entry to the local manifest before the object
+is restored, so later builds find it locally.
+
+Objects added to the local cache are uploaded to the remote cache in the
+background along with their manifest entries. The build waits for any
+outstanding uploads once it has finished, see L{RemoteCache.flush()}.
+
+Compilers prefetch the remote manifest of each object they are asked to
+build whose target doesn't exist yet, along with the object of the
+manifest's most recently used entry. The prefetches run in parallel
+with the rest of the build, so by the time an object is built its
+lookup rarely has to wait for the remote cache.
+
+The remote cache can be either:
+  - A directory, eg. on a network share.
+  - An HTTP server, given as an 'http://' URL. Files are fetched with a
+    GET and stored with a PUT of '<url>/<name>', where name is the path
+    of the file relative to the cache directory, eg.
+    'a/b/ab01...ef.manifest'. A GET of a file that doesn't exist should
+    return 404.
+
+Errors talking to the remote cache are treated as cache misses. They are
+reported with '--debug=cache'.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import httplib
+import os
+import os.path
+import socket
+import thread
+import threading
+import urllib
+import urlparse
+
+import cake.filesys
+import cake.objectcache
+import cake.threadpool
+
+threadCount = 4
+"""The number of threads each remote cache uses to transfer files.
+@type: int
+"""
+
+_blockSize = 1024 * 1024
+
+def _getTmpPath(path):
+  return "%s.%i.%i.tmp" % (path, os.getpid(), thread.get_ident())
+
+def _removeFile(path):
+  try:
+    os.remove(path)
+  except EnvironmentError:
+    pass
+
+def _writeStream(stream, path, size=None):
+  """Write the contents of a file object to a path without readers ever
+  seeing a partially written file.
+
+  If the size is given and a different number of bytes is read, eg.
+  because the connection was closed early, an EnvironmentError is raised
+  and the file isn't written.
+  """
+  cake.filesys.makeDirs(os.path.dirname(path))
+  tmpPath = _getTmpPath(path)
+  try:
+    f = open(tmpPath, "wb")
+    try:
+      written = 0
+      while True:
+        data = stream.read(_blockSize)
+        if not data:
+          break
+        f.write(data)
+        written += len(data)
+    finally:
+      f.close()
+    if size is not None and written != size:
+      raise EnvironmentError(
+        "expected %i bytes but received %i" % (size, written)
+        )
+    cake.filesys.renameFile(tmpPath, path)
+  except:
+    _removeFile(tmpPath)
+    raise
+
+class DirectoryStore(object):
+  """A remote cache in a directory, eg. on a network share.
+  """
+
+  def __init__(self, path):
+    """Construct a directory store.
+
+    @param path: The path of the directory.
+    @type path: string
+    """
+    self.path = path
+
+  def __repr__(self):
+    return "DirectoryStore(%r)" % self.path
+
+  def _getPath(self, name):
+    return os.path.join(self.path, *name.split("/"))
+
+  def get(self, name, path):
+    """Fetch a file from the store.
+
+    @param name: The name of the file in the store.
+    @type name: string
+    @param path: The local path to write the file to.
+    @type path: string
+
+    @return: True if the file was fetched, False if it isn't in the store.
+    @rtype: bool
+
+    @raise EnvironmentError: If the file couldn't be fetched.
+    """
+    try:
+      f = open(self._getPath(name), "rb")
+    except EnvironmentError:
+      return False
+    try:
+      _writeStream(f, path)
+    finally:
+      f.close()
+    return True
+
+  def put(self, path, name):
+    """Store a file.
+
+    @param path: The local path of the file.
+    @type path: string
+    @param name: The name of the file in the store.
+    @type name: string
+
+    @raise EnvironmentError: If the file couldn't be stored.
+    """
+    f = open(path, "rb")
+    try:
+      _writeStream(f, self._getPath(name))
+    finally:
+      f.close()
+
+class HttpStore(object):
+  """A remote cache on an HTTP server.
+
+  Each thread keeps its own connection to the server open between
+  requests where the server allows it.
+  """
+
+  timeout = 30
+  """The timeout in seconds for connecting to and reading from the server.
+  @type: float
+  """
+
+  def __init__(self, url):
+    """Construct an HTTP store.
+
+    @param url: The URL of the cache, eg. 'http://cache:8080/objects'.
+    @type url: string
+
+    @raise ValueError: If the URL isn't an 'http://' URL.
+    """
+    parts = urlparse.urlsplit(url)
+    if parts.scheme != "http" or not parts.netloc:
+      raise ValueError("invalid remote cache URL '%s'" % url)
+    self.url = url
+    self._host = parts.netloc
+    self._prefix = parts.path.rstrip("/")
+    self._local = threading.local()
+
+  def __repr__(self):
+    return "HttpStore(%r)" % self.url
+
+  def _request(self, method, name, body=None, headers={}):
+    connection = getattr(self._local, "connection", None)
+    if connection is None:
+      connection = httplib.HTTPConnection(self._host, timeout=self.timeout)
+      self._local.connection = connection
+    try:
+      connection.request(
+        method,
+        self._prefix + "/" + urllib.quote(name),
+        body,
+        headers,
+        )
+      return connection.getresponse()
+    except (httplib.HTTPException, socket.error), e:
+      connection.close()
+      self._local.connection = None
+      raise EnvironmentError("%s %s: %s" % (method, self.url, e))
+
+  def _checkResponse(self, method, name, response):
+    # Read the rest of the response so the connection can be reused.
+    response.read()
+    if response.status // 100 != 2:
+      raise EnvironmentError("%s %s/%s: HTTP %i %s" % (
+        method, self.url, name, response.status, response.reason,
+        ))
+
+  def get(self, name, path):
+    """Fetch a file from the store.
+
+    @see: L{DirectoryStore.get()}
+    """
+    response = self._request("GET", name)
+    if response.status == 404:
+      response.read()
+      return False
+    if response.status != 200:
+      self._checkResponse("GET", name, response)
+    size = response.getheader("Content-Length", None)
+    try:
+      if size is not None:
+        # A response cut short otherwise looks like a smaller file.
+        size = int(size)
+      _writeStream(response, path, size)
+    except (httplib.HTTPException, socket.error, ValueError,
+            EnvironmentError), e:
+      self._local.connection.close()
+      self._local.connection = None
+      raise EnvironmentError("GET %s/%s: %s" % (self.url, name, e))
+    return True
+
+  def put(self, path, name):
+    """Store a file.
+
+    @see: L{DirectoryStore.put()}
+    """
+    f = open(path, "rb")
+    try:
+      headers = {
+        "Content-Length": str(os.fstat(f.fileno()).st_size),
+        "Content-Type": "application/octet-stream",
+        }
+      response = self._request("PUT", name, f, headers)
+    finally:
+      f.close()
+    self._checkResponse("PUT", name, response)
+
+def createStore(location):
+  """Create a store given its location.
+
+  @param location: An 'http://' URL or the path of a directory.
+  @type location: string
+
+  @rtype: L{HttpStore} or L{DirectoryStore}
+
+  @raise ValueError: If the location is an invalid URL.
+  """
+  if "://" in location:
+    return HttpStore(location)
+  else:
+    return DirectoryStore(location)
+
+class _Fetch(object):
+  """A fetch that other threads can wait for.
+  """
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+
+class RemoteCache(object):
+  """The remote level of an object cache.
+
+  @ivar localPath: The path of the local object cache.
+  @type localPath: string
+  @ivar store: The store holding the remote cache.
+  @type store: L{DirectoryStore} or L{HttpStore}
+  """
+
+  def __init__(self, localPath, store, logger=None):
+    """Construct a remote cache.
+
+    @param localPath: The path of the local object cache.
+    @type localPath: string
+    @param store: The store holding the remote cache.
+    @type store: L{DirectoryStore} or L{HttpStore}
+    @param logger: The logger to report errors to.
+    @type logger: L{cake.logging.Logger} or None
+    """
+    self.localPath = localPath
+    self.store = store
+    self._logger = logger
+    self._threadPool = None
+    self._lock = threading.Lock()
+    self._idle = threading.Condition(self._lock)
+    self._pendingCount = 0
+    self._fetches = {}
+
+  def _reportError(self, e):
+    if self._logger is not None:
+      self._logger.outputDebug(
+        "cache",
+        "Remote cache %r: %s\n" % (self.store, e),
+        )
+
+  def _queue(self, func):
+    self._lock.acquire()
+    try:
+      self._pendingCount += 1
+      threadPool = self._threadPool
+      if threadPool is None:
+        threadPool = cake.threadpool.ThreadPool(threadCount)
+        self._threadPool = threadPool
+    finally:
+      self._lock.release()
+
+    def job():
+      try:
+        func()
+      finally:
+        self._lock.acquire()
+        try:
+          self._pendingCount -= 1
+          if not self._pendingCount:
+            self._idle.notifyAll()
+        finally:
+          self._lock.release()
+
+    threadPool.queueJob(job)
+
+  def _fetchOnce(self, name, func, keep=False):
+    """Call a fetch function, or wait for a call already in progress.
+
+    If keep is True the result is kept for the next call with the same
+    name, which is how prefetched manifests are handed over.
+    """
+    self._lock.acquire()
+    try:
+      fetch = self._fetches.get(name, None)
+      if fetch is None:
+        fetch = _Fetch()
+        self._fetches[name] = fetch
+        owner = True
+      else:
+        owner = False
+    finally:
+      self._lock.release()
+
+    if owner:
+      try:
+        fetch.result = func()
+      finally:
+        fetch.event.set()
+      if keep:
+        return fetch.result
+    else:
+      fetch.event.wait()
+
+    self._lock.acquire()
+    try:
+      if self._fetches.get(name, None) is fetch:
+        del self._fetches[name]
+    finally:
+      self._lock.release()
+    return fetch.result
+
+  def _readManifest(self, manifestName):
+    tmpPath = _getTmpPath(os.path.join(self.localPath, *manifestName.split("/")))
+    try:
+      if not self.store.get(manifestName, tmpPath):
+        return []
+      return cake.objectcache.readManifest(tmpPath)
+    finally:
+      _removeFile(tmpPath)
+
+  def getManifest(self, manifestName, keep=False):
+    """Fetch the entries of a remote manifest.
+
+    Uses the manifest's prefetch if there is one.
+
+    @param manifestName: The name of the manifest, see
+    L{cake.objectcache.getManifestName()}.
+    @type manifestName: string
+
+    @param keep: If True the entries are kept for the next call, eg. by
+    a prefetch.
+    @type keep: bool
+
+    @return: The entries of the manifest. The list is empty if the
+    manifest couldn't be fetched.
+    @rtype: list of tuple
+    """
+    def fetch():
+      try:
+        return self._readManifest(manifestName)
+      except EnvironmentError, e:
+        self._reportError(e)
+        return []
+    return self._fetchOnce(manifestName, fetch, keep)
+
+  def fetchObject(self, objectName):
+    """Download a remote object into the local cache.
+
+    Returns at once if the object is already in the local cache.
+
+    @param objectName: The name of the object including the codec's
+    suffix, see L{cake.objectcache.getCacheName()}.
+    @type objectName: string
+
+    @return: True if the object is in the local cache.
+    @rtype: bool
+    """
+    path = os.path.join(self.localPath, *objectName.split("/"))
+    def fetch():
+      if cake.filesys.isFile(path):
+        return True
+      try:
+        return self.store.get(objectName, path)
+      except EnvironmentError, e:
+        self._reportError(e)
+        return False
+    return self._fetchOnce(objectName, fetch)
+
+  def prefetch(self, manifestName, suffix):
+    """Start fetching a remote manifest and its most recent object.
+
+    @param manifestName: The name of the manifest.
+    @type manifestName: string
+    @param suffix: The suffix of the objects, see
+    L{cake.cachecodec.Codec.suffix}.
+    @type suffix: string
+    """
+    self._lock.acquire()
+    try:
+      if manifestName in self._fetches:
+        return
+    finally:
+      self._lock.release()
+
+    def run():
+      entries = self.getManifest(manifestName, keep=True)
+      if entries:
+        for digest in cake.objectcache.getEntryDigests(entries[0]):
+          self.fetchObject(cake.objectcache.getCacheName(digest) + suffix)
+    self._queue(run)
+
+  def upload(self, objectNames, manifestNames, entry):
+    """Start uploading objects from the local cache and adding their
+    entry to remote manifests.
+
+    The objects are uploaded before the manifest is updated so other
+    builds never find an entry whose objects are missing. When two builds
+    update the same remote manifest at once one of the updates may be
+    lost, which only costs a cache miss later.
+
+    @param objectNames: The names of the entry's objects including the
+    codec's suffix, see L{cake.objectcache.getEntryDigests()}.
+    @type objectNames: list of string
+    @param manifestNames: The names of the manifests to add the entry
+    to, eg. the target's manifest.
+    @type manifestNames: list of string
+    @param entry: The manifest entry for the objects.
+    @type entry: tuple
+    """
+    def run():
+      try:
+        for objectName in objectNames:
+          self.store.put(
+            os.path.join(self.localPath, *objectName.split("/")),
+            objectName,
+            )
+        for manifestName in manifestNames:
+          entries = cake.objectcache.addEntry(
+            self._readManifest(manifestName),
+            entry,
+            )
+          tmpPath = _getTmpPath(os.path.join(self.localPath, *manifestName.split("/")))
+          try:
+            cake.objectcache.writeManifest(tmpPath, entries)
+            self.store.put(tmpPath, manifestName)
+          finally:
+            _removeFile(tmpPath)
+      except EnvironmentError, e:
+        self._reportError(e)
+    self._queue(run)
+
+  def flush(self):
+    """Wait for all prefetches and uploads to finish.
+    """
+    self._lock.acquire()
+    try:
+      while self._pendingCount:
+        self._idle.wait()
+      self._fetches.clear()
+    finally:
+      self._lock.release()
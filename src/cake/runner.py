@@ -8,23 +8,15 @@
 import os
 import os.path
 import sys
-import threading
 import datetime
 import time
-import traceback
 import platform
 
-import cake.engine
-import cake.logging
-import cake.path
-import cake.script
-import cake.task
-import cake.threadpool
-import cake.version
+# Used to report the time taken to import modules with '--debug=startup'.
+_importStartTime = time.time()
 
-from cake.async import flatten
-
-from cake.optparse import Option, OptionParser
+# Modules used to perform a build are imported by run() once it knows a
+# build is required, so that commands such as 'cake --version' start fast.
 
 # Make sure stat() returns floats so timestamps are consistent across
 # Python versions (2.4 used longs, 2.5+ uses floats).
@@ -177,6 +169,12 @@ def _speedUp():
   Speed up execution by importing Psyco and binding the slowest functions
   with it.
   """ 
+  # Psyco only supports Python 2.4 to 2.6 so don't spend time looking for it.
+  version = platform.python_version_tuple()
+  if version[0] != "2" or version[1] not in ["4", "5", "6"]:
+    return
+
+  import cake.engine
   try:
     import psyco
     psyco.bind(cake.engine.Configuration.checkDependencyInfo)
@@ -186,7 +184,6 @@ def _speedUp():
     #psyco.log()
   except ImportError:
     # Only report import failures on systems we know Psyco supports.
-    version = platform.python_version_tuple()
     supportsVersion = version[0] == "2" and version[1] in ["5", "6"]
     if platform.system() == "Windows" and supportsVersion:
       sys.stderr.write(
@@ -209,13 +206,34 @@ def run(args=None, cwd=None):
   """
   startTime = datetime.datetime.utcnow()
   
+  if args is None:
+    args = sys.argv[1:]
+
+  # Print out Cake version information without importing the modules
+  # needed for a build. The version may also be requested by args.cake.
+  if "-v" in args or "--version" in args:
+    _outputVersion()
+    return 1
+
+  import threading
+  import traceback
+
+  import cake.engine
+  import cake.logging
+  import cake.path
+  import cake.script
+  import cake.task
+  import cake.threadpool
+
+  from cake.async import flatten
+  from cake.optparse import OptionParser
+
+  importEndTime = time.time()
+
   _overrideFile()
   _overrideOpen()
   _overridePopen()
   _speedUp()
-  
-  if args is None:
-    args = sys.argv[1:]
 
   if cwd is not None:
     cwd = os.path.abspath(cwd)
@@ -256,7 +274,7 @@ def run(args=None, cwd=None):
     "--debug", metavar="KEYWORDS",
     action="extend",
     dest="debugComponents",
-    help="Set features to debug, eg: 'reason,run,script,scan,time'.",
+    help="Set features to debug, eg: 'reason,run,script,scan,time,memory,graph,startup,cache'.",
     default=[],
     )
   parser.add_option(
@@ -288,6 +306,14 @@ def run(args=None, cwd=None):
     help="Number of simultaneous jobs to execute.",
     default=cake.threadpool.getProcessorCount(),
     )
+  parser.add_option(
+    "-r", "--reactor",
+    dest="useReactor",
+    action="store_true",
+    help="Run external processes from a single reactor thread so the job " +
+         "count may exceed the number of worker threads.",
+    default=False,
+    )
   parser.add_option(
     "-k", "--keep-going",
     dest="maximumErrorCount",
@@ -303,6 +329,54 @@ def run(args=None, cwd=None):
     help="Halt the build after a certain number of errors.",
     default=100,
     )
+  parser.add_option(
+    "--fail-fast",
+    dest="failFast",
+    action="store_true",
+    help="Cancel all pending jobs and terminate running processes once " +
+         "the maximum error count is reached.",
+    default=False,
+    )
+  parser.add_option(
+    "--script-threads",
+    metavar="N",
+    type="int",
+    dest="scriptThreads",
+    help="Number of threads used to execute scripts and check dependencies.",
+    default=None,
+    )
+  parser.add_option(
+    "--bounded-memory",
+    dest="boundedMemory",
+    action="store_true",
+    help="Release the state of completed tasks and targets to reduce " +
+         "memory usage on very large builds.",
+    default=False,
+    )
+  parser.add_option(
+    "--no-graph-cache",
+    dest="noGraphCache",
+    action="store_true",
+    help="Execute every build script even if the graph cache has a " +
+         "record of it.",
+    default=False,
+    )
+  parser.add_option(
+    "--cache-trim",
+    dest="cacheTrim",
+    action="store_true",
+    help="Remove the least recently used objects from the object caches " +
+         "of the selected variants' compilers instead of building.",
+    default=False,
+    )
+  parser.add_option(
+    "--cache-stats",
+    metavar="FILE",
+    dest="cacheStatsPath",
+    help="Write the hits, misses and time saved by the object caches " +
+         "for each variant and directory to FILE as JSON.",
+    default=None,
+    )
   parser.add_option(
     "-l", "--list-targets",
     dest="listTargetsMode",
@@ -382,15 +456,14 @@ def run(args=None, cwd=None):
     # Don't cache args.cake as this is where the cache dir may be set.
     script.execute(cached=False)
 
+  argsEndTime = time.time()
+
   # Parse any remaining args (after args.cake may have modified them).
   options, args = parser.parse_args(engine.args)
 
   # Print out Cake version information if requested.
   if options.outputVersion:
-    cakeVersion = cake.version.__version__
-    cakePath = cake.path.dirName(cake.__file__)
-    sys.stdout.write("Cake %s [%s]\n" % (cakeVersion, cakePath))
-    sys.stdout.write("Python %s\n" % sys.version)
+    _outputVersion()
     return 1
 
   # Find keyword arguments from what's left of the args. 
@@ -416,8 +489,34 @@ def run(args=None, cwd=None):
   engine.options = options
   engine.forceBuild = options.forceBuild
   engine.maximumErrorCount = options.maximumErrorCount
+  engine.failFast = options.failFast
+  engine.boundedMemory = options.boundedMemory
+  if options.scriptThreads is not None:
+    engine.scriptThreadCount = options.scriptThreads
+  # Listing targets needs every target so scripts must be executed.
+  engine.graphCacheReplay = not (options.noGraphCache or options.listTargetsMode)
+  cake.task.setReleaseCompleted(options.boundedMemory)
+
+  if logger.debugEnabled("memory"):
+    import cake.memory
+    memoryMonitor = cake.memory.MemoryMonitor(logger)
+    memoryMonitor.start()
+  else:
+    memoryMonitor = None
     
-  threadPool = cake.threadpool.ThreadPool(options.jobs)
+  if options.useReactor:
+    import cake.reactor
+  if options.useReactor and cake.reactor.isSupported():
+    # Processes don't tie up worker threads when run by the reactor so we
+    # only need enough threads to keep the processors busy.
+    threadCount = min(options.jobs, cake.threadpool.getProcessorCount())
+    threadPool = cake.threadpool.ThreadPool(threadCount)
+    engine.processReactor = cake.reactor.ProcessReactor(
+      maxProcesses=options.jobs,
+      threadPool=threadPool,
+      )
+  else:
+    threadPool = cake.threadpool.ThreadPool(options.jobs)
   cake.task.setThreadPool(threadPool)
  
   tasks = []
@@ -426,15 +525,23 @@ def run(args=None, cwd=None):
   if configScript is not None and not os.path.isabs(configScript):
     configScript = os.path.abspath(configScript)
   
+  if options.cacheTrim:
+    try:
+      return _trimObjectCaches(engine, scriptTargets, configScript, keywords)
+    finally:
+      _shutdownReactor(engine)
+  
   bootFailed = False
+  configTime = 0.0
+  allScriptTasks = []
 
   def listTargets(scripts):
     defaultTargets = []
     namedTargets = {}
     for script in scripts:
       defaultTargets.extend(flatten(script.getDefaultTarget().targets))
-      for name, target in script._targets.items():
-        namedTargets.setdefault(name, []).extend(flatten(target.targets))
+      for name, targets in script.getNamedTargets().items():
+        namedTargets.setdefault(name, []).extend(flatten(targets))
 
     def targetList(targets):
       targets = sorted(set(str(t) for t in targets))
@@ -457,15 +564,18 @@ def run(args=None, cwd=None):
   for scriptPath, targetNames in scriptTargets:
     scriptPath = cake.path.fileSystemPath(scriptPath)
     try:
+      configStartTime = time.time()
       if configScript is None:
         configuration = engine.findConfiguration(scriptPath)
       else:
         configuration = engine.getConfiguration(configScript)
 
-      variants = configuration.findAllVariants(keywords)      
+      variants = list(configuration.findAllVariants(keywords))
+      configTime += time.time() - configStartTime
 
       scripts = [configuration.execute(scriptPath, variant)
                  for variant in variants] 
+      allScriptTasks.extend(s.task for s in scripts)
       if options.listTargetsMode:
         scriptTasks = [s.task for s in scripts]
         task = engine.createTask(lambda s=scripts: listTargets(scripts))
@@ -489,8 +599,13 @@ def run(args=None, cwd=None):
       engine.errors.append(msg)
     
   def onFinish():
+    # Outputs are stored in the object caches in the background. They
+    # must all be stored before the caches are trimmed.
+    engine.flushCacheStores()
     if not bootFailed and mainTask.succeeded:
       engine.onBuildSucceeded()
+      if engine.graphCache is not None and not options.listTargetsMode:
+        engine.graphCache.save()
       if engine.warningCount:
         msg = "Build succeeded with %i warnings.\n" % engine.warningCount
       else:
@@ -516,18 +631,76 @@ def run(args=None, cwd=None):
 
         msg += "".join("- " + t + "\n" for t in targetsToPrint)
 
+      if engine.aborted:
+        msg += "Build was aborted, %i actions were skipped.\n" % engine.skippedCount
+
     engine.logger.outputInfo(msg)
   
+  if logger.debugEnabled("startup"):
+    # Scripts may fail so use a callback rather than startAfter().
+    scriptsEndTimes = []
+    scriptsTask = cake.task.Task()
+    scriptsTask.addCallback(lambda: scriptsEndTimes.append(time.time()))
+    scriptsTask.startAfter(allScriptTasks)
+    scriptsStartTime = argsEndTime + configTime
+
   mainTask = cake.task.Task()
   mainTask.addCallback(onFinish)
   mainTask.startAfter(tasks)
 
   finished = threading.Event()
   mainTask.addCallback(finished.set)
-  # We must wait in a loop in case a KeyboardInterrupt comes.
-  while not finished.isSet():
-    time.sleep(0.1)
+  # We must wait in a loop in case a KeyboardInterrupt comes. Waiting with
+  # a timeout polls more frequently than sleeping so short builds don't
+  # take an extra tenth of a second to notice they have finished.
+  try:
+    while not finished.isSet():
+      finished.wait(0.1)
+  except KeyboardInterrupt:
+    # Processes run by the reactor are in their own process groups so
+    # they don't see the interrupt.
+    _shutdownReactor(engine)
+    raise
+  
+  # Objects added to remote caches are uploaded in the background.
+  engine.flushRemoteCaches()
   
+  _shutdownReactor(engine)
+  
+  if memoryMonitor is not None:
+    memoryMonitor.stop()
+
+  if logger.debugEnabled("startup"):
+    buildEndTime = time.time()
+    if scriptsEndTimes:
+      scriptsEndTime = scriptsEndTimes[0]
+    else:
+      scriptsEndTime = buildEndTime
+    logger.outputDebug(
+      "startup",
+      "startup: imports=%.3fs args=%.3fs config=%.3fs scripts=%.3fs build=%.3fs\n" % (
+        importEndTime - _importStartTime,
+        argsEndTime - importEndTime,
+        configTime,
+        scriptsEndTime - scriptsStartTime,
+        buildEndTime - scriptsEndTime,
+        ))
+
+  cacheSummary = engine.cacheStatistics.formatSummary()
+  if cacheSummary:
+    engine.logger.outputInfo(cacheSummary)
+  if options.cacheStatsPath is not None:
+    try:
+      engine.cacheStatistics.writeFile(
+        os.path.join(cwd, options.cacheStatsPath)
+        )
+    except EnvironmentError, e:
+      engine.logger.outputError(
+        "cake: failed to write cache statistics to %s: %s\n" % (
+          options.cacheStatsPath,
+          str(e),
+          ))
+
   endTime = datetime.datetime.utcnow()
   engine.logger.outputInfo(
     "Build took %s.\n" % _formatTimeDelta(endTime - startTime)
@@ -535,6 +708,75 @@ def run(args=None, cwd=None):
   
   return engine.errorCount
 
+def _shutdownReactor(engine):
+  """Stop the engine's process reactor, if it has one, and wait for its
+  thread to exit.
+  """
+  reactor = engine.processReactor
+  if reactor is not None:
+    reactor.shutdown()
+    reactor.join()
+
+def _trimObjectCaches(engine, scriptTargets, configScript, keywords):
+  """Trim the object caches used by the compilers of the selected variants.
+  
+  @return: The number of errors.
+  @rtype: int
+  """
+  import cake.cachestats
+  import cake.objectcache
+  from cake.library.compilers import Compiler
+  
+  caches = {}
+  try:
+    for scriptPath, _ in scriptTargets:
+      scriptPath = cake.path.fileSystemPath(scriptPath)
+      if configScript is None:
+        configuration = engine.findConfiguration(scriptPath)
+      else:
+        configuration = engine.getConfiguration(configScript)
+      
+      for variant in configuration.findAllVariants(keywords):
+        for tool in variant.tools.values():
+          if isinstance(tool, Compiler) and tool.objectCachePath is not None:
+            path = configuration.abspath(tool.objectCachePath)
+            maximumSize = tool.objectCacheMaximumSize
+            if path in caches and caches[path] is not None:
+              if maximumSize is None or caches[path] < maximumSize:
+                maximumSize = caches[path]
+            caches[path] = maximumSize
+  except cake.engine.BuildError:
+    return engine.errorCount # Error already output
+  
+  if not caches:
+    engine.logger.outputInfo("No object caches found.\n")
+  
+  for path in sorted(caches):
+    result = cake.objectcache.trimCache(path, caches[path])
+    if result is None:
+      engine.logger.outputInfo("%s is already being trimmed.\n" % path)
+    else:
+      removedCount, removedSize, remainingSize = result
+      engine.logger.outputInfo(
+        "Trimmed %s: removed %i files (%s), %s remaining.\n" % (
+          path,
+          removedCount,
+          cake.cachestats.formatSize(removedSize),
+          cake.cachestats.formatSize(remainingSize),
+          ))
+  
+  return engine.errorCount
+
+def _outputVersion():
+  """Print out Cake version information.
+  """
+  import cake.version
+  
+  cakeVersion = cake.version.__version__
+  cakePath = os.path.dirname(cake.__file__)
+  sys.stdout.write("Cake %s [%s]\n" % (cakeVersion, cakePath))
+  sys.stdout.write("Python %s\n" % sys.version)
+
 def _formatTimeDelta(t):
   """Return a string representation of the time to millisecond precision."""
   
@@ -8,7 +8,7 @@
 import threading
 import cake.path
 
-from cake.target import Target
+from cake.target import Target, FileTarget, DirectoryTarget
 from cake.async import AsyncResult, waitForAsyncResult, flatten
 
 _undefined = object()
@@ -46,6 +46,10 @@ class ScriptResult(AsyncResult):
     if not self.task.completed:
       raise AttributeError("ScriptResult.result only available once Script task has completed")
 
+    currentRoot = Script.getCurrentRoot()
+    if currentRoot is not None and currentRoot._graphRecord is not None:
+      currentRoot._graphRecord.addResultScript(self.__script.root)
+
     try:
       return self.__script._getResult(self.__name)
     except KeyError:
@@ -55,6 +59,25 @@ class ScriptResult(AsyncResult):
       else:
         raise
 
+def _compactTarget(target):
+  """Return a lightweight copy of a built target that has no task.
+
+  The copy is of the same class and keeps the target's other attributes,
+  eg. the compiler of an ObjectTarget. Targets it refers to, eg. the
+  library of a ModuleTarget, are copied without their task too.
+  """
+  if not isinstance(target, (FileTarget, DirectoryTarget)):
+    return target
+
+  compacted = object.__new__(target.__class__)
+  compacted.task = None
+  compacted.path = target.path
+  for name, value in getattr(target, "__dict__", {}).items():
+    if isinstance(value, Target):
+      value = _compactTarget(value)
+    setattr(compacted, name, value)
+  return compacted
+
 class ScriptTarget(Target):
   """A script target is a named target defined by a script.
 
@@ -77,6 +100,9 @@ class ScriptTarget(Target):
     self.script = script
     self.targets = []
 
+    if script.engine.boundedMemory:
+      task.addCallback(self._compact)
+
   def __str__(self):
     if self.name is None:
       return self.script.path
@@ -99,7 +125,13 @@ class ScriptTarget(Target):
         raise TypeError("Must specify Target object for addTargets")
 
     self.targets.extend(targets)
-    self.task.completeAfter(t.task for t in targets)
+    self.task.completeAfter([t.task for t in targets if t.task is not None])
+
+  def _compact(self):
+    # Once built we only need to remember the paths of our targets, drop
+    # the targets themselves so their tasks can be garbage collected.
+    if self.task.succeeded:
+      self.targets = [_compactTarget(t) for t in self.targets]
 
   def _finalise(self):
     if not self.targets:
@@ -108,6 +140,67 @@ class ScriptTarget(Target):
       engine.logger.outputWarning(msg)
       engine.warnings.append(msg)
 
+class _TargetRegistry(object):
+  """The targets registered with named script targets.
+
+  Registrations are stored as rows in two parallel columns, the target
+  and the tuple of names it was registered with, so registering a target
+  doesn't create a ScriptTarget, task or list for each of its names. The
+  index of rows by name is only built the first time a name is looked up
+  after rows have been added, then kept up to date.
+  """
+
+  __slots__ = ['targets', 'names', '_index']
+
+  def __init__(self):
+    self.targets = []
+    self.names = []
+    self._index = None
+
+  def add(self, target, names):
+    """Add a row for a target and the names it was registered with.
+    """
+    index = self._index
+    if index is not None:
+      row = len(self.targets)
+      for name in names:
+        index.setdefault(name, []).append(row)
+    self.targets.append(target)
+    self.names.append(names)
+
+  def lookup(self, name):
+    """Return the targets registered with a name.
+    """
+    if not self.targets:
+      return []
+
+    index = self._index
+    if index is None:
+      index = self._index = {}
+      for row, names in enumerate(self.names):
+        for n in names:
+          index.setdefault(n, []).append(row)
+
+    targets = self.targets
+    return [targets[row] for row in index.get(name, ())]
+
+  def getAll(self):
+    """Return a dictionary of all the names and their targets.
+    """
+    namedTargets = {}
+    for target, names in zip(self.targets, self.names):
+      for name in names:
+        namedTargets.setdefault(name, []).append(target)
+    return namedTargets
+
+  def compact(self):
+    """Replace targets that have been built with lightweight copies.
+    """
+    self.targets = [
+      _compactTarget(t) if t.task is not None and t.task.succeeded else t
+      for t in self.targets
+      ]
+
 class Script(object):
   """A class that represents an instance of a Cake script. 
   """
@@ -142,6 +235,11 @@ class Script(object):
       self.root = self
       self._defaultTarget = ScriptTarget(self, None)
       self._targets = {}
+      self._targetRegistry = _TargetRegistry()
+      self._targetsLock = threading.Lock()
+      if engine.boundedMemory:
+        self._defaultTarget.task.addCallback(self._compactTargets)
+      self._graphRecord = None
     else:
       self.root = parent.root
     self._executionLock = threading.Lock()
@@ -216,6 +314,10 @@ class Script(object):
   def getTarget(self, name):
     """Get the named script target for this script.
 
+    The ScriptTarget is created the first time it is looked up, along
+    with any targets that were registered with the name using
+    L{registerTarget()}.
+
     @param name: The name of the target.
     @type name: C{basestring}
 
@@ -225,13 +327,82 @@ class Script(object):
     if name is None:
       return self.getDefaultTarget()
 
-    targets = self.root._targets
-    target = targets.get(name, None)
+    root = self.root
+    target = root._targets.get(name, None)
     if target is None:
-      target = targets.setdefault(name, ScriptTarget(script=self, name=name))
+      # Scripts may run on several threads so make sure only one
+      # ScriptTarget is created per name.
+      root._targetsLock.acquire()
+      try:
+        target = root._targets.get(name, None)
+        if target is None:
+          target = ScriptTarget(script=self, name=name)
+          registered = root._targetRegistry.lookup(name)
+          if registered:
+            target.addTargets(registered)
+          root._targets[name] = target
+      finally:
+        root._targetsLock.release()
 
     return target
 
+  def registerTarget(self, target, names):
+    """Add a target to several named script targets.
+
+    This is cheaper than calling L{getTarget()} for each name as the
+    named ScriptTargets are only created if they are looked up later.
+    Tools use it to register each target they create under names such
+    as 'objects' and the target's file name.
+
+    @param target: The target to add.
+    @type target: L{Target}
+    @param names: The names of the script targets to add it to.
+    @type names: tuple of C{basestring}
+    """
+    if not isinstance(target, Target):
+      raise TypeError("Must specify Target object for registerTarget not " + str(type(target)))
+
+    root = self.root
+    root._targetsLock.acquire()
+    try:
+      root._targetRegistry.add(target, names)
+      scriptTargets = root._targets
+      if scriptTargets:
+        scriptTargets = [scriptTargets[n] for n in names if n in scriptTargets]
+    finally:
+      root._targetsLock.release()
+
+    # Names that have already been looked up need the target directly.
+    for scriptTarget in scriptTargets:
+      scriptTarget.addTarget(target)
+
+  def getNamedTargets(self):
+    """Get the targets added to each named script target.
+
+    Unlike L{getTarget()} this doesn't create any ScriptTargets.
+
+    @return: A dictionary mapping each name to its list of targets.
+    @rtype: dict of C{basestring}:list of L{Target}
+    """
+    root = self.root
+    root._targetsLock.acquire()
+    try:
+      namedTargets = root._targetRegistry.getAll()
+      for name, target in root._targets.items():
+        namedTargets[name] = list(target.targets)
+    finally:
+      root._targetsLock.release()
+    return namedTargets
+
+  def _compactTargets(self):
+    # The registered targets were added to the default target too, so once
+    # it has been built they have all been built.
+    self._targetsLock.acquire()
+    try:
+      self._targetRegistry.compact()
+    finally:
+      self._targetsLock.release()
+
   def cwd(self, *args):
     """Return the path prefixed with the current script's directory.
     """
@@ -263,6 +434,9 @@ class Script(object):
             absPath = self.configuration.abspath(self.path)
           else:
             absPath = cake.path.absPath(self.path)
+          graphRecord = self.root._graphRecord
+          if graphRecord is not None:
+            graphRecord.addInput(self.engine, absPath)
           byteCode = self.engine.getByteCode(absPath, cached=cached)
           scriptGlobals = {'__file__': absPath}
           if self.configuration is not None:
@@ -10,6 +10,7 @@ import threading
 
 _threadPool = None
 _threadPoolLock = threading.Lock()
+_releaseCompleted = False
 
 def setThreadPool(threadPool):
   """Set the default thread pool to use for executing new tasks.
@@ -30,6 +31,24 @@ def setThreadPool(threadPool):
 
   return oldThreadPool
 
+def setReleaseCompleted(release):
+  """Set whether tasks release their internal state once completed.
+
+  When enabled a completed task drops its exception, traceback, parent
+  and dependency references and collapses a chain of task results down
+  to the final result value. This bounds the memory used by very large
+  task graphs at the cost of less detailed failure diagnostics.
+
+  @param release: True to release the state of completed tasks.
+  @type release: bool
+
+  @return: The previous setting. This is initially False.
+  """
+  global _releaseCompleted
+  oldRelease = _releaseCompleted
+  _releaseCompleted = bool(release)
+  return oldRelease
+
 def getDefaultThreadPool():
   """Get the current default thread pool for new tasks.
 
@@ -347,8 +366,7 @@ class Task(object):
       self._threadPool.queueJob(self._execute, front=self._immediate)          
     else:
       # Task was cancelled, call callbacks now
-      for callback in callbacks:
-        callback()
+      self._runCallbacks(callbacks)
               
   def _execute(self):
     """Actually execute this task.
@@ -419,9 +437,8 @@ class Task(object):
       finally:
         self._lock.release()
      
-    if callbacks:
-      for callback in callbacks:
-        callback()
+    if callbacks is not None:
+      self._runCallbacks(callbacks)
 
   def completeAfter(self, other):
     """Make sure this task doesn't complete until other tasks have completed.
@@ -480,9 +497,8 @@ class Task(object):
     finally:
       self._lock.release()
         
-    if callbacks:
-      for callback in callbacks:
-        callback()
+    if callbacks is not None:
+      self._runCallbacks(callbacks)
 
   def cancel(self):
     """Cancel this task if it hasn't already started.
@@ -502,8 +518,32 @@ class Task(object):
     finally:
       self._lock.release()
     
+    self._runCallbacks(callbacks)
+
+  def _runCallbacks(self, callbacks):
+    """Run the callbacks of a task that has just completed.
+    """
+    if _releaseCompleted:
+      self._release()
     for callback in callbacks:
       callback()
+
+  def _release(self):
+    """Drop state that is no longer needed now this task has completed.
+    """
+    if self.succeeded:
+      # Collapse the chain of result tasks so the intermediate tasks (and
+      # anything they reference) can be garbage collected.
+      if isinstance(self._result, Task):
+        self._result = self.result
+    elif hasattr(self, "_result"):
+      del self._result
+    self._exception = None
+    self._trace = None
+    self._parent = None
+    self._threadPool = None
+    self._startAfterDependencies = None
+    self._completeAfterDependencies = None
   
   def addCallback(self, callback):
     """Register a callback to be run when this task is complete.
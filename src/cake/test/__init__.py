@@ -8,6 +8,19 @@ _modules = [
   "cake.test.path",
   "cake.test.threadpool",
   "cake.test.asyncresult",
+  "cake.test.reactor",
+  "cake.test.engine",
+  "cake.test.coroutine",
+  "cake.test.bytecode",
+  "cake.test.tool",
+  "cake.test.probe",
+  "cake.test.script",
+  "cake.test.objectcache",
+  "cake.test.remotecache",
+  "cake.test.actioncache",
+  "cake.test.cachestats",
+  "cake.test.unity",
+  "cake.test.compilers",
   ]
 
 def suite():
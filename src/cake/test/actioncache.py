@@ -0,0 +1,301 @@
+"""Action Cache Unit Tests.
+"""
+
+import unittest
+import tempfile
+import threading
+import shutil
+import stat
+import sys
+import os
+
+import cake.actioncache
+import cake.engine
+import cake.filesys
+import cake.hash
+import cake.logging
+import cake.objectcache
+import cake.task
+
+class _RecordingLogger(cake.logging.Logger):
+
+  def __init__(self):
+    cake.logging.Logger.__init__(self)
+    self.infos = []
+    self.errors = []
+
+  def outputInfo(self, message):
+    self.infos.append(message)
+
+  def outputError(self, message):
+    self.errors.append(message)
+
+class ActionCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.source = os.path.join(self.tmpDir, "source.txt")
+    self.target = os.path.join(self.tmpDir, "out", "program")
+    self.extra = os.path.join(self.tmpDir, "out", "program.map")
+    cake.filesys.writeFile(self.source, "source")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+  def _createCache(self, codec="zlib"):
+    self.logger = _RecordingLogger()
+    engine = cake.engine.Engine(self.logger, None, [])
+    self.configuration = cake.engine.Configuration(
+      os.path.join(self.tmpDir, "config.cake"),
+      engine,
+      )
+    return cake.actioncache.ActionCache(
+      self.configuration,
+      os.path.join(self.tmpDir, "cache"),
+      codec=codec,
+      )
+
+  def _build(self, cache, args, key=None, duration=None):
+    cake.filesys.writeFile(self.target, "program built from source")
+    os.chmod(self.target, 0755)
+    cake.filesys.writeFile(self.extra, "map")
+    dependencyInfo = self.configuration.createDependencyInfo(
+      targets=[self.target, self.extra],
+      args=args,
+      dependencies=cache.normalizePaths([self.source]),
+      calculateDigests=True,
+      )
+    cache.store(dependencyInfo, "warning: something\n", key, duration)
+    cache.engine.flushCacheStores()
+
+  def _removeTargets(self):
+    shutil.rmtree(os.path.join(self.tmpDir, "out"))
+
+  def _testRestore(self, codec):
+    self._build(self._createCache(codec), ["link"])
+    self._removeTargets()
+
+    cache = self._createCache(codec)
+    self.assertTrue(cache.restore(self.target, ["link"], "Cached program\n"))
+    self.assertEqual(
+      cake.filesys.readFile(self.target),
+      "program built from source",
+      )
+    self.assertEqual(cake.filesys.readFile(self.extra), "map")
+    self.assertTrue(os.stat(self.target).st_mode & stat.S_IXUSR)
+    self.assertEqual(self.logger.infos, ["Cached program\n"])
+    self.assertEqual(self.logger.errors, ["warning: something\n"])
+
+    # The dependency info was stored so the target is now up to date.
+    _, reasonToBuild = self.configuration.checkDependencyInfo(
+      self.target,
+      ["link"],
+      )
+    self.assertEqual(reasonToBuild, None)
+
+  def testRestoreZlib(self):
+    self._testRestore("zlib")
+
+  def testRestoreLink(self):
+    self._testRestore("link")
+
+  def testChangedSource(self):
+    self._build(self._createCache(), ["link"])
+    self._removeTargets()
+    cake.filesys.writeFile(self.source, "changed")
+
+    cache = self._createCache()
+    self.assertFalse(cache.restore(self.target, ["link"], "Cached program\n"))
+    self.assertFalse(os.path.exists(self.target))
+    self.assertEqual(self.logger.infos, [])
+
+  def testChangedArgs(self):
+    self._build(self._createCache(), ["link"])
+    self._removeTargets()
+
+    cache = self._createCache()
+    self.assertFalse(cache.restore(self.target, ["link", "-O2"], "Cached\n"))
+
+  def testMissingOutput(self):
+    cache = self._createCache()
+    self._build(cache, ["link"])
+    self._removeTargets()
+
+    # An entry whose other outputs have been trimmed is a miss.
+    entry = cake.objectcache.readManifest(os.path.join(
+      cache.path,
+      cache._getManifestName(self.target),
+      ))[0]
+    digests = cake.objectcache.getEntryDigests(entry)
+    self.assertEqual(len(digests), 2)
+    os.remove(cake.objectcache.getCachePath(cache.path, digests[1]))
+
+    cache = self._createCache()
+    self.assertFalse(cache.restore(self.target, ["link"], "Cached program\n"))
+
+  def testForceBuild(self):
+    self._build(self._createCache(), ["link"])
+
+    cache = self._createCache()
+    self.configuration.engine.forceBuild = True
+    self.assertFalse(cache.restore(self.target, ["link"], "Cached program\n"))
+
+  def testRestorePreprocessed(self):
+    key = cake.hash.sha1("preprocessed").digest()
+    cache = self._createCache()
+    self._build(cache, ["link"], key)
+    self._removeTargets()
+
+    # The outputs are found by the key whatever the inputs are.
+    other = os.path.join(self.tmpDir, "other.txt")
+    cake.filesys.writeFile(other, "other")
+    cache = self._createCache()
+    self.assertFalse(cache.restorePreprocessed(
+      self.target,
+      ["link"],
+      cake.hash.sha1("different").digest(),
+      [other],
+      "Cached program\n",
+      ))
+    self.assertTrue(cache.restorePreprocessed(
+      self.target,
+      ["link"],
+      key,
+      [other],
+      "Cached program\n",
+      ))
+    self.assertEqual(cake.filesys.readFile(self.extra), "map")
+    self.assertEqual(self.logger.errors, ["warning: something\n"])
+
+    # The target's manifest now finds the outputs by the new inputs.
+    self._removeTargets()
+    cake.filesys.writeFile(self.source, "changed")
+    cache = self._createCache()
+    self.assertTrue(cache.restore(self.target, ["link"], "Cached program\n"))
+    _, reasonToBuild = self.configuration.checkDependencyInfo(
+      self.target,
+      ["link"],
+      )
+    self.assertEqual(reasonToBuild, None)
+
+  def testStatistics(self):
+    cache = self._createCache()
+    self.assertFalse(cache.restore(self.target, ["link"], "Cached program\n"))
+    self._build(cache, ["link"], duration=100.0)
+    self._removeTargets()
+    self.assertTrue(cache.restore(self.target, ["link"], "Cached program\n"))
+
+    directory = os.path.dirname(os.path.normpath(self.target))
+    counts = cache.engine.cacheStatistics.getCounts()
+    self.assertEqual(counts.keys(), [("", directory)])
+    counts = counts[("", directory)]
+    self.assertEqual(counts["lookups"], 2)
+    self.assertEqual(counts["hits"], 1)
+    self.assertEqual(counts["misses"], 1)
+    self.assertEqual(counts["stores"], 1)
+    self.assertTrue(counts["bytesRead"] > 0)
+    self.assertTrue(counts["bytesWritten"] > 0)
+    self.assertTrue(0 < counts["savedSeconds"] <= 100.0)
+
+  def testPreprocessedStatistics(self):
+    key = cake.hash.sha1("preprocessed").digest()
+    cache = self._createCache()
+    self._build(cache, ["link"], key)
+    self._removeTargets()
+    cake.filesys.writeFile(self.source, "changed")
+
+    # A lookup found by its key is a hit, not a miss.
+    cache = self._createCache()
+    self.assertFalse(cache.restore(self.target, ["link"], "Cached program\n"))
+    self.assertTrue(cache.restorePreprocessed(
+      self.target,
+      ["link"],
+      key,
+      cache.normalizePaths([self.source]),
+      "Cached program\n",
+      ))
+    totals = cache.engine.cacheStatistics.getTotals()
+    self.assertEqual(totals["lookups"], 1)
+    self.assertEqual(totals["hits"], 1)
+    self.assertEqual(totals["misses"], 0)
+    self.assertEqual(totals["savedSeconds"], 0)
+
+  def testStoreFailure(self):
+    cache = self._createCache()
+    cake.filesys.writeFile(os.path.join(self.tmpDir, "cache"), "not a directory")
+    self._build(cache, ["link"])
+
+    totals = cache.engine.cacheStatistics.getTotals()
+    self.assertEqual(totals["stores"], 0)
+    self.assertEqual(totals["storeFailures"], 1)
+
+class StoreQueueTests(unittest.TestCase):
+
+  def testBounded(self):
+    storeQueue = cake.actioncache.StoreQueue(threadCount=1, maximumSize=2)
+    release = threading.Event()
+    stored = []
+    def store(i):
+      release.wait(5)
+      stored.append(i)
+
+    storeQueue.queue(lambda: store(1))
+    storeQueue.queue(lambda: store(2))
+
+    # The third store waits until there's room in the queue.
+    queued = threading.Event()
+    def queueThird():
+      storeQueue.queue(lambda: store(3))
+      queued.set()
+    thread = threading.Thread(target=queueThird)
+    thread.start()
+    queued.wait(0.2)
+    self.assertFalse(queued.isSet())
+
+    release.set()
+    thread.join(5)
+    self.assertTrue(queued.isSet())
+    storeQueue.flush()
+    self.assertEqual(stored, [1, 2, 3])
+
+  def testErrorsDontStopTheQueue(self):
+    storeQueue = cake.actioncache.StoreQueue(threadCount=1, maximumSize=1)
+    stored = []
+    storeQueue.queue(lambda: 1 / 0)
+    storeQueue.queue(lambda: stored.append(True))
+    storeQueue.flush()
+    self.assertEqual(stored, [True])
+
+class RecordOutputTests(unittest.TestCase):
+
+  def testRecordedByChildTasks(self):
+    def run():
+      cake.actioncache.recordOutput("first\n")
+      child = cake.task.Task(lambda: cake.actioncache.recordOutput("second\n"))
+      task.completeAfter(child)
+      child.start(immediate=True)
+
+    e = threading.Event()
+    task = cake.task.Task(run)
+    cake.actioncache.startRecording(task)
+    task.addCallback(e.set)
+    task.start()
+    e.wait(5)
+
+    self.assertTrue(task.succeeded)
+    self.assertEqual(
+      cake.actioncache.getRecordedOutput(task),
+      "first\nsecond\n",
+      )
+
+  def testNotRecording(self):
+    cake.actioncache.recordOutput("ignored\n")
+    self.assertEqual(cake.actioncache.getRecordedOutput(cake.task.Task()), "")
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(ActionCacheTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(StoreQueueTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(RecordOutputTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -117,6 +117,8 @@ class AsyncResultTests(unittest.TestCase):
     self.assertEqual(flatten([1, 2, 3]), [1, 2, 3])
     self.assertEqual(flatten([1, [2, 3], 4]), [1, 2, 3, 4])
     self.assertEqual(flatten([[1, 2], [3, [4, 5], 6], 7]), [1, 2, 3, 4, 5, 6, 7])
+    self.assertEqual(flatten([[], [[]], 1, ([2], set([3]))]), [1, 2, 3])
+    self.assertEqual(flatten(1), [1])
 
   def testFlattenWithAsync(self):
 
@@ -145,6 +147,33 @@ class AsyncResultTests(unittest.TestCase):
 
     self.assertEqual(result.result, [1, 2, 3, 4, 5, 6, 7])
 
+  def testCallWithFailedAsyncResult(self):
+
+    @waitForAsyncResult
+    def makeArgs(*args):
+      return args
+
+    def fail():
+      raise RuntimeError()
+
+    t1 = Task(lambda: 1)
+    t2 = Task(fail)
+
+    # The same result may be passed more than once.
+    r1 = DeferredResult(t1)
+    r2 = DeferredResult(t2)
+    result = makeArgs(r1, [r1, r2], r2)
+
+    e = threading.Event()
+    result.task.addCallback(e.set)
+
+    t1.start()
+    t2.start()
+
+    e.wait(0.5)
+
+    self.assertTrue(result.task.failed)
+
 if __name__ == "__main__":
   suite = unittest.TestLoader().loadTestsFromTestCase(AsyncResultTests)
   runner = unittest.TextTestRunner(verbosity=2)
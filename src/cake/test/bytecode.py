@@ -0,0 +1,161 @@
+"""Bytecode Cache Unit Tests.
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+import cake.bytecode
+
+def _run(code):
+  scriptGlobals = {}
+  exec code in scriptGlobals
+  return scriptGlobals["x"]
+
+class ByteCodeCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.cachePath = os.path.join(self.tmpDir, "scripts.cache")
+    self.oldDontWriteByteCode = sys.dont_write_bytecode
+    sys.dont_write_bytecode = False
+
+  def tearDown(self):
+    sys.dont_write_bytecode = self.oldDontWriteByteCode
+    shutil.rmtree(self.tmpDir)
+
+  def _writeScript(self, name, source, mtime=None):
+    path = os.path.join(self.tmpDir, name)
+    f = open(path, "wb")
+    try:
+      f.write(source)
+    finally:
+      f.close()
+    if mtime is not None:
+      os.utime(path, (mtime, mtime))
+    return path
+
+  def _loadCode(self, path):
+    cache = cake.bytecode.ByteCodeCache(self.cachePath)
+    try:
+      return cache.loadCode(path)
+    finally:
+      cache.close()
+
+  def testLoadFromCache(self):
+    a = self._writeScript("a.cake", "x = 1\n")
+    b = self._writeScript("b.cake", "x = 2")
+
+    self.assertEqual(_run(self._loadCode(a)), 1)
+    self.assertEqual(_run(self._loadCode(b)), 2)
+    size = os.path.getsize(self.cachePath)
+
+    # Unchanged scripts are loaded without appending to the cache.
+    self.assertEqual(_run(self._loadCode(a)), 1)
+    self.assertEqual(_run(self._loadCode(b)), 2)
+    self.assertEqual(os.path.getsize(self.cachePath), size)
+
+  def testChangedWithinSameSecond(self):
+    a = self._writeScript("a.cake", "x = 1\n", mtime=1000000000)
+    self.assertEqual(_run(self._loadCode(a)), 1)
+
+    # Same whole-second timestamp but different contents.
+    a = self._writeScript("a.cake", "x = 100\n", mtime=1000000000.5)
+    self.assertEqual(_run(self._loadCode(a)), 100)
+
+  def testTouchedScriptReusesCode(self):
+    a = self._writeScript("a.cake", "x = 1\n", mtime=1000000000)
+    self.assertEqual(_run(self._loadCode(a)), 1)
+
+    a = self._writeScript("a.cake", "x = 1\n", mtime=1000000010)
+    self.assertEqual(_run(self._loadCode(a)), 1)
+    size = os.path.getsize(self.cachePath)
+
+    self.assertEqual(_run(self._loadCode(a)), 1)
+    self.assertEqual(os.path.getsize(self.cachePath), size)
+
+  def testCorruptCacheIgnored(self):
+    a = self._writeScript("a.cake", "x = 1\n")
+    self.assertEqual(_run(self._loadCode(a)), 1)
+
+    # Truncate the last record.
+    f = open(self.cachePath, "r+b")
+    try:
+      f.truncate(os.path.getsize(self.cachePath) - 3)
+    finally:
+      f.close()
+
+    self.assertEqual(_run(self._loadCode(a)), 1)
+
+  def testCompaction(self):
+    a = self._writeScript("a.cake", "x = 1\n")
+    for i in xrange(10):
+      self._writeScript("a.cake", "x = %i\n" % i, mtime=1000000000 + i)
+      self.assertEqual(_run(self._loadCode(a)), i)
+    uncompactedSize = os.path.getsize(self.cachePath)
+
+    cache = cake.bytecode.ByteCodeCache(self.cachePath)
+    cache._minCompactSize = 0
+    try:
+      self.assertEqual(_run(cache.loadCode(a)), 9)
+    finally:
+      cache.close()
+
+    self.assertTrue(os.path.getsize(self.cachePath) < uncompactedSize)
+    self.assertEqual(_run(self._loadCode(a)), 9)
+
+  def testConcurrentWriters(self):
+    a = self._writeScript("a.cake", "x = 1\n")
+    b = self._writeScript("b.cake", "x = 2\n")
+    c = self._writeScript("c.cake", "x = 3\n")
+
+    # The first cache reads its index before the second creates the file,
+    # it shouldn't then truncate what the second has written.
+    cache1 = cake.bytecode.ByteCodeCache(self.cachePath)
+    cache2 = cake.bytecode.ByteCodeCache(self.cachePath)
+    try:
+      sys.dont_write_bytecode = True
+      self.assertEqual(_run(cache1.loadCode(a)), 1)
+      sys.dont_write_bytecode = False
+      self.assertEqual(_run(cache2.loadCode(b)), 2)
+      self.assertEqual(_run(cache1.loadCode(c)), 3)
+    finally:
+      cache1.close()
+      cache2.close()
+    size = os.path.getsize(self.cachePath)
+
+    self.assertEqual(_run(self._loadCode(b)), 2)
+    self.assertEqual(_run(self._loadCode(c)), 3)
+    self.assertEqual(os.path.getsize(self.cachePath), size)
+
+  def testInvalidCacheReplaced(self):
+    a = self._writeScript("a.cake", "x = 1\n")
+    self._writeScript("scripts.cache", "not a cache")
+    self.assertEqual(_run(self._loadCode(a)), 1)
+    size = os.path.getsize(self.cachePath)
+
+    self.assertEqual(_run(self._loadCode(a)), 1)
+    self.assertEqual(os.path.getsize(self.cachePath), size)
+
+  def testFileKey(self):
+    a = self._writeScript("a.cake", "x = 1\n", mtime=1234567890.5)
+    self.assertEqual(
+      cake.bytecode._getFileKey(os.stat(a)),
+      (1234567890500000000, 6),
+      )
+
+    class _Stat(object):
+      st_mtime = 1234567890.0
+      st_mtime_ns = 1234567890123456789
+      st_size = 6
+    self.assertEqual(
+      cake.bytecode._getFileKey(_Stat()),
+      (1234567890123456789, 6),
+      )
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(ByteCodeCacheTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
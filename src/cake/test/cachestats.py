@@ -0,0 +1,75 @@
+"""Cache Statistics Unit Tests.
+"""
+
+import unittest
+import tempfile
+import shutil
+import json
+import sys
+import os
+
+import cake.cachestats
+import cake.filesys
+
+class CacheStatisticsTests(unittest.TestCase):
+
+  def _createStatistics(self):
+    stats = cake.cachestats.CacheStatistics()
+    stats.add("Variant(release=True)", "lib", lookups=2, hits=1, misses=1)
+    stats.add("Variant(release=True)", "lib", bytesRead=2048, savedSeconds=1.5)
+    stats.add("Variant(release=True)", "bin", lookups=1, misses=1, stores=1)
+    stats.add("Variant(release=False)", "lib", lookups=1, hits=1)
+    return stats
+
+  def testTotals(self):
+    totals = self._createStatistics().getTotals()
+    self.assertEqual(totals["lookups"], 4)
+    self.assertEqual(totals["hits"], 2)
+    self.assertEqual(totals["misses"], 2)
+    self.assertEqual(totals["stores"], 1)
+    self.assertEqual(totals["bytesRead"], 2048)
+    self.assertEqual(totals["savedSeconds"], 1.5)
+    self.assertEqual(totals["storeFailures"], 0)
+
+  def testSummary(self):
+    self.assertEqual(cake.cachestats.CacheStatistics().formatSummary(), "")
+    self.assertEqual(
+      self._createStatistics().formatSummary(),
+      "Cache: 2 hits, 2 misses (50%), read 2.0KB, wrote 0 bytes, "
+      "lookups took 0.00s, saved 1.5s.\n",
+      )
+
+    stats = cake.cachestats.CacheStatistics()
+    stats.add("", "lib", stores=1, storeFailures=2)
+    self.assertTrue(stats.formatSummary().endswith(", 2 stores failed.\n"))
+
+  def testFormatSize(self):
+    formatSize = cake.cachestats.formatSize
+    self.assertEqual(formatSize(0), "0 bytes")
+    self.assertEqual(formatSize(1023), "1023 bytes")
+    self.assertEqual(formatSize(1536), "1.5KB")
+    self.assertEqual(formatSize(3 * 1024 ** 3), "3.0GB")
+    self.assertEqual(formatSize(2 * 1024 ** 4), "2.0TB")
+
+  def testWriteFile(self):
+    tmpDir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpDir, "stats.json")
+      self._createStatistics().writeFile(path)
+      data = json.loads(cake.filesys.readFile(path))
+    finally:
+      shutil.rmtree(tmpDir)
+
+    self.assertEqual(data["total"]["lookups"], 4)
+    release = data["variants"]["Variant(release=True)"]
+    self.assertEqual(release["total"]["lookups"], 3)
+    self.assertEqual(sorted(release["directories"]), ["bin", "lib"])
+    self.assertEqual(release["directories"]["lib"]["hits"], 1)
+    self.assertEqual(release["directories"]["bin"]["stores"], 1)
+    debug = data["variants"]["Variant(release=False)"]
+    self.assertEqual(debug["total"]["hits"], 1)
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(CacheStatisticsTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,207 @@
+"""Compiler Unit Tests.
+"""
+
+import unittest
+import tempfile
+import shutil
+import stat
+import sys
+import os
+
+import cake.engine
+import cake.filesys
+import cake.logging
+
+from cake.library.compilers import Compiler, CompilerNotFoundError
+from cake.library.compilers.clang import ClangCompiler
+from cake.library.compilers.gcc import GccCompiler, findGccCompiler
+
+class _QuietLogger(cake.logging.Logger):
+
+  def outputInfo(self, message):
+    pass
+
+  def outputError(self, message):
+    pass
+
+def _createConfiguration(baseDir):
+  engine = cake.engine.Engine(_QuietLogger(), None, [])
+  return cake.engine.Configuration(os.path.join(baseDir, "config.cake"), engine)
+
+class PreprocessedKeyTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.compiler = Compiler(_createConfiguration(self.tmpDir))
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+  def _getKey(self, text, source="a.c"):
+    return self.compiler._getPreprocessedKey(
+      sys.executable,
+      ["-O2"],
+      text,
+      source,
+      )
+
+  def testLineMarkerFileNamesIgnored(self):
+    self.assertEqual(
+      self._getKey('# 1 "/ws1/a.c"\nint f;\n# 3 "/ws1/a.h" 1\nint g;\n'),
+      self._getKey('# 1 "/ws2/a.c"\nint f;\n# 3 "/ws2/a.h" 1\nint g;\n'),
+      )
+
+  def testLineMarkerLineNumbersHashed(self):
+    self.assertNotEqual(
+      self._getKey('# 1 "a.c"\nint f;\n# 3 "a.c"\nint g;\n'),
+      self._getKey('# 1 "a.c"\nint f;\n# 15 "a.c"\nint g;\n'),
+      )
+    self.assertNotEqual(
+      self._getKey('# 3 "a.h" 1\nint g;\n'),
+      self._getKey('# 3 "a.h" 2\nint g;\n'),
+      )
+
+  def testDebugSymbolsHashSourcePath(self):
+    text = 'int f;\n'
+    self.assertEqual(self._getKey(text, "a.c"), self._getKey(text, "b/a.c"))
+    self.compiler.debugSymbols = True
+    self.assertNotEqual(self._getKey(text, "a.c"), self._getKey(text, "b/a.c"))
+
+  def _getGccKey(self, compiler, source, text):
+    cake.filesys.writeFile(source, text)
+    preprocess = compiler.getObjectPreprocessCommand(
+      os.path.splitext(source)[0] + ".o",
+      source,
+      None,
+      False,
+      )
+    return preprocess()[0]
+
+  def testGccBlankLines(self):
+    try:
+      compiler = findGccCompiler(_createConfiguration(self.tmpDir))
+    except CompilerNotFoundError:
+      return # Nothing to test without gcc.
+    compiler.objectCachePath = os.path.join(self.tmpDir, "cache")
+    compiler.objectCachePreprocess = True
+
+    code = "int f(void) { return 1; }\n%sint g(void) { return 2; }\n"
+    key = self._getGccKey(
+      compiler,
+      os.path.join(self.tmpDir, "a", "x.c"),
+      code % "",
+      )
+    self.assertEqual(key, self._getGccKey(
+      compiler,
+      os.path.join(self.tmpDir, "b", "x.c"),
+      code % "",
+      ))
+    self.assertNotEqual(key, self._getGccKey(
+      compiler,
+      os.path.join(self.tmpDir, "c", "x.c"),
+      code % ("\n" * 12),
+      ))
+
+class PrefixMapTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.configuration = _createConfiguration(self.tmpDir)
+    self.root = os.path.join(self.tmpDir, "ws")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+  def _setObjectCache(self, compiler):
+    compiler.objectCachePath = os.path.join(self.tmpDir, "cache")
+    compiler.objectCacheWorkspaceRoot = self.root
+    return compiler
+
+  def _getPrefixMapArgs(self, args):
+    return [a for a in args if "prefix-map" in a]
+
+  def testCacheArgsReplaceWholeComponents(self):
+    compiler = self._setObjectCache(Compiler(self.configuration))
+    root = self.root
+    self.assertEqual(
+      compiler._getCacheArgs([
+        "-I" + os.path.join(root, "inc"),
+        "-I" + os.path.join(root + "2", "inc"),
+        "-ffile-prefix-map=%s=." % root,
+        root,
+        ]),
+      [
+        "-I" + os.path.join("<workspace>", "inc"),
+        "-I" + os.path.join(root + "2", "inc"),
+        "-ffile-prefix-map=<workspace>=.",
+        "<workspace>",
+        ],
+      )
+
+  def testPrefixMapNone(self):
+    compiler = self._setObjectCache(
+      GccCompiler(self.configuration, gccExe="gcc", version=[12])
+      )
+    compiler.objectCachePrefixMap = None
+    self.assertEqual(compiler._getPrefixMap(), None)
+    args = ["-I" + os.path.join(self.root, "inc")]
+    self.assertEqual(compiler._getCacheArgs(args), args)
+    self.assertEqual(
+      self._getPrefixMapArgs(compiler._getCompileArgs(".c")),
+      [],
+      )
+
+  def testGccVersions(self):
+    fileMap = ["-ffile-prefix-map=%s=." % self.root]
+    debugMap = ["-fdebug-prefix-map=%s=." % self.root]
+    for version, expected in [
+      ([12], fileMap),
+      ([8], fileMap),
+      ([7, 5], debugMap),
+      ([4, 3], debugMap),
+      ([4, 2], []),
+      ]:
+      compiler = self._setObjectCache(
+        GccCompiler(self.configuration, gccExe="gcc", version=version)
+        )
+      self.assertEqual(
+        self._getPrefixMapArgs(compiler._getCompileArgs(".c")),
+        expected,
+        )
+
+  def _createClang(self, version):
+    # A stand-in executable that only reports its version.
+    clangExe = os.path.join(self.tmpDir, version, "clang")
+    cake.filesys.writeFile(
+      clangExe,
+      "#!/bin/sh\necho 'clang version %s (test)'\n" % version,
+      )
+    os.chmod(clangExe, stat.S_IRWXU)
+    return self._setObjectCache(
+      ClangCompiler(self.configuration, clangExe, None, [])
+      )
+
+  def testClangVersions(self):
+    if os.name != "posix":
+      return # The stand-in clang is a shell script.
+
+    fileMap = ["-ffile-prefix-map=%s=." % self.root]
+    debugMap = ["-fdebug-prefix-map=%s=." % self.root]
+    for version, expected in [
+      ("10.0.0", fileMap),
+      ("9.0.1", debugMap),
+      ("3.8.0", debugMap),
+      ("3.7.1", []),
+      ]:
+      compiler = self._createClang(version)
+      self.assertEqual(
+        self._getPrefixMapArgs(compiler._getCommonCompileArgs(".c")),
+        expected,
+        )
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(PreprocessedKeyTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(PrefixMapTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,176 @@
+"""Coroutine Unit Tests.
+"""
+
+import unittest
+import threading
+import tempfile
+import sys
+import os
+
+import cake.coroutine
+import cake.engine
+import cake.logging
+import cake.reactor
+
+from cake.coroutine import returnValue
+from cake.task import Task, TaskError
+
+def _runCoroutine(func):
+  """Run the coroutine returned by func in a task and wait for it.
+  """
+  e = threading.Event()
+  task = Task(lambda: cake.coroutine.run(func()))
+  task.addCallback(e.set)
+  task.start()
+  e.wait(5)
+  return task
+
+class CoroutineTests(unittest.TestCase):
+
+  def testYieldTasks(self):
+    def coroutine():
+      a = Task(lambda: 1)
+      a.start()
+      b = Task(lambda: 2)
+      b.start()
+      c = Task(lambda: 3)
+      c.lazyStart()
+      x = yield a
+      y, z = yield [b, c]
+      returnValue(x + y + z)
+
+    task = _runCoroutine(coroutine)
+
+    self.assertTrue(task.succeeded)
+    self.assertEqual(task.result, 6)
+
+  def testNoReturnValue(self):
+    def coroutine():
+      yield None
+
+    task = _runCoroutine(coroutine)
+
+    self.assertTrue(task.succeeded)
+    self.assertEqual(task.result, None)
+
+  def testFailedTaskThrowsIntoCoroutine(self):
+    def fail():
+      raise RuntimeError()
+
+    def coroutine():
+      t = Task(fail)
+      t.start()
+      try:
+        yield t
+      except TaskError:
+        returnValue("caught")
+      returnValue("not caught")
+
+    task = _runCoroutine(coroutine)
+
+    self.assertTrue(task.succeeded)
+    self.assertEqual(task.result, "caught")
+
+  def testExceptionFailsTask(self):
+    def coroutine():
+      t = Task()
+      t.start()
+      yield t
+      raise RuntimeError()
+
+    task = _runCoroutine(coroutine)
+
+    self.assertTrue(task.failed)
+
+  def testWaitingCoroutinesDontUseThreads(self):
+    count = 500
+    gate = Task()
+
+    def coroutine(i):
+      yield gate
+      returnValue(i)
+
+    s = threading.Semaphore(0)
+    tasks = []
+    for i in xrange(count):
+      t = Task(lambda i=i: cake.coroutine.run(coroutine(i)))
+      t.addCallback(s.release)
+      t.start()
+      tasks.append(t)
+
+    gate.start()
+    for _ in xrange(count):
+      s.acquire()
+
+    for i, t in enumerate(tasks):
+      self.assertTrue(t.succeeded)
+      self.assertEqual(t.result, i)
+
+  def testReadWriteFile(self):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      def coroutine():
+        yield cake.coroutine.writeFile(path, "hello")
+        data = yield cake.coroutine.readFile(path)
+        returnValue(data)
+
+      task = _runCoroutine(coroutine)
+
+      self.assertTrue(task.succeeded)
+      self.assertEqual(task.result, "hello")
+    finally:
+      os.remove(path)
+
+  def testWaitForRead(self):
+    if not cake.reactor.isSupported():
+      self.skipTest("waiting on file descriptors not supported on this platform")
+
+    r, w = os.pipe()
+    try:
+      def coroutine():
+        yield cake.coroutine.waitForRead(r)
+        returnValue(os.read(r, 100))
+
+      e = threading.Event()
+      task = Task(lambda: cake.coroutine.run(coroutine()))
+      task.addCallback(e.set)
+      task.start()
+
+      os.write(w, "data")
+      e.wait(5)
+
+      self.assertTrue(task.succeeded)
+      self.assertEqual(task.result, "data")
+    finally:
+      os.close(r)
+      os.close(w)
+
+  def testEngineCreateTask(self):
+    engine = cake.engine.Engine(cake.logging.Logger(), None, [])
+
+    def fail():
+      raise cake.engine.BuildError()
+
+    def coroutine():
+      t = engine.createTask(fail)
+      t.start()
+      try:
+        yield t
+      except cake.engine.BuildError:
+        returnValue("failed")
+      returnValue("succeeded")
+
+    e = threading.Event()
+    task = engine.createTask(coroutine)
+    task.addCallback(e.set)
+    task.start()
+    e.wait(5)
+
+    self.assertTrue(task.succeeded)
+    self.assertEqual(task.result, "failed")
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(CoroutineTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
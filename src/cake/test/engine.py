@@ -0,0 +1,199 @@
+"""Engine Unit Tests.
+"""
+
+import unittest
+import threading
+import sys
+
+import cake.engine
+import cake.logging
+import cake.task
+
+class _QuietLogger(cake.logging.Logger):
+
+  def __init__(self):
+    cake.logging.Logger.__init__(self)
+    self.errors = []
+
+  def outputError(self, message):
+    self.errors.append(message)
+
+class FailFastTests(unittest.TestCase):
+
+  def _createEngine(self, failFast):
+    engine = cake.engine.Engine(_QuietLogger(), None, [])
+    engine.maximumErrorCount = 1
+    engine.failFast = failFast
+    return engine
+
+  def testPendingTasksCancelledOnError(self):
+    engine = self._createEngine(failFast=True)
+
+    # Tasks waiting on a gate that is never started can only complete by
+    # being cancelled.
+    gate = cake.task.Task()
+    pending = [engine.createTask(lambda: None) for _ in xrange(3)]
+    for t in pending:
+      t.startAfter(gate)
+
+    def fail():
+      engine.raiseError("error\n")
+
+    e = threading.Event()
+    failing = engine.createTask(fail)
+    failing.addCallback(e.set)
+    failing.start()
+
+    e.wait(5)
+
+    self.assertTrue(failing.failed)
+    self.assertTrue(engine.aborted)
+    self.assertEqual(engine.skippedCount, 3)
+    for t in pending:
+      self.assertTrue(t.failed)
+
+    # Tasks started after the abort are skipped too.
+    e = threading.Event()
+    late = engine.createTask(lambda: None)
+    late.addCallback(e.set)
+    late.start()
+
+    e.wait(5)
+
+    self.assertTrue(late.failed)
+    self.assertEqual(engine.skippedCount, 4)
+
+  def testTasksNotCancelledWithoutFailFast(self):
+    engine = self._createEngine(failFast=False)
+
+    gate = cake.task.Task()
+    pending = engine.createTask(lambda: None)
+    pending.startAfter(gate)
+
+    def fail():
+      engine.raiseError("error\n")
+
+    e = threading.Event()
+    failing = engine.createTask(fail)
+    failing.addCallback(e.set)
+    failing.start()
+
+    e.wait(5)
+
+    self.assertTrue(failing.failed)
+    self.assertFalse(engine.aborted)
+    self.assertFalse(pending.completed)
+
+    # Once the limit has been reached the pending task fails when it runs.
+    e = threading.Event()
+    pending.addCallback(e.set)
+    gate.start()
+
+    e.wait(5)
+
+    self.assertTrue(pending.failed)
+    self.assertEqual(engine.skippedCount, 0)
+
+class ScriptThreadPoolTests(unittest.TestCase):
+
+  def testDefaultsToSingleThread(self):
+    engine = cake.engine.Engine(_QuietLogger(), None, [])
+    self.assertEqual(engine.scriptThreadPool.numWorkers, 1)
+
+  def testScriptThreadCount(self):
+    engine = cake.engine.Engine(_QuietLogger(), None, [])
+    engine.scriptThreadCount = 3
+    self.assertEqual(engine.scriptThreadPool.numWorkers, 3)
+    self.assertTrue(engine.scriptThreadPool is engine.scriptThreadPool)
+
+class VariantTests(unittest.TestCase):
+
+  def _createConfiguration(self):
+    engine = cake.engine.Engine(_QuietLogger(), None, [])
+    return cake.engine.Configuration("config.cake", engine)
+
+  def _addVariants(self, configuration, constructed, available=True):
+    for compiler in ["gcc", "msvc"]:
+      for target in ["debug", "release"]:
+        variant = cake.engine.Variant(compiler=compiler, target=target)
+        def factory(variant):
+          constructed.append(variant)
+          return available
+        variant.factory = factory
+        configuration.addVariant(variant)
+
+  def testFactoryOnlyCalledForSelectedVariants(self):
+    configuration = self._createConfiguration()
+    constructed = []
+    self._addVariants(configuration, constructed)
+
+    variants = list(configuration.findAllVariants({"compiler": "gcc"}))
+    self.assertEqual(len(variants), 2)
+    self.assertEqual(sorted(constructed), sorted(variants))
+
+    # Variants are only constructed once.
+    configuration.findVariant({"compiler": "gcc", "target": "debug"})
+    self.assertEqual(len(constructed), 2)
+
+  def testUnavailableVariantsSkipped(self):
+    configuration = self._createConfiguration()
+    self._addVariants(configuration, [], available=False)
+
+    self.assertEqual(list(configuration.findAllVariants()), [])
+    self.assertRaises(
+      LookupError,
+      configuration.findVariant,
+      {"compiler": "gcc", "target": "debug"},
+      )
+
+  def testMatchListAndAll(self):
+    configuration = self._createConfiguration()
+    self._addVariants(configuration, [])
+
+    variants = list(configuration.findAllVariants({
+      "compiler": ["gcc", "msvc"],
+      "target": "all",
+      }))
+    self.assertEqual(len(variants), 4)
+
+    variants = list(configuration.findAllVariants({"compiler": "clang"}))
+    self.assertEqual(variants, [])
+
+  def testFindVariantWithBaseVariant(self):
+    configuration = self._createConfiguration()
+    constructed = []
+    self._addVariants(configuration, constructed)
+
+    base = configuration.findVariant({"compiler": "gcc", "target": "debug"})
+    variant = configuration.findVariant({"target": "release"}, baseVariant=base)
+    self.assertEqual(variant.keywords, {"compiler": "gcc", "target": "release"})
+    self.assertEqual(len(constructed), 2)
+
+  def testFindVariantWithBaseVariantMissingKeyword(self):
+    configuration = self._createConfiguration()
+    debug = cake.engine.Variant(platform="linux", target="debug")
+    release = cake.engine.Variant(platform="linux", target="release", arch="x86")
+    configuration.addVariant(debug)
+    configuration.addVariant(release)
+
+    # The base variant's keywords only have to match the keywords the
+    # candidate has.
+    variant = configuration.findVariant({"target": "debug"}, baseVariant=release)
+    self.assertTrue(variant is debug)
+
+  def testConstructionScriptNotRunBySelection(self):
+    configuration = self._createConfiguration()
+    variant = cake.engine.Variant(target="debug")
+    variant.constructionScriptPath = "missing/construct.cake"
+    configuration.addVariant(variant)
+
+    # Selecting the variant doesn't run its construction script, which
+    # would fail as it doesn't exist.
+    self.assertEqual(list(configuration.findAllVariants()), [variant])
+    self.assertTrue(configuration.findVariant({"target": "debug"}) is variant)
+    self.assertFalse(variant._isConstructed)
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(FailFastTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
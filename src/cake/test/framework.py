@@ -262,7 +262,7 @@ class TestContext:
     try:
       try:
         p = subprocess.Popen(
-          args=[sys.executable, '-u', cakeScript, args],
+          args=[sys.executable, '-u', cakeScript] + list(args),
           env=env,
           cwd=cwd,
           stdout=outfile,
@@ -0,0 +1,328 @@
+"""Object Cache Unit Tests.
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+import cake.cachecodec
+import cake.filesys
+import cake.hash
+import cake.objectcache
+
+class ManifestTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpDir, "a", "b", "target.manifest")
+    self.digests = {"a.c": "A", "b.h": "B"}
+    self.calls = []
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+  def _getFileDigest(self, path):
+    self.calls.append(path)
+    try:
+      return self.digests[path]
+    except KeyError:
+      raise EnvironmentError("%s doesn't exist" % path)
+
+  def testReadMissing(self):
+    self.assertEqual(cake.objectcache.readManifest(self.path), [])
+
+  def testReadInvalid(self):
+    os.makedirs(os.path.dirname(self.path))
+    f = open(self.path, "wb")
+    f.write("garbage")
+    f.close()
+    self.assertEqual(cake.objectcache.readManifest(self.path), [])
+
+  def testReadPickle(self):
+    import pickle
+    os.makedirs(os.path.dirname(self.path))
+    entries = [("args", ["a.c"], ["A"], "obj1")]
+    cake.filesys.writeFile(
+      self.path,
+      cake.objectcache._MAGIC + pickle.dumps((2, entries)),
+      )
+    self.assertEqual(cake.objectcache.readManifest(self.path), [])
+
+  def testReadInvalidEntries(self):
+    valid = ("args", ["a.c"], ["A"], "obj1")
+    cake.objectcache.writeManifest(self.path, [
+      valid,
+      ("args", ["a.c"], ["A", "B"], "obj2"),
+      ("args", [1], ["A"], "obj3"),
+      ("args", ["a.c"], ["A"], "obj4", (["a.o"], "", ["x"])),
+      ["args", ["a.c"], ["A"], "obj5"],
+      ])
+    self.assertEqual(cake.objectcache.readManifest(self.path), [valid])
+
+  def testWriteAndRead(self):
+    entries = [("args", ["a.c", "b.h"], ["A", "B"], "obj1")]
+    cake.objectcache.writeManifest(self.path, entries)
+    self.assertEqual(cake.objectcache.readManifest(self.path), entries)
+    self.assertEqual(os.listdir(os.path.dirname(self.path)), ["target.manifest"])
+
+  def testFindStopsAtFirstMatch(self):
+    entries = [
+      ("other", ["a.c"], ["A"], "obj1"),
+      ("args", ["a.c", "b.h"], ["X", "B"], "obj2"),
+      ("args", ["a.c", "b.h"], ["A", "B"], "obj3"),
+      ("args", ["a.c"], ["A"], "obj4"),
+      ]
+    index = cake.objectcache.findEntry(entries, "args", self._getFileDigest)
+    self.assertEqual(index, 2)
+    # Entries with other args aren't compared and a changed dependency
+    # stops the comparison of an entry.
+    self.assertEqual(self.calls, ["a.c", "a.c", "b.h"])
+
+  def testFindMissingDependency(self):
+    entries = [
+      ("args", ["gone.h", "a.c"], ["G", "A"], "obj1"),
+      ("args", ["a.c"], ["A"], "obj2"),
+      ]
+    self.assertEqual(cake.objectcache.findEntry(entries, "args", self._getFileDigest), 1)
+    self.assertEqual(cake.objectcache.findEntry(entries, "other", self._getFileDigest), -1)
+
+  def testAddEntryMostRecentlyUsedFirst(self):
+    first = ("args", ["a.c"], ["A"], "obj1")
+    second = ("args", ["a.c"], ["B"], "obj2")
+    entries = cake.objectcache.addEntry([], first)
+    entries = cake.objectcache.addEntry(entries, second)
+    self.assertEqual(entries, [second, first])
+    entries = cake.objectcache.addEntry(entries, first)
+    self.assertEqual(entries, [first, second])
+
+  def testAddEntryLimit(self):
+    entries = []
+    for i in xrange(cake.objectcache.maximumEntries + 5):
+      entries = cake.objectcache.addEntry(entries, ("args", [], [], "obj%i" % i))
+    self.assertEqual(len(entries), cake.objectcache.maximumEntries)
+    self.assertEqual(entries[0][3], "obj%i" % (cake.objectcache.maximumEntries + 4))
+
+class TrimTests(unittest.TestCase):
+
+  def setUp(self):
+    self.cachePath = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.cachePath)
+
+  def _writeObject(self, name, size, mtime):
+    digest = cake.hash.sha1(name).digest()
+    path = cake.objectcache.getCachePath(self.cachePath, digest)
+    cake.filesys.writeFile(path, "x" * size)
+    os.utime(path, (mtime, mtime))
+    return digest, path
+
+  def _writeManifest(self, name, objectDigests):
+    path = cake.objectcache.getManifestPath(
+      self.cachePath,
+      cake.hash.sha1(name).digest(),
+      )
+    entries = [("args", [], [], d) for d in objectDigests]
+    cake.objectcache.writeManifest(path, entries)
+    os.utime(path, (1000, 1000))
+    return path
+
+  def testLeastRecentlyUsedRemoved(self):
+    old, oldPath = self._writeObject("old", 1000, 1000)
+    mid, midPath = self._writeObject("mid", 1000, 2000)
+    new, newPath = self._writeObject("new", 1000, 3000)
+    manifestPath = self._writeManifest("target", [new, old])
+    otherPath = self._writeManifest("other", [old])
+
+    removedCount, removedSize, remainingSize = cake.objectcache.trimCache(
+      self.cachePath,
+      2000,
+      )
+
+    self.assertFalse(os.path.exists(oldPath))
+    self.assertFalse(os.path.exists(midPath))
+    self.assertTrue(os.path.exists(newPath))
+    self.assertFalse(os.path.exists(otherPath))
+    self.assertEqual(
+      [e[3] for e in cake.objectcache.readManifest(manifestPath)],
+      [new],
+      )
+    self.assertEqual(removedCount, 3)
+    self.assertEqual(remainingSize, 1000 + os.stat(manifestPath).st_size)
+
+  def testUnderMaximumSize(self):
+    _, path = self._writeObject("a", 1000, 1000)
+    result = cake.objectcache.trimCache(self.cachePath, 2000)
+    self.assertEqual(result, (0, 0, 1000))
+    self.assertTrue(os.path.exists(path))
+
+  def testOldFilesRemoved(self):
+    # Dependency lists from before manifests were used.
+    _, legacyPath = self._writeObject("a", 10, 1000)
+    os.remove(legacyPath)
+    os.makedirs(legacyPath)
+    cake.filesys.writeFile(os.path.join(legacyPath, "deps"), "")
+
+    tmpPath = os.path.join(os.path.dirname(legacyPath), "b.1.2.tmp")
+    cake.filesys.writeFile(tmpPath, "x")
+    os.utime(tmpPath, (1000, 1000))
+    newTmpPath = os.path.join(os.path.dirname(legacyPath), "c.1.2.tmp")
+    cake.filesys.writeFile(newTmpPath, "x")
+
+    result = cake.objectcache.trimCache(self.cachePath)
+    self.assertEqual(result, (2, 1, 1))
+    self.assertFalse(os.path.exists(legacyPath))
+    self.assertFalse(os.path.exists(tmpPath))
+    self.assertTrue(os.path.exists(newTmpPath))
+
+  def testAlreadyTrimming(self):
+    lockPath = os.path.join(self.cachePath, cake.objectcache._LOCK_NAME)
+    cake.filesys.writeFile(lockPath, "")
+    self.assertEqual(cake.objectcache.trimCache(self.cachePath, 0), None)
+
+    # Locks left by processes that died are broken.
+    os.utime(lockPath, (1000, 1000))
+    self.assertEqual(cake.objectcache.trimCache(self.cachePath, 0), (0, 0, 0))
+    self.assertFalse(os.path.exists(lockPath))
+
+  def testRestoreRecordsUse(self):
+    sourcePath = os.path.join(self.cachePath, "source.o")
+    targetPath = os.path.join(self.cachePath, "target.o")
+    cake.filesys.writeFile(sourcePath, "object")
+    codec = cake.cachecodec.getCodec("zlib")
+    objectPath = cake.objectcache.getCachePath(self.cachePath, "\0" * 20)
+    cake.objectcache.storeObject(sourcePath, objectPath, codec)
+    os.utime(objectPath, (1000, 1000))
+
+    cake.objectcache.restoreObject(objectPath, targetPath, codec)
+    self.assertEqual(cake.filesys.readFile(targetPath), "object")
+    self.assertTrue(os.stat(objectPath).st_atime > 1000)
+    self.assertEqual(os.stat(objectPath).st_mtime, 1000)
+
+  def testCodecSuffixes(self):
+    old, oldPath = self._writeObject("old", 1000, 1000)
+    for suffix in ("", ".raw"):
+      path = oldPath + suffix
+      cake.filesys.writeFile(path, "x" * 1000)
+      os.utime(path, (1000, 1000))
+    new, newPath = self._writeObject("new", 1000, 3000)
+    rawPath = newPath + ".raw"
+    cake.filesys.writeFile(rawPath, "x" * 1000)
+    os.utime(rawPath, (1000, 1000))
+    manifestPath = self._writeManifest("target", [new, old])
+
+    result = cake.objectcache.trimCache(self.cachePath, 2000)
+    self.assertEqual(result[0], 3)
+    self.assertFalse(os.path.exists(oldPath))
+    self.assertFalse(os.path.exists(rawPath))
+    self.assertTrue(os.path.exists(newPath))
+    # The new object is still stored by one codec.
+    self.assertEqual(
+      [e[3] for e in cake.objectcache.readManifest(manifestPath)],
+      [new],
+      )
+
+class CodecTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.sourcePath = os.path.join(self.tmpDir, "source.o")
+    self.cachePath = os.path.join(self.tmpDir, "cached")
+    self.targetPath = os.path.join(self.tmpDir, "target.o")
+    # Larger than a block and not very compressible.
+    self.data = "".join(
+      cake.hash.sha1(str(i)).digest() for i in xrange(60000)
+      ) + "\0" * 100000
+    cake.filesys.writeFile(self.sourcePath, self.data)
+
+  def tearDown(self):
+    for dirPath, _, fileNames in os.walk(self.tmpDir):
+      for name in fileNames:
+        os.chmod(os.path.join(dirPath, name), 0644)
+    shutil.rmtree(self.tmpDir)
+
+  def _roundTrip(self, name):
+    codec = cake.cachecodec.getCodec(name)
+    cake.objectcache.storeObject(self.sourcePath, self.cachePath, codec)
+    cake.filesys.writeFile(self.targetPath, "old contents")
+    cake.objectcache.restoreObject(self.cachePath, self.targetPath, codec)
+    self.assertEqual(cake.filesys.readFile(self.targetPath), self.data)
+    self.assertEqual(
+      sorted(os.listdir(self.tmpDir)),
+      ["cached", "source.o", "target.o"],
+      )
+    return codec
+
+  def testNone(self):
+    codec = self._roundTrip("none")
+    self.assertEqual(codec.suffix, ".raw")
+    self.assertEqual(os.stat(self.targetPath).st_nlink, 1)
+
+  def testLink(self):
+    self._roundTrip("link")
+    # The source, cached object and target share their data.
+    self.assertEqual(os.stat(self.targetPath).st_nlink, 3)
+    self.assertFalse(os.stat(self.cachePath).st_mode & 0222)
+
+    # Restoring with another codec doesn't write through the link.
+    cake.objectcache.restoreObject(
+      self.cachePath,
+      self.targetPath,
+      cake.cachecodec.getCodec("none"),
+      )
+    self.assertEqual(os.stat(self.targetPath).st_nlink, 1)
+    self.assertEqual(os.stat(self.cachePath).st_nlink, 2)
+
+  def testZlib(self):
+    codec = self._roundTrip("zlib-6")
+    self.assertEqual(codec.level, 6)
+    self.assertTrue(os.path.getsize(self.cachePath) < len(self.data))
+
+  def testZlibCompatible(self):
+    # Objects cached by earlier versions are still restored.
+    import cake.zipping
+    cake.zipping.compressFile(self.sourcePath, self.cachePath)
+    cake.objectcache.restoreObject(
+      self.cachePath,
+      self.targetPath,
+      cake.cachecodec.getCodec("zlib"),
+      )
+    self.assertEqual(cake.filesys.readFile(self.targetPath), self.data)
+
+  def testInvalidObject(self):
+    cake.filesys.writeFile(self.cachePath, "garbage")
+    self.assertRaises(
+      EnvironmentError,
+      cake.objectcache.restoreObject,
+      self.cachePath,
+      self.targetPath,
+      cake.cachecodec.getCodec("zlib"),
+      )
+
+  def testInvalidNames(self):
+    for name in ("unknown", "zlib-x", "zlib-10", "none-1"):
+      self.assertRaises(ValueError, cake.cachecodec.getCodec, name)
+
+  def testCodecsShared(self):
+    self.assertTrue(
+      cake.cachecodec.getCodec("zlib-9") is cake.cachecodec.getCodec("zlib-9")
+      )
+
+  def testReleaseTarget(self):
+    otherPath = os.path.join(self.tmpDir, "other.o")
+    os.link(self.sourcePath, otherPath)
+    cake.objectcache.releaseTarget(otherPath)
+    self.assertFalse(os.path.exists(otherPath))
+    cake.objectcache.releaseTarget(self.sourcePath)
+    self.assertTrue(os.path.exists(self.sourcePath))
+    cake.objectcache.releaseTarget(otherPath)
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(ManifestTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TrimTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(CodecTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,123 @@
+"""Probe Cache Unit Tests.
+"""
+
+import unittest
+import threading
+import tempfile
+import shutil
+import sys
+import os
+
+import cake.probe
+
+class ProbeCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.cachePath = os.path.join(self.tmpDir, "probes.cache")
+    self.exePath = self._writeFile("tool", "v1", mtime=1000000000)
+    self.calls = []
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+  def _writeFile(self, name, contents, mtime=None):
+    path = os.path.join(self.tmpDir, name)
+    f = open(path, "wb")
+    try:
+      f.write(contents)
+    finally:
+      f.close()
+    if mtime is not None:
+      os.utime(path, (mtime, mtime))
+    return path
+
+  def _getVersion(self, path, suffix=""):
+    self.calls.append(path)
+    f = open(path, "rb")
+    try:
+      return f.read() + suffix
+    finally:
+      f.close()
+
+  def _probe(self, *args, **kwargs):
+    cache = cake.probe.ProbeCache(self.cachePath)
+    return cache.probe("version", self.exePath, self._getVersion, *args, **kwargs)
+
+  def testResultCachedOnDisk(self):
+    self.assertEqual(self._probe(), "v1")
+    self.assertEqual(self._probe(), "v1")
+    self.assertEqual(len(self.calls), 1)
+
+    # Arguments are part of the key.
+    self.assertEqual(self._probe(args=("x",)), "v1x")
+    self.assertEqual(self._probe(args=("x",)), "v1x")
+    self.assertEqual(len(self.calls), 2)
+
+  def testExecutableChanged(self):
+    self.assertEqual(self._probe(), "v1")
+    self._writeFile("tool", "v2", mtime=1000000010)
+    self.assertEqual(self._probe(), "v2")
+    self.assertEqual(self._probe(), "v2")
+    self.assertEqual(len(self.calls), 2)
+
+  def testDependencyChanged(self):
+    dependency = self._writeFile("dep", "a", mtime=1000000000)
+    self.assertEqual(self._probe(dependencies=[dependency]), "v1")
+    self._writeFile("dep", "ab", mtime=1000000000)
+    self.assertEqual(self._probe(dependencies=[dependency]), "v1")
+    self.assertEqual(len(self.calls), 2)
+
+  def testExceptionsNotCached(self):
+    cache = cake.probe.ProbeCache(self.cachePath)
+
+    def fail(path):
+      self.calls.append(path)
+      raise EnvironmentError("failed")
+
+    self.assertRaises(EnvironmentError, cache.probe, "version", self.exePath, fail)
+    self.assertRaises(EnvironmentError, cache.probe, "version", self.exePath, fail)
+    self.assertEqual(len(self.calls), 2)
+
+  def testMissingExecutable(self):
+    cache = cake.probe.ProbeCache(self.cachePath)
+    missingPath = os.path.join(self.tmpDir, "missing")
+
+    def probe(path):
+      self.calls.append(path)
+      return "x"
+
+    self.assertEqual(cache.probe("version", missingPath, probe), "x")
+    self.assertEqual(cache.probe("version", missingPath, probe), "x")
+    self.assertEqual(len(self.calls), 2)
+
+  def testPrefetch(self):
+    cache = cake.probe.ProbeCache(self.cachePath)
+    gate = threading.Event()
+    started = threading.Event()
+
+    def probe(path):
+      started.set()
+      gate.wait(5)
+      return self._getVersion(path)
+
+    cache.prefetch("version", self.exePath, probe)
+    started.wait(5)
+    # Prefetching again doesn't start another probe.
+    cache.prefetch("version", self.exePath, probe)
+    gate.set()
+
+    self.assertEqual(cache.probe("version", self.exePath, probe), "v1")
+    self.assertEqual(len(self.calls), 1)
+
+  def testInMemoryOnly(self):
+    cache = cake.probe.ProbeCache()
+    self.assertEqual(cache.probe("version", self.exePath, self._getVersion), "v1")
+    self.assertEqual(cache.probe("version", self.exePath, self._getVersion), "v1")
+    self.assertEqual(len(self.calls), 1)
+    self.assertFalse(os.path.exists(self.cachePath))
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(ProbeCacheTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
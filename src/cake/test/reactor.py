@@ -0,0 +1,117 @@
+"""Process Reactor Unit Tests.
+"""
+
+import unittest
+import threading
+import sys
+
+import cake.reactor
+
+class ProcessReactorTests(unittest.TestCase):
+
+  def setUp(self):
+    if not cake.reactor.isSupported():
+      self.skipTest("process reactor not supported on this platform")
+
+  def testCapturesOutputAndExitCode(self):
+    reactor = cake.reactor.ProcessReactor(maxProcesses=2)
+
+    e = threading.Event()
+    t = reactor.spawn("echo hello; echo world 1>&2; exit 3", shell=True)
+    t.addCallback(e.set)
+
+    e.wait(5)
+
+    self.assertTrue(t.succeeded)
+    self.assertEqual(t.result.exitCode, 3)
+    self.assertEqual(t.result.stdout, "hello\n")
+    self.assertEqual(t.result.stderr, "world\n")
+    self.assertEqual(t.result.error, None)
+
+    reactor.shutdown()
+
+  def testMoreProcessesThanSlots(self):
+    processCount = 20
+    reactor = cake.reactor.ProcessReactor(maxProcesses=3)
+
+    s = threading.Semaphore(0)
+    tasks = []
+    for i in xrange(processCount):
+      t = reactor.spawn("echo %i" % i, shell=True)
+      t.addCallback(s.release)
+      tasks.append(t)
+    for _ in xrange(processCount):
+      s.acquire()
+
+    for i, t in enumerate(tasks):
+      self.assertTrue(t.succeeded)
+      self.assertEqual(t.result.exitCode, 0)
+      self.assertEqual(t.result.stdout, "%i\n" % i)
+
+    reactor.shutdown()
+
+  def testLaunchFailure(self):
+    reactor = cake.reactor.ProcessReactor(maxProcesses=1)
+
+    e = threading.Event()
+    t = reactor.spawn(["/nonexistent/cake/executable"])
+    t.addCallback(e.set)
+
+    e.wait(5)
+
+    self.assertTrue(t.succeeded)
+    self.assertEqual(t.result.exitCode, None)
+    self.assertTrue(isinstance(t.result.error, EnvironmentError))
+
+    reactor.shutdown()
+
+  def testTerminateAll(self):
+    reactor = cake.reactor.ProcessReactor(maxProcesses=1)
+
+    s = threading.Semaphore(0)
+    running = reactor.spawn(["sleep", "30"])
+    queued = reactor.spawn(["sleep", "30"])
+    running.addCallback(s.release)
+    queued.addCallback(s.release)
+
+    # Wait for the first process to be launched.
+    while not reactor.runningCount:
+      threading.Event().wait(0.01)
+
+    self.assertEqual(reactor.terminateAll(), 2)
+    s.acquire()
+    s.acquire()
+
+    self.assertNotEqual(running.result.exitCode, 0)
+    self.assertTrue(queued.result.error is not None)
+
+    reactor.shutdown()
+
+  def testTerminateAllKillsChildren(self):
+    reactor = cake.reactor.ProcessReactor(maxProcesses=1)
+
+    # The shell's sleep holds the pipes open until it is killed too.
+    e = threading.Event()
+    t = reactor.spawn("sleep 30; echo done", shell=True)
+    t.addCallback(e.set)
+    while not reactor.runningCount:
+      threading.Event().wait(0.01)
+
+    reactor.terminateAll()
+    e.wait(5)
+    self.assertTrue(e.isSet())
+    self.assertEqual(t.result.stdout, "")
+
+    reactor.shutdown()
+    reactor.join(5)
+
+  def testShutdownAndJoin(self):
+    reactor = cake.reactor.ProcessReactor(maxProcesses=1)
+    reactor.shutdown()
+    reactor.join(5)
+    self.assertFalse(reactor._thread.isAlive())
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(ProcessReactorTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
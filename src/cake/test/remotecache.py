@@ -0,0 +1,235 @@
+"""Remote Object Cache Unit Tests.
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+import threading
+import BaseHTTPServer
+
+import cake.filesys
+import cake.hash
+import cake.objectcache
+import cake.remotecache
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """A stand-in for a remote cache server that stores files in a directory.
+  """
+
+  def _getPath(self):
+    self.server.requests.append((self.command, self.path))
+    return os.path.join(self.server.root, *self.path.lstrip("/").split("/"))
+
+  def do_GET(self):
+    path = self._getPath()
+    try:
+      data = cake.filesys.readFile(path)
+    except EnvironmentError:
+      self.send_response(404)
+      self.send_header("Content-Length", "0")
+      self.end_headers()
+      return
+    self.send_response(200)
+    if self.path.endswith("/truncated"):
+      # Close the connection before the whole body is sent.
+      self.send_header("Content-Length", str(len(data) + 10))
+    else:
+      self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_PUT(self):
+    path = self._getPath()
+    data = self.rfile.read(int(self.headers["Content-Length"]))
+    cake.filesys.writeFile(path, data)
+    self.send_response(201)
+    self.send_header("Content-Length", "0")
+    self.end_headers()
+
+  def log_message(self, format, *args):
+    pass
+
+class _Server(object):
+
+  def __init__(self, root):
+    self.httpd = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), _Handler)
+    self.httpd.root = root
+    self.httpd.requests = []
+    self.url = "http://127.0.0.1:%i/cache" % self.httpd.server_address[1]
+    self.thread = threading.Thread(target=self.httpd.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+
+  @property
+  def requests(self):
+    return self.httpd.requests
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+class StoreTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.remoteDir = os.path.join(self.tmpDir, "remote")
+    self.localPath = os.path.join(self.tmpDir, "local", "file")
+    cake.filesys.writeFile(os.path.join(self.tmpDir, "source"), "data")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+  def _testStore(self, store):
+    self.assertFalse(store.get("a/b/missing", self.localPath))
+    self.assertFalse(os.path.exists(self.localPath))
+    store.put(os.path.join(self.tmpDir, "source"), "a/b/file")
+    self.assertTrue(store.get("a/b/file", self.localPath))
+    self.assertEqual(cake.filesys.readFile(self.localPath), "data")
+
+  def testDirectory(self):
+    store = cake.remotecache.createStore(self.remoteDir)
+    self.assertTrue(isinstance(store, cake.remotecache.DirectoryStore))
+    self._testStore(store)
+    self.assertEqual(
+      cake.filesys.readFile(os.path.join(self.remoteDir, "a", "b", "file")),
+      "data",
+      )
+
+  def testHttp(self):
+    server = _Server(self.remoteDir)
+    try:
+      store = cake.remotecache.createStore(server.url)
+      self.assertTrue(isinstance(store, cake.remotecache.HttpStore))
+      self._testStore(store)
+      self.assertEqual(server.requests, [
+        ("GET", "/cache/a/b/missing"),
+        ("PUT", "/cache/a/b/file"),
+        ("GET", "/cache/a/b/file"),
+        ])
+    finally:
+      server.stop()
+    self.assertEqual(
+      cake.filesys.readFile(os.path.join(self.remoteDir, "cache", "a", "b", "file")),
+      "data",
+      )
+
+  def testHttpTruncated(self):
+    server = _Server(self.remoteDir)
+    try:
+      store = cake.remotecache.createStore(server.url)
+      store.put(os.path.join(self.tmpDir, "source"), "a/b/truncated")
+      self.assertRaises(
+        EnvironmentError,
+        store.get,
+        "a/b/truncated",
+        self.localPath,
+        )
+      self.assertFalse(os.path.exists(self.localPath))
+      self.assertEqual(os.listdir(os.path.dirname(self.localPath)), [])
+    finally:
+      server.stop()
+
+  def testHttpUnavailable(self):
+    server = _Server(self.remoteDir)
+    url = server.url
+    server.stop()
+    store = cake.remotecache.createStore(url)
+    self.assertRaises(EnvironmentError, store.get, "a/b/file", self.localPath)
+
+  def testInvalidUrl(self):
+    self.assertRaises(ValueError, cake.remotecache.createStore, "https://host/")
+    self.assertRaises(ValueError, cake.remotecache.createStore, "http:///path")
+
+class RemoteCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.server = _Server(os.path.join(self.tmpDir, "remote"))
+    self.store = cake.remotecache.createStore(self.server.url)
+
+  def tearDown(self):
+    self.server.stop()
+    shutil.rmtree(self.tmpDir)
+
+  def _createCache(self, name):
+    return cake.remotecache.RemoteCache(
+      os.path.join(self.tmpDir, name),
+      self.store,
+      )
+
+  def _addObject(self, cache, data):
+    objectDigest = cake.hash.sha1(data).digest()
+    objectName = cake.objectcache.getCacheName(objectDigest) + ".raw"
+    cake.filesys.writeFile(
+      os.path.join(cache.localPath, *objectName.split("/")),
+      data,
+      )
+    return objectName, ("args", [], [], objectDigest)
+
+  def testUploadAndFetch(self):
+    manifestName = cake.objectcache.getManifestName("\1" * 20)
+    first = self._createCache("first")
+    objectName, entry = self._addObject(first, "object")
+    first.upload([objectName], [manifestName], entry)
+    first.flush()
+    otherName, otherEntry = self._addObject(first, "other")
+    first.upload([otherName], [manifestName], otherEntry)
+    first.flush()
+
+    second = self._createCache("second")
+    self.assertEqual(second.getManifest(manifestName), [otherEntry, entry])
+    self.assertTrue(second.fetchObject(objectName))
+    self.assertEqual(
+      cake.filesys.readFile(os.path.join(second.localPath, *objectName.split("/"))),
+      "object",
+      )
+
+    # Objects already in the local cache aren't fetched again.
+    count = len(self.server.requests)
+    self.assertTrue(second.fetchObject(objectName))
+    self.assertEqual(len(self.server.requests), count)
+
+  def testMissing(self):
+    cache = self._createCache("local")
+    self.assertEqual(cache.getManifest("a/b/missing.manifest"), [])
+    self.assertFalse(cache.fetchObject("a/b/missing.raw"))
+
+  def testPrefetch(self):
+    manifestName = cake.objectcache.getManifestName("\1" * 20)
+    first = self._createCache("first")
+    objectName, entry = self._addObject(first, "object")
+    first.upload([objectName], [manifestName], entry)
+    first.flush()
+    del self.server.requests[:]
+
+    second = self._createCache("second")
+    second.prefetch(manifestName, ".raw")
+    second.prefetch(manifestName, ".raw")
+    self.assertEqual(second.getManifest(manifestName), [entry])
+    second.flush()
+    self.assertTrue(os.path.isfile(
+      os.path.join(second.localPath, *objectName.split("/"))
+      ))
+    self.assertEqual(len(self.server.requests), 2)
+
+    # The prefetched manifest is only used by the first lookup.
+    second.getManifest(manifestName)
+    self.assertEqual(len(self.server.requests), 3)
+
+  def testUnavailable(self):
+    self.server.stop()
+    cache = self._createCache("local")
+    objectName, entry = self._addObject(cache, "object")
+    cache.upload([objectName], ["a/b/c.manifest"], entry)
+    cache.flush()
+    self.assertEqual(cache.getManifest("a/b/c.manifest"), [])
+    self.server = _Server(os.path.join(self.tmpDir, "remote"))
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(StoreTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(RemoteCacheTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,114 @@
+"""Script Unit Tests.
+"""
+
+import unittest
+import sys
+
+import cake.engine
+import cake.logging
+import cake.script
+import cake.target
+import cake.task
+
+from cake.library.compilers import ModuleTarget, ObjectTarget
+from cake.script import Script
+from cake.target import FileTarget
+
+class NamedTargetTests(unittest.TestCase):
+
+  def setUp(self):
+    self.engine = cake.engine.Engine(cake.logging.Logger(), None, [])
+    self.script = Script("build.cake", None, None, self.engine, cake.task.Task())
+
+  def _paths(self, targets):
+    return [t.path for t in targets]
+
+  def testRegisterDoesNotCreateScriptTargets(self):
+    self.script.registerTarget(FileTarget("a.o"), ("objects", "a.o", "a.c"))
+    self.script.registerTarget(FileTarget("b.o"), ("objects", "b.o", "b.c"))
+    self.assertEqual(self.script._targets, {})
+
+    namedTargets = self.script.getNamedTargets()
+    self.assertEqual(
+      sorted(namedTargets.keys()),
+      ["a.c", "a.o", "b.c", "b.o", "objects"],
+      )
+    self.assertEqual(self._paths(namedTargets["objects"]), ["a.o", "b.o"])
+    self.assertEqual(self.script._targets, {})
+
+  def testLookupAfterRegister(self):
+    self.script.registerTarget(FileTarget("a.o"), ("objects", "a.o"))
+    self.script.registerTarget(FileTarget("b.o"), ("objects", "b.o"))
+
+    objects = self.script.getTarget("objects")
+    self.assertEqual(self._paths(objects.targets), ["a.o", "b.o"])
+    self.assertTrue(self.script.getTarget("objects") is objects)
+    self.assertEqual(self._paths(self.script.getTarget("b.o").targets), ["b.o"])
+
+    # Later registrations are added to the existing script target.
+    self.script.registerTarget(FileTarget("c.o"), ("objects", "c.o"))
+    self.assertEqual(self._paths(objects.targets), ["a.o", "b.o", "c.o"])
+    self.assertEqual(self._paths(self.script.getTarget("c.o").targets), ["c.o"])
+
+  def testLookupBeforeRegister(self):
+    objects = self.script.getTarget("objects")
+    self.script.registerTarget(FileTarget("a.o"), ("objects", "a.o"))
+    self.assertEqual(self._paths(objects.targets), ["a.o"])
+    self.assertEqual(sorted(self.script._targets.keys()), ["objects"])
+
+  def testNamedTargetsIncludeAddedTargets(self):
+    self.script.getTarget("libs").addTarget(FileTarget("a.a"))
+    self.script.registerTarget(FileTarget("b.a"), ("libs",))
+
+    namedTargets = self.script.getNamedTargets()
+    self.assertEqual(self._paths(namedTargets["libs"]), ["a.a", "b.a"])
+
+  def testRegisterWithIncludedScript(self):
+    child = Script("child.cake", None, None, self.engine, cake.task.Task(), parent=self.script)
+    child.registerTarget(FileTarget("a.o"), ("objects",))
+    self.assertEqual(self._paths(self.script.getTarget("objects").targets), ["a.o"])
+
+  def testRegisterNonTarget(self):
+    self.assertRaises(TypeError, self.script.registerTarget, "a.o", ("objects",))
+
+class CompactTargetTests(unittest.TestCase):
+
+  def testFileTarget(self):
+    target = cake.script._compactTarget(FileTarget("a.o", cake.task.Task()))
+    self.assertEqual(type(target), FileTarget)
+    self.assertEqual(target.path, "a.o")
+    self.assertEqual(target.task, None)
+
+  def testSubclassKeepsAttributes(self):
+    compiler = object()
+    task = cake.task.Task()
+
+    target = cake.script._compactTarget(ObjectTarget("a.o", task, compiler))
+    self.assertEqual(type(target), ObjectTarget)
+    self.assertEqual(target.path, "a.o")
+    self.assertEqual(target.task, None)
+    self.assertTrue(target.compiler is compiler)
+    self.assertEqual(target.object.path, "a.o")
+    self.assertEqual(target.object.task, None)
+
+    original = ModuleTarget("a.so", task, compiler, "a.lib", None)
+    target = cake.script._compactTarget(original)
+    self.assertEqual(type(target), ModuleTarget)
+    self.assertEqual(target.task, None)
+    self.assertTrue(target.compiler is compiler)
+    self.assertEqual(target.library.path, "a.lib")
+    self.assertEqual(target.library.task, None)
+    self.assertEqual(target.manifest, None)
+    self.assertTrue(original.task is task)
+    self.assertTrue(original.library.task is task)
+
+  def testOtherTarget(self):
+    target = cake.target.Target(cake.task.Task())
+    self.assertTrue(cake.script._compactTarget(target) is target)
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(NamedTargetTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(CompactTargetTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
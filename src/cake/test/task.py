@@ -459,6 +459,42 @@ class TaskTests(unittest.TestCase):
     self.assertTrue(ta.succeeded)
     self.assertEqual(ta.result, "b")
 
+  def testReleaseCompleted(self):
+    def b():
+      return "b"
+
+    def a():
+      tb = cake.task.Task(b)
+      tb.start()
+      return tb
+
+    def c():
+      raise RuntimeError()
+
+    old = cake.task.setReleaseCompleted(True)
+    try:
+      s = threading.Semaphore(0)
+      ta = cake.task.Task(a)
+      ta.addCallback(s.release)
+      tc = cake.task.Task(c)
+      tc.addCallback(s.release)
+      ta.start()
+      tc.start()
+
+      s.acquire()
+      s.acquire()
+    finally:
+      cake.task.setReleaseCompleted(old)
+
+    self.assertTrue(ta.succeeded)
+    self.assertEqual(ta.result, "b")
+    # The chain of result tasks has been collapsed.
+    self.assertEqual(ta._result, "b")
+
+    self.assertTrue(tc.failed)
+    self.assertEqual(tc._exception, None)
+    self.assertEqual(tc._trace, None)
+
 if __name__ == "__main__":
   suite = unittest.TestLoader().loadTestsFromTestCase(TaskTests)
   runner = unittest.TextTestRunner(verbosity=2)
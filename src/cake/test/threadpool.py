@@ -38,6 +38,20 @@ class ThreadPoolTests(unittest.TestCase):
     
     self.assertEqual(len(result), 50)
 
+  def testShutdownAfterJobs(self):
+    # Shutting down just after a job has run mustn't leave a worker
+    # waiting for jobs that will never come.
+    for _ in xrange(50):
+      threadPool = cake.threadpool.ThreadPool(numWorkers=2)
+      e = threading.Event()
+      threadPool.queueJob(e.set)
+      e.wait()
+      shutdown = threading.Thread(target=threadPool._shutdown)
+      shutdown.daemon = True
+      shutdown.start()
+      shutdown.join(5)
+      self.assertFalse(shutdown.isAlive())
+
 if __name__ == "__main__":
   suite = unittest.TestLoader().loadTestsFromTestCase(ThreadPoolTests)
   runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,217 @@
+"""Tool Unit Tests.
+"""
+
+import unittest
+import sys
+
+import cake.engine
+import cake.logging
+
+from cake.library import Tool, memoise
+from cake.library.env import EnvironmentTool
+from cake.library.compilers.dummy import DummyCompiler
+
+class _NestedTool(Tool):
+
+  def __init__(self, configuration):
+    Tool.__init__(self, configuration)
+    self.env = EnvironmentTool(configuration)
+
+class _PrivateListTool(Tool):
+
+  def __init__(self, configuration):
+    Tool.__init__(self, configuration)
+    self._items = []
+
+  def addItem(self, item):
+    self._mutable("_items").append(item)
+
+class _MemoiseTool(Tool):
+
+  def __init__(self, configuration):
+    Tool.__init__(self, configuration)
+    self.calls = []
+    self.flags = []
+    self.name = "a"
+    self.other = 1
+
+  def addFlag(self, flag):
+    self.flags.append(flag)
+    self._clearCache("flags")
+
+  @memoise
+  def _getName(self):
+    self.calls.append("name")
+    return self.name
+
+  @memoise
+  def _getArgs(self, prefix):
+    self.calls.append("args")
+    return [prefix + self._getName()] + self.flags
+
+class _DerivedMemoiseTool(_MemoiseTool):
+
+  @memoise
+  def _getArgs(self, prefix):
+    return _MemoiseTool._getArgs(self, prefix) + ["derived"]
+
+class CloneTests(unittest.TestCase):
+
+  def setUp(self):
+    engine = cake.engine.Engine(cake.logging.Logger(), None, [])
+    self.configuration = cake.engine.Configuration("config.cake", engine)
+
+  def testCloneSharesPrivateUntilModified(self):
+    tool = _PrivateListTool(self.configuration)
+    tool.addItem("a")
+
+    clone = tool.clone()
+    self.assertTrue(clone._items is tool._items)
+
+    clone.addItem("b")
+    self.assertEqual(tool._items, ["a"])
+    self.assertEqual(clone._items, ["a", "b"])
+
+  def testModifyCloneList(self):
+    compiler = DummyCompiler(self.configuration)
+    compiler.addDefine("A")
+
+    # Public attributes may be modified directly by build scripts.
+    clone = compiler.clone()
+    clone.defines.append("B")
+    sibling = compiler.clone()
+
+    self.assertEqual(compiler.defines, ["A"])
+    self.assertEqual(clone.defines, ["A", "B"])
+    self.assertEqual(sibling.defines, ["A"])
+
+  def testModifyUserToolList(self):
+    tool = _MemoiseTool(self.configuration)
+    clone = tool.clone()
+    clone.flags.append("-x")
+    self.assertEqual(tool.flags, [])
+
+  def testOriginalModifiedAfterClone(self):
+    compiler = DummyCompiler(self.configuration)
+    compiler.addLibrary("a")
+
+    clone = compiler.clone()
+    compiler.addLibrary("b")
+    compiler.addLibrary("c")
+
+    self.assertEqual(compiler.libraries, ["a", "b", "c"])
+    self.assertEqual(clone.libraries, ["a"])
+
+  def testCloneOfClone(self):
+    compiler = DummyCompiler(self.configuration)
+    first = compiler.clone()
+    second = first.clone()
+
+    first.addDefine("FIRST")
+    second.addDefine("SECOND")
+
+    self.assertEqual(compiler.defines, [])
+    self.assertEqual(first.defines, ["FIRST"])
+    self.assertEqual(second.defines, ["SECOND"])
+
+  def testSetAttribute(self):
+    compiler = DummyCompiler(self.configuration)
+    clone = compiler.clone()
+
+    clone.includePaths = ["x"]
+    clone.addIncludePath("y")
+
+    self.assertEqual(compiler.includePaths, [])
+    self.assertEqual(clone.includePaths, ["x", "y"])
+
+  def testEnvironment(self):
+    env = EnvironmentTool(self.configuration)
+    env["A"] = "a"
+
+    clone = env.clone()
+    clone["B"] = "b"
+    clone.append(A="b")
+    env.update(C="c")
+
+    self.assertEqual(env.vars, {"A": "a", "C": "c"})
+    self.assertEqual(clone.vars, {"A": "ab", "B": "b"})
+
+  def testNestedToolsCloned(self):
+    tool = _NestedTool(self.configuration)
+    clone = tool.clone()
+
+    self.assertFalse(clone.env is tool.env)
+    clone.env["A"] = "a"
+    self.assertFalse("A" in tool.env)
+
+class MemoiseTests(unittest.TestCase):
+
+  def setUp(self):
+    engine = cake.engine.Engine(cake.logging.Logger(), None, [])
+    self.configuration = cake.engine.Configuration("config.cake", engine)
+
+  def testUnrelatedAttributeKeepsResult(self):
+    tool = _MemoiseTool(self.configuration)
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+    self.assertEqual(tool.calls, ["args", "name"])
+
+    tool.other = 2
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+    self.assertEqual(tool.calls, ["args", "name"])
+
+  def testReadAttributeInvalidatesResult(self):
+    tool = _MemoiseTool(self.configuration)
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+
+    # Changes to attributes read by nested memoised calls also invalidate.
+    tool.name = "b"
+    self.assertEqual(tool._getArgs("-"), ["-b"])
+    self.assertEqual(tool.calls, ["args", "name", "args", "name"])
+
+    tool.addFlag("x")
+    self.assertEqual(tool._getArgs("-"), ["-b", "x"])
+    self.assertEqual(tool.calls, ["args", "name", "args", "name", "args"])
+
+  def testArgumentsAreKeys(self):
+    tool = _MemoiseTool(self.configuration)
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+    self.assertEqual(tool._getArgs(prefix="/"), ["/a"])
+    self.assertEqual(tool._getArgs(prefix="/"), ["/a"])
+    self.assertEqual(tool.calls, ["args", "name", "args"])
+
+  def testCloneInheritsResults(self):
+    tool = _MemoiseTool(self.configuration)
+    tool._getArgs("-")
+
+    clone = tool.clone()
+    clone.other = 2
+    self.assertEqual(clone._getArgs("-"), ["-a"])
+    self.assertEqual(tool.calls, ["args", "name"])
+
+    clone.name = "b"
+    self.assertEqual(clone._getArgs("-"), ["-b"])
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+
+  def testCloneResultsNotShared(self):
+    tool = _MemoiseTool(self.configuration)
+    clone = tool.clone()
+
+    # Build scripts may modify public lists in place.
+    clone.flags.append("FROM_CLONE")
+    self.assertEqual(clone._getArgs("-"), ["-a", "FROM_CLONE"])
+    self.assertEqual(tool._getArgs("-"), ["-a"])
+
+  def testBaseClassMethod(self):
+    tool = _DerivedMemoiseTool(self.configuration)
+    self.assertEqual(tool._getArgs("-"), ["-a", "derived"])
+
+    tool.name = "b"
+    self.assertEqual(tool._getArgs("-"), ["-b", "derived"])
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(CloneTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(MemoiseTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,81 @@
+"""Unity Build Unit Tests.
+"""
+
+import unittest
+import sys
+import os
+
+import cake.unity
+
+class GroupSourcesTests(unittest.TestCase):
+
+  def setUp(self):
+    self.paths = ["src/file%i.cpp" % i for i in xrange(100)]
+
+  def testAllSourcesGrouped(self):
+    groups = cake.unity.groupSources(self.paths, maximumSources=8)
+    self.assertEqual(
+      [p for group in groups for p in group],
+      sorted(self.paths),
+      )
+    self.assertTrue(max(len(group) for group in groups) <= 8)
+    self.assertTrue(len(groups) > 100 // 8)
+
+  def testOrderDoesntMatter(self):
+    self.assertEqual(
+      cake.unity.groupSources(self.paths, maximumSources=8),
+      cake.unity.groupSources(list(reversed(self.paths)), maximumSources=8),
+      )
+
+  def testAddedSourceOnlyChangesItsGroup(self):
+    groups = cake.unity.groupSources(self.paths, maximumSources=8)
+    newGroups = cake.unity.groupSources(
+      self.paths + ["src/file50a.cpp"],
+      maximumSources=8,
+      )
+    changed = [g for g in newGroups if g not in groups]
+    self.assertTrue(1 <= len(changed) <= 3)
+    self.assertTrue(any("src/file50a.cpp" in g for g in changed))
+
+  def testMaximumBytes(self):
+    sizes = dict((p, 100) for p in self.paths)
+    sizes["src/file5.cpp"] = 1000
+    groups = cake.unity.groupSources(
+      self.paths,
+      maximumBytes=300,
+      sizes=sizes,
+      )
+    self.assertTrue(["src/file5.cpp"] in groups)
+    for group in groups:
+      if group != ["src/file5.cpp"]:
+        self.assertTrue(sum(sizes[p] for p in group) <= 300)
+
+  def testEditedSourceOnlyChangesItsGroup(self):
+    sizes = dict((p, 100) for p in self.paths)
+    groups = cake.unity.groupSources(self.paths, 8, 500, sizes)
+    sizes["src/file50.cpp"] = 350
+    newGroups = cake.unity.groupSources(self.paths, 8, 500, sizes)
+    changed = [g for g in newGroups if g not in groups]
+    self.assertTrue(len(changed) < len(groups) // 2)
+
+class GetUnitySourceTests(unittest.TestCase):
+
+  def testRelativeIncludes(self):
+    root = os.path.abspath(os.sep)
+    self.assertEqual(
+      cake.unity.getUnitySource(
+        os.path.join(root, "build", "obj", "a.unity.cpp"),
+        [
+          os.path.join(root, "src", "a.cpp"),
+          os.path.join(root, "build", "obj", "b.cpp"),
+          ],
+        ),
+      '#include "../../src/a.cpp"\n#include "b.cpp"\n',
+      )
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(GroupSourcesTests))
+  suite.addTests(unittest.TestLoader().loadTestsFromTestCase(GetUnitySourceTests))
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
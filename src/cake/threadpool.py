@@ -79,12 +79,11 @@ class ThreadPool(object):
     On shutdown we complete any currently executing jobs then exit. Jobs
     waiting on the queue may not be executed.
     """
-    # Signal that we've finished.
-    self._finished = True
-    
-    # Clear the queue and wake any waiting threads.
+    # Signal that we've finished, clear the queue and wake any waiting
+    # threads.
     self._wakeCondition.acquire()
     try:
+      self._finished = True
       self._jobQueue.clear()
       self._wakeCondition.notifyAll()
     finally:      
@@ -136,7 +135,10 @@ class ThreadPool(object):
         try:
           job = self._jobQueue.popleft()
         except IndexError:
-          self._wakeCondition.wait() # No more jobs. Sleep until another is pushed.
+          # Check again under the lock, otherwise a shutdown that happened
+          # since the loop's check would never wake us.
+          if not self._finished:
+            self._wakeCondition.wait() # No more jobs. Sleep until another is pushed.
           continue
       finally:
         self._wakeCondition.release()
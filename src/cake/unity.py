@@ -0,0 +1,95 @@
+"""Unity Builds.
+
+A unity (or jumbo) build compiles several sources as one translation
+unit by compiling a generated source that includes each of them. It
+makes full builds much faster because headers shared by the sources are
+only parsed once. See L{cake.library.compilers.Compiler.unityBuild}.
+
+Sources are grouped so that adding, removing or editing a source only
+changes the group it belongs to. A group ends at a source whose path
+hashes to a boundary, so group boundaries depend only on the paths near
+them, and a group is also split where it would exceed its maximum number
+of sources or bytes.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os.path
+
+import cake.hash
+import cake.path
+
+defaultAverageSources = 8
+"""The average number of sources in a group when only a maximum number
+of bytes is given.
+@type: int
+"""
+
+def _isBoundary(path, averageSources):
+  digest = cake.hash.sha1(os.path.normcase(path)).hexdigest()
+  return int(digest[:8], 16) % averageSources == 0
+
+def groupSources(paths, maximumSources=None, maximumBytes=None, sizes={}):
+  """Group sources into unity translation units.
+
+  @param paths: The paths of the sources.
+  @type paths: list of string
+  @param maximumSources: The maximum number of sources in a group or
+  None for no maximum.
+  @type maximumSources: int or None
+  @param maximumBytes: The maximum total size of the sources in a group
+  or None for no maximum. A source larger than this is put in a group on
+  its own.
+  @type maximumBytes: int or None
+  @param sizes: The sizes of the sources in bytes keyed by path. Sources
+  that aren't in it count as empty.
+  @type sizes: dict of string to int
+
+  @return: The groups of sources, sorted by path.
+  @rtype: list of list of string
+  """
+  if maximumSources is not None:
+    # Boundaries split groups in half on average so most groups end at a
+    # boundary rather than at the maximum.
+    averageSources = max(2, maximumSources // 2)
+  else:
+    averageSources = defaultAverageSources
+
+  groups = []
+  group = []
+  groupBytes = 0
+  for path in sorted(paths, key=os.path.normcase):
+    size = sizes.get(path, 0)
+    if group and (
+      _isBoundary(path, averageSources) or
+      (maximumSources is not None and len(group) >= maximumSources) or
+      (maximumBytes is not None and groupBytes + size > maximumBytes)
+      ):
+      groups.append(group)
+      group = []
+      groupBytes = 0
+    group.append(path)
+    groupBytes += size
+  if group:
+    groups.append(group)
+  return groups
+
+def getUnitySource(path, sources):
+  """Return the text of a unity source that includes other sources.
+
+  @param path: The absolute path of the unity source.
+  @type path: string
+  @param sources: The absolute paths of the sources it includes.
+  @type sources: list of string
+
+  @rtype: string
+  """
+  unityDir = os.path.dirname(path)
+  lines = []
+  for source in sources:
+    # Relative paths keep the text the same in workspaces at other paths.
+    include = cake.path.relativePath(source, unityDir)
+    lines.append('#include "%s"\n' % include.replace(os.path.sep, "/"))
+  return "".join(lines)
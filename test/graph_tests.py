@@ -0,0 +1,52 @@
+from cake.test.framework import caketest
+
+@caketest(fixture="graphcache")
+def testGraphCacheReplaysUnchangedScripts(t):
+  output = t.runCake("build.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Executed build.cake",
+    "Executed a.cake",
+    "Executed b.cake",
+    ])
+
+  t.runCake("build.cake").checkBuildWasNoop()
+
+@caketest(fixture="graphcache")
+def testGraphCacheExecutesScriptsWhenSourceChanged(t):
+  t.runCake("build.cake").checkSucceeded()
+
+  t.writeTextFile("a.txt", "goodbye")
+
+  output = t.runCake("build.cake")
+  output.checkSucceeded()
+  output.checkNoLine("Executed build.cake")
+  output.checkHasLines([
+    "Executed a.cake",
+    "Executed b.cake",
+    ])
+
+  if t.readFileContents("b.out") != "GOODBYE!":
+    t.reporter.error("b.out was not rebuilt")
+
+@caketest(fixture="graphcache")
+def testGraphCacheExecutesScriptsWhenScriptChanged(t):
+  t.runCake("build.cake").checkSucceeded()
+
+  t.writeTextFile("b.cake", t.readFileContents("b.cake") + "\n# Changed\n")
+
+  output = t.runCake("build.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Executed build.cake",
+    "Executed a.cake",
+    "Executed b.cake",
+    ])
+
+@caketest(fixture="graphcache")
+def testGraphCacheAlwaysExecutesCopies(t):
+  t.runCake("copy.cake").checkSucceeded()
+
+  output = t.runCake("copy.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Executed copy.cake")
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int alpha(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int bravo(void)
+{
+  return OFFSET;
+}
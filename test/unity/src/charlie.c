@@ -0,0 +1,6 @@
+#include "common.h"
+
+int charlie(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1 @@
+#define OFFSET 1
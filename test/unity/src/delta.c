@@ -0,0 +1,6 @@
+#include "common.h"
+
+int delta(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int echo(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int foxtrot(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int golf(void)
+{
+  return OFFSET;
+}
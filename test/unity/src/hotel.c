@@ -0,0 +1,6 @@
+#include "common.h"
+
+int hotel(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int india(void)
+{
+  return OFFSET;
+}
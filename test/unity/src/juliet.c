@@ -0,0 +1,6 @@
+#include "common.h"
+
+int juliet(void)
+{
+  return OFFSET;
+}
@@ -0,0 +1,111 @@
+import os
+import time
+from cake.test.framework import caketest
+
+def _compiled(output):
+  return sorted(l for l in output.lines if l.startswith("Compiling "))
+
+def _checkCompiled(t, output, expected):
+  output.checkSucceeded()
+  compiled = _compiled(output)
+  if compiled != sorted(expected):
+    t.reporter.error(
+      "Expected %r to be compiled but compiled %r.\nOutput:\n%s" % (
+        sorted(expected),
+        compiled,
+        output.output))
+
+def _checkUnitySources(t, targetDir, expected):
+  """Check the generated unity sources and which sources they include.
+  """
+  unityNames = sorted(
+    n for n in os.listdir(t.abspath(targetDir)) if n.endswith(".unity.c")
+    )
+  unitySources = sorted("%s.unity.c" % group[0] for group in expected)
+  if unityNames != unitySources:
+    t.reporter.error("Expected unity sources %r but found %r" % (
+      unitySources, unityNames))
+    return
+
+  for group in expected:
+    path = os.path.join(targetDir, "%s.unity.c" % group[0])
+    includes = ['#include "../src/%s.c"\n' % s for s in group]
+    if t.readFileContents(path) != "".join(includes):
+      t.reporter.error("Unity source '%s' should include %r" % (path, group))
+
+def _ageSources(t):
+  # Sources edited within the last hour are compiled separately by
+  # isolate.cake, so make the fixture's sources look old.
+  old = time.time() - 7200
+  for name in os.listdir(t.abspath("src")):
+    os.utime(t.abspath(os.path.join("src", name)), (old, old))
+
+_groups = [
+  ["alpha", "bravo"],
+  ["charlie", "delta"],
+  ["echo", "foxtrot", "golf"],
+  ["hotel", "india"],
+  ]
+
+@caketest(fixture="unity")
+def testUnityBuildGroupsSources(t):
+  _checkCompiled(t, t.runCake("build.cake"), [
+    "Compiling obj/alpha.unity.c",
+    "Compiling obj/charlie.unity.c",
+    "Compiling obj/echo.unity.c",
+    "Compiling obj/hotel.unity.c",
+    "Compiling src/juliet.c",
+    ])
+  _checkUnitySources(t, "obj", _groups)
+
+  t.runCake("build.cake").checkBuildWasNoop()
+
+@caketest(fixture="unity")
+def testUnityBuildRebuildsChangedGroup(t):
+  t.runCake("build.cake").checkSucceeded()
+
+  t.writeTextFile("src/golf.c", "int golf(void)\n{\n  return 2;\n}\n")
+
+  _checkCompiled(t, t.runCake("build.cake"), [
+    "Compiling obj/echo.unity.c",
+    ])
+  t.runCake("build.cake").checkBuildWasNoop()
+
+@caketest(fixture="unity")
+def testUnityBuildRebuildsWhenHeaderChanges(t):
+  t.runCake("build.cake").checkSucceeded()
+
+  t.writeTextFile("src/common.h", "#define OFFSET 2\n")
+
+  _checkCompiled(t, t.runCake("build.cake"), [
+    "Compiling obj/alpha.unity.c",
+    "Compiling obj/charlie.unity.c",
+    "Compiling obj/echo.unity.c",
+    "Compiling obj/hotel.unity.c",
+    "Compiling src/juliet.c",
+    ])
+
+@caketest(fixture="unity")
+def testUnityBuildIsolatesRecentSources(t):
+  _ageSources(t)
+  _checkCompiled(t, t.runCake("isolate.cake"), [
+    "Compiling isolated/alpha.unity.c",
+    "Compiling isolated/charlie.unity.c",
+    "Compiling isolated/echo.unity.c",
+    "Compiling isolated/hotel.unity.c",
+    "Compiling src/juliet.c",
+    ])
+
+  t.writeTextFile("src/foxtrot.c", "int foxtrot(void)\n{\n  return 2;\n}\n")
+
+  # Only the edited source and what is left of its group are compiled.
+  _checkCompiled(t, t.runCake("isolate.cake"), [
+    "Compiling isolated/echo.unity.c",
+    "Compiling src/foxtrot.c",
+    ])
+  _checkUnitySources(t, "isolated", [
+    ["alpha", "bravo"],
+    ["charlie", "delta"],
+    ["echo", "golf"],
+    ["hotel", "india"],
+    ])